@@ -0,0 +1 @@
+"""Benchmarks of recipe generation; see bench.py."""
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Generator benchmarks over synthetic recipe trees.
+
+For each scenario a recipe tree is generated (see ``synthetic.py``) and
+every leaf and diamond recipe is built, ``--repeat`` times:
+
+- ``load``, ``resolve`` and ``validate``: reading the YAML, merging the
+  inherited recipes and validating them, self times from the
+  ``PhaseProfiler``;
+- ``render.<Builder>`` and ``build.<Builder>``: the template render and
+  the whole ``build()`` of each builder;
+- ``lockfile``: generating and writing the lockfile;
+- ``validator``: the ``DotfilesValidator`` over the tree.
+
+The fastest of the repeats is compared with ``benchmarks/baseline.json``.
+A metric regresses when it is slower than its baseline by more than
+``--tolerance`` percent and ``--min-ms`` milliseconds; ``--check`` then
+exits with status 1. ``--save`` records the run as the new baseline.
+
+Run from the repository root: ``python3 -m benchmarks.bench``.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
+from start_vm import (  # noqa: E402
+    DockerFileBuilder,
+    DotfilesValidator,
+    PhaseProfiler,
+    PowerShellBuilder,
+    PythonBuilder,
+    ShellBuilder,
+)
+
+from benchmarks.synthetic import SCENARIOS, generate_tree  # noqa: E402
+
+REPO = pathlib.Path(__file__).parent.parent
+BASELINE = pathlib.Path(__file__).parent / "baseline.json"
+BUILDERS = [ShellBuilder, DockerFileBuilder, PowerShellBuilder, PythonBuilder]
+
+# Profiler phases reported as metrics of their own
+PHASES = {"load": "load", "inherit": "resolve", "validate": "validate", "lockfile": "lockfile"}
+
+
+def options() -> argparse.Namespace:
+    """Generator options of a plain run: write files, no formatting or running."""
+    return argparse.Namespace(
+        run=False,
+        dry_run=False,
+        strip=False,
+        executable=True,
+        format=False,
+        conditional=False,
+        debug=False,
+    )
+
+
+@contextlib.contextmanager
+def workspace():
+    """Temporary tree to generate into, with the repository's templates."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="start-vm-bench-") as tmp:
+        root = pathlib.Path(tmp)
+        (root / "templates").symlink_to(REPO / "templates")
+        os.chdir(root)
+        try:
+            yield root
+        finally:
+            os.chdir(cwd)
+
+
+def run_once(root: pathlib.Path, recipes: List[pathlib.Path]) -> Dict[str, float]:
+    """Milliseconds per metric for building every recipe once."""
+    profiler = PhaseProfiler()
+    metrics: Dict[str, float] = {}
+
+    def add(name: str, seconds: float):
+        metrics[name] = metrics.get(name, 0.0) + seconds * 1000
+
+    for recipe in recipes:
+        # Loading and resolving are timed once per recipe, with the first builder
+        loader = profiler
+        for cls in BUILDERS:
+            builder = cls(str(recipe), options(), loader)
+            builder.setup = root / "setup"
+            builder.profiler = profiler
+            loader = None
+            started = time.perf_counter()
+            builder.build()
+            add(f"build.{cls.__name__}", time.perf_counter() - started)
+            if cls is ShellBuilder:
+                builder.write_lockfile()
+
+    for event in profiler.events:
+        if event["phase"] == "render":
+            add(f"render.{event['builder']}", event["self_wall"])
+        elif event["phase"] in PHASES:
+            add(PHASES[event["phase"]], event["self_wall"])
+
+    started = time.perf_counter()
+    DotfilesValidator(root).run()
+    add("validator", time.perf_counter() - started)
+    return metrics
+
+
+def run_scenario(params: Dict[str, int], repeat: int) -> Dict[str, float]:
+    """Fastest milliseconds per metric over ``repeat`` runs of a scenario.
+
+    The minimum is the least disturbed by other load on the machine.
+    """
+    runs = []
+    with workspace() as root:
+        recipes = generate_tree(root, **params)
+        run_once(root, recipes)  # warm-up: imports, file cache
+        for _ in range(repeat):
+            runs.append(run_once(root, recipes))
+    return {
+        name: round(min(run[name] for run in runs), 3)
+        for name in sorted(runs[0])
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float = 30.0,
+    min_ms: float = 2.0,
+) -> List[Dict[str, Any]]:
+    """One row per metric with its baseline, change and whether it regressed."""
+    rows = []
+    for scenario, metrics in results.items():
+        for name, ms in metrics.items():
+            base = baseline.get(scenario, {}).get(name)
+            change = (ms - base) / base * 100 if base else None
+            rows.append({
+                "scenario": scenario,
+                "metric": name,
+                "ms": ms,
+                "baseline": base,
+                "change": change,
+                "regressed": base is not None
+                and ms > base * (1 + tolerance / 100)
+                and ms - base > min_ms,
+            })
+    return rows
+
+
+def report(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'scenario':<8} {'metric':<26} {'ms':>10} {'baseline':>10} {'change':>8}"]
+    for row in rows:
+        base = f"{row['baseline']:>10.1f}" if row["baseline"] is not None else f"{'-':>10}"
+        change = f"{row['change']:>+7.0f}%" if row["change"] is not None else f"{'new':>8}"
+        flag = "  REGRESSION" if row["regressed"] else ""
+        lines.append(f"{row['scenario']:<8} {row['metric']:<26} {row['ms']:>10.1f} {base} {change}{flag}")
+    return "\n".join(lines)
+
+
+def commandline(argv: List[str] = None) -> int:
+    """Command line interface; returns the exit status."""
+    parser = argparse.ArgumentParser(description="Benchmark recipe generation")
+    option = parser.add_argument
+
+    # fmt: off
+    option("--baseline", type=pathlib.Path, default=BASELINE, metavar="FILE", help="baseline results (default: benchmarks/baseline.json)")
+    option("--check", action="store_true", help="exit with status 1 on a regression")
+    option("--min-ms", type=float, default=2.0, metavar="MS", help="ignore slowdowns under MS milliseconds (default: 2)")
+    option("--output", type=pathlib.Path, metavar="FILE", help="also write the results as JSON")
+    option("--repeat", type=int, default=5, metavar="N", help="timed runs per scenario; the fastest is reported (default: 5)")
+    option("--save", action="store_true", help="write the results as the new baseline")
+    option("--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run (repeatable; default: all)")
+    option("--tolerance", type=float, default=30.0, metavar="PCT", help="allowed slowdown in percent (default: 30)")
+    # fmt: on
+
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        results[name] = run_scenario(SCENARIOS[name], args.repeat)
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())["results"]
+    rows = compare(results, baseline, args.tolerance, args.min_ms)
+    print(report(rows))
+
+    document = {
+        "generated_at": datetime.now().isoformat(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "scenarios": {name: SCENARIOS[name] for name in results},
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2))
+    if args.save:
+        # Keep the baseline of scenarios that were not run
+        document["results"] = {**baseline, **results}
+        document["scenarios"] = {name: SCENARIOS[name] for name in document["results"]}
+        args.baseline.write_text(json.dumps(document, indent=2) + "\n")
+        print(f"wrote {args.baseline}")
+
+    regressed = [row for row in rows if row["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} metric(s) slower than the baseline by more than "
+              f"{args.tolerance:.0f}% and {args.min_ms:.0f} ms")
+    return 1 if regressed and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(commandline())
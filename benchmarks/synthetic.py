@@ -0,0 +1,120 @@
+"""Synthetic recipe trees for the generator benchmarks.
+
+A tree is ``depth`` levels of inheritance below a single ``base`` recipe,
+each recipe inheriting from one parent and having ``fanout`` children.
+``diamonds`` extra recipes each inherit from two leaves in different
+branches, so their common ancestors are resolved twice. Every recipe
+adds ``sections`` sections of ``packages`` packages each, cycling through
+the linux section types; the tree also gets the config/ and default/
+directories the dotfiles validator scans.
+"""
+
+import pathlib
+from typing import Dict, List
+
+import yaml
+
+SECTION_TYPES = [
+    "debian_packages",
+    "python_packages",
+    "rust_packages",
+    "ruby_packages",
+    "shell",
+]
+
+# Parameters of the scenarios the benchmark runs by default
+SCENARIOS = {
+    "small": {"sections": 4, "packages": 5, "depth": 1, "fanout": 2, "diamonds": 0},
+    "wide": {"sections": 40, "packages": 40, "depth": 1, "fanout": 2, "diamonds": 0},
+    "deep": {"sections": 4, "packages": 8, "depth": 4, "fanout": 2, "diamonds": 4},
+}
+
+
+def package_names(recipe: str, index: int, section_type: str, count: int) -> List[str]:
+    """Package names for a section; every third python package is pinned."""
+    names = [f"{recipe}-s{index}-pkg{n}" for n in range(count)]
+    if section_type == "python_packages":
+        names = [f"{name}==1.{n}.0" if n % 3 == 0 else name for n, name in enumerate(names)]
+    return names
+
+
+def recipe_sections(recipe: str, sections: int, count: int) -> List[Dict]:
+    """``sections`` sections for ``recipe``, with ``count`` packages each."""
+    result = []
+    for index in range(sections):
+        section_type = SECTION_TYPES[index % len(SECTION_TYPES)]
+        install = package_names(recipe, index, section_type, count)
+        section = {"name": f"{recipe}-s{index}", "type": section_type}
+        if section_type == "shell":
+            section["install"] = "\n".join(f"echo {name}" for name in install) + "\n"
+        else:
+            section["install"] = install
+        result.append(section)
+    return result
+
+
+def generate_tree(
+    root: pathlib.Path,
+    sections: int = 4,
+    packages: int = 5,
+    depth: int = 1,
+    fanout: int = 2,
+    diamonds: int = 0,
+) -> List[pathlib.Path]:
+    """Write a synthetic recipe tree under ``root``; returns the recipes to build.
+
+    Those are the leaves of the tree followed by the diamond recipes.
+    """
+    recipes_dir = root / "recipes"
+    recipes_dir.mkdir(parents=True, exist_ok=True)
+    recipes: Dict[str, Dict] = {
+        "base": {
+            "name": "base",
+            "platform": "linux",
+            "os": "ubuntu",
+            "version": "22.04",
+            "release": "jammy",
+            "config": "synthetic",
+            "sections": recipe_sections("base", sections, packages),
+        }
+    }
+
+    level = ["base"]
+    for number in range(1, depth + 1):
+        children = []
+        for parent in level:
+            for _ in range(fanout):
+                name = f"l{number}-{len(children)}"
+                recipes[name] = {
+                    "name": name,
+                    "inherits": parent,
+                    "sections": recipe_sections(name, sections, packages),
+                }
+                children.append(name)
+        level = children
+
+    leaves = list(level)
+    for index in range(diamonds if len(leaves) > 1 else 0):
+        # Pair leaves from opposite halves, so the parents share only the base
+        left = leaves[index % len(leaves)]
+        right = leaves[(index + len(leaves) // 2) % len(leaves)]
+        name = f"diamond-{index}"
+        recipes[name] = {
+            "name": name,
+            "inherits": [left, right],
+            "sections": recipe_sections(name, sections, packages),
+        }
+        level.append(name)
+
+    for name, recipe in recipes.items():
+        (recipes_dir / f"{name}.yml").write_text(yaml.dump(recipe, sort_keys=False))
+
+    config_dir = root / "config" / "synthetic"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    (config_dir / "settings.conf").write_text("synthetic = true\n")
+    default_dir = root / "default"
+    default_dir.mkdir(parents=True, exist_ok=True)
+    for name in (".bashrc", ".vimrc", ".gitconfig"):
+        (default_dir / name).write_text(f"# synthetic {name}\n")
+
+    return [recipes_dir / f"{name}.yml" for name in level]
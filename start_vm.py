@@ -3,17 +3,27 @@
 
 import abc
 import argparse
+import contextlib
+import glob
+import gzip
+import hashlib
 import json
 import logging
 import os
 import pathlib
 import re
+import shutil
+import sqlite3
 import stat
 import subprocess
 import sys
+import tarfile
+import time
+import urllib.request
+import zipfile
 from collections import defaultdict
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import jinja2
 import yaml
@@ -480,6 +490,370 @@ class DotfilesValidator:
         return self.generate_report(verbose=verbose)
 
 
+class PhaseProfiler:
+    """Wall and CPU time of each generation phase, per recipe and builder.
+
+    Phases nest, so totals add up each event's self time, excluding the phases inside it.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self.stack: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def cpu_time() -> float:
+        times = os.times()
+        return time.process_time() + times.children_user + times.children_system
+
+    @contextlib.contextmanager
+    def phase(self, name: str, recipe: str, builder: str):
+        """Time the enclosed block as phase ``name`` of ``recipe``."""
+        event = {"recipe": recipe, "builder": builder, "phase": name, "children": [0.0, 0.0]}
+        self.stack.append(event)
+        wall, cpu = time.perf_counter(), self.cpu_time()
+        try:
+            yield
+        finally:
+            event["start"] = wall - self.origin
+            event["wall"] = time.perf_counter() - wall
+            event["cpu"] = self.cpu_time() - cpu
+            child_wall, child_cpu = event.pop("children")
+            event["self_wall"] = max(0.0, event["wall"] - child_wall)
+            event["self_cpu"] = max(0.0, event["cpu"] - child_cpu)
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1]["children"][0] += event["wall"]
+                self.stack[-1]["children"][1] += event["cpu"]
+            self.events.append(event)
+
+    def report(self) -> Dict[str, Any]:
+        """Events plus self-time totals per phase and per recipe, in milliseconds."""
+        phases: Dict[str, Dict[str, float]] = {}
+        recipes: Dict[str, Dict[str, float]] = {}
+        for event in self.events:
+            for totals in (
+                phases.setdefault(event["phase"], {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0}),
+                recipes.setdefault(event["recipe"], {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0}),
+            ):
+                totals["count"] += 1
+                totals["wall_ms"] += event["self_wall"] * 1000
+                totals["cpu_ms"] += event["self_cpu"] * 1000
+
+        def rounded(totals):
+            return {key: round(value, 3) for key, value in totals.items()}
+
+        events = [
+            {
+                "recipe": event["recipe"],
+                "builder": event["builder"],
+                "phase": event["phase"],
+                **{f"{key}_ms": round(event[key] * 1000, 3)
+                   for key in ("start", "wall", "cpu", "self_wall", "self_cpu")},
+            }
+            for event in sorted(self.events, key=lambda event: event["start"])
+        ]
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "phases": {name: rounded(totals) for name, totals in phases.items()},
+            "recipes": {name: rounded(totals) for name, totals in recipes.items()},
+            "events": events,
+        }
+
+    def trace(self) -> Dict[str, Any]:
+        """Chrome trace-event document: one thread per recipe, one slice per phase."""
+        tids: Dict[str, int] = {}
+        events = []
+        for event in sorted(self.events, key=lambda event: event["start"]):
+            tid = tids.setdefault(event["recipe"], len(tids) + 1)
+            events.append({
+                "name": event["phase"],
+                "cat": event["builder"],
+                "ph": "X",
+                "pid": 1,
+                "tid": tid,
+                "ts": round(event["start"] * 1e6, 1),
+                "dur": round(event["wall"] * 1e6, 1),
+                "args": {"cpu_ms": round(event["cpu"] * 1000, 3)},
+            })
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": recipe}}
+            for recipe, tid in tids.items()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self) -> List[str]:
+        """One line per phase, slowest first."""
+        phases = self.report()["phases"]
+        return [
+            f"{name:<10} {totals['wall_ms']:>10.1f} ms wall {totals['cpu_ms']:>10.1f} ms cpu  x{totals['count']}"
+            for name, totals in sorted(phases.items(), key=lambda item: -item[1]["wall_ms"])
+        ]
+
+    def write(self, path: str, trace: Optional[str] = None):
+        """Write the JSON report, and the Chrome trace if ``trace`` is given."""
+        for target, document in ((path, self.report()), (trace, self.trace())):
+            if not target:
+                continue
+            target = pathlib.Path(target)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(json.dumps(document, indent=2))
+
+
+class TimingDatabase:
+    """SQLite history of the step timings written by generated scripts, one run per
+    recipe, host and start time."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            recipe TEXT NOT NULL,
+            host TEXT NOT NULL,
+            date TEXT NOT NULL,
+            start REAL NOT NULL,
+            seconds REAL NOT NULL,
+            status TEXT NOT NULL,
+            generator TEXT,
+            action TEXT,
+            source TEXT,
+            UNIQUE (recipe, host, start)
+        );
+        CREATE TABLE IF NOT EXISTS steps (
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            section TEXT,
+            name TEXT NOT NULL,
+            start REAL NOT NULL,
+            seconds REAL NOT NULL,
+            status TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_key ON runs (recipe, host, date);
+        CREATE INDEX IF NOT EXISTS steps_key ON steps (kind, section, run_id);
+    """
+
+    DEFAULT_DB = pathlib.Path.home() / ".cache" / "start-vm" / "timings.db"
+    DEFAULT_TIMINGS = pathlib.Path.home() / ".dotfiles_backup" / "timings"
+
+    def __init__(self, path: Optional[pathlib.Path] = None):
+        self.path = pathlib.Path(path or self.DEFAULT_DB)
+        self.log = logging.getLogger(self.__class__.__name__)
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(self.SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def timing_files(paths: List[pathlib.Path]) -> List[pathlib.Path]:
+        """JSON files given directly or found in the given directories."""
+        files = []
+        for path in paths:
+            files += sorted(path.glob("*.json")) if path.is_dir() else [path]
+        return files
+
+    def ingest(self, paths: List[pathlib.Path]) -> Tuple[int, int]:
+        """Add the runs in timing files; returns (files read, runs added)."""
+        files = self.timing_files(paths)
+        added = 0
+        for path in files:
+            try:
+                data = json.loads(path.read_text())
+                run = (
+                    data["recipe"], data.get("host") or "unknown",
+                    datetime.fromtimestamp(data["start"]).date().isoformat(),
+                    data["start"], data["seconds"], data.get("status", "ok"),
+                    data.get("generator"), data.get("action"), str(path),
+                )
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.log.warning(f"Skipping {path}: not a timing file ({e})")
+                continue
+            with self.db:
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO runs (recipe, host, date, start, seconds, status,"
+                    " generator, action, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    run,
+                )
+                if not cursor.rowcount:
+                    continue
+                self.db.executemany(
+                    "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (cursor.lastrowid, step["kind"], step.get("section"), step["name"],
+                         step["start"], step["seconds"], step.get("status", "ok"))
+                        for step in data.get("steps", [])
+                    ],
+                )
+                added += 1
+        return len(files), added
+
+    @staticmethod
+    def percentile(values: List[float], pct: float) -> float:
+        """Linearly interpolated percentile of values (0-100)."""
+        values = sorted(values)
+        if not values:
+            return 0.0
+        rank = (len(values) - 1) * pct / 100
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (rank - low)
+
+    def history(self, kind: str = "section", recipe: Optional[str] = None,
+                host: Optional[str] = None) -> Dict[Tuple[str, str, str], List[Tuple[str, float]]]:
+        """Successful step durations, oldest first, per (recipe, host, step name)."""
+        query = (
+            "SELECT runs.recipe, runs.host, steps.name, runs.date, steps.seconds"
+            " FROM steps JOIN runs ON runs.id = steps.run_id"
+            " WHERE steps.kind = ? AND steps.status = 'ok'"
+        )
+        params: List[Any] = [kind]
+        for column, value in (("recipe", recipe), ("host", host)):
+            if value:
+                query += f" AND runs.{column} = ?"
+                params.append(value)
+        history = defaultdict(list)
+        for recipe_name, host_name, name, date, seconds in self.db.execute(
+            query + " ORDER BY runs.start", params
+        ):
+            history[(recipe_name, host_name, name)].append((date, seconds))
+        return history
+
+    def section_stats(self, **filters) -> List[Dict[str, Any]]:
+        """Count, p50, p95 and last duration per step, slowest p50 first."""
+        stats = []
+        for (recipe, host, name), runs in self.history(**filters).items():
+            seconds = [value for _, value in runs]
+            stats.append({
+                "recipe": recipe, "host": host, "name": name, "runs": len(runs),
+                "p50": self.percentile(seconds, 50), "p95": self.percentile(seconds, 95),
+                "last": seconds[-1], "last_date": runs[-1][0],
+            })
+        return sorted(stats, key=lambda stat: -stat["p50"])
+
+    def regressions(self, threshold: float = 25.0, min_seconds: float = 5.0,
+                    min_history: int = 3, **filters) -> List[Dict[str, Any]]:
+        """Steps whose last duration exceeds the p50 of the runs before it.
+
+        A regression is more than ``threshold`` percent and ``min_seconds``
+        over that p50, with at least ``min_history`` earlier runs.
+        """
+        found = []
+        for (recipe, host, name), runs in self.history(**filters).items():
+            earlier = [value for _, value in runs[:-1]]
+            if len(earlier) < min_history:
+                continue
+            baseline, last = self.percentile(earlier, 50), runs[-1][1]
+            if last - baseline >= min_seconds and last > baseline * (1 + threshold / 100):
+                found.append({
+                    "recipe": recipe, "host": host, "name": name, "date": runs[-1][0],
+                    "baseline": baseline, "last": last,
+                    "change": 100 * (last - baseline) / baseline if baseline else float("inf"),
+                })
+        return sorted(found, key=lambda regression: -(regression["last"] - regression["baseline"]))
+
+    def trends(self, recipe: Optional[str] = None, host: Optional[str] = None,
+               last: int = 10) -> Dict[Tuple[str, str], List[Tuple[str, float, str]]]:
+        """(date, seconds, status) of the most recent runs per recipe and host."""
+        query = "SELECT recipe, host, date, seconds, status FROM runs WHERE 1 = 1"
+        params: List[Any] = []
+        for column, value in (("recipe", recipe), ("host", host)):
+            if value:
+                query += f" AND {column} = ?"
+                params.append(value)
+        trends = defaultdict(list)
+        for recipe_name, host_name, date, seconds, status in self.db.execute(
+            query + " ORDER BY start", params
+        ):
+            trends[(recipe_name, host_name)].append((date, seconds, status))
+        return {key: runs[-last:] for key, runs in trends.items()}
+
+    @staticmethod
+    def duration(seconds: float) -> str:
+        minutes, seconds = divmod(seconds, 60)
+        return f"{int(minutes)}m{seconds:04.1f}s" if minutes else f"{seconds:.1f}s"
+
+    def generate_report(self, kind: str = "section", threshold: float = 25.0,
+                        min_seconds: float = 5.0, **filters) -> str:
+        """Trends per recipe and host, step percentiles and regressions."""
+        lines = []
+        lines.append("=" * 80)
+        lines.append("PROVISIONING TIMING REPORT")
+        lines.append("=" * 80)
+        lines.append(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        lines.append(f"Database: {self.path}")
+        lines.append("")
+
+        lines.append("TRENDS (most recent runs)")
+        lines.append("-" * 80)
+        trends = self.trends(**filters)
+        for (recipe, host), runs in sorted(trends.items()):
+            baseline = self.percentile([seconds for _, seconds, _ in runs[:-1]], 50)
+            change = f", {100 * (runs[-1][1] - baseline) / baseline:+.0f}% vs p50" if baseline else ""
+            lines.append(f"{recipe} on {host}: {len(runs)} run(s){change}")
+            for date, seconds, status in runs:
+                flag = "" if status == "ok" else f" ({status})"
+                lines.append(f"  {date}  {self.duration(seconds):>10}{flag}")
+        if not trends:
+            lines.append("No runs recorded")
+        lines.append("")
+
+        lines.append(f"{kind.upper()} DURATIONS (successful runs)")
+        lines.append("-" * 80)
+        stats = self.section_stats(kind=kind, **filters)
+        if stats:
+            lines.append(f"{'recipe':<20} {'host':<12} {kind:<24} {'runs':>4} {'p50':>9} {'p95':>9} {'last':>9}")
+            for stat in stats:
+                lines.append(
+                    f"{stat['recipe'][:20]:<20} {stat['host'][:12]:<12} {stat['name'][:24]:<24} "
+                    f"{stat['runs']:>4} {self.duration(stat['p50']):>9} "
+                    f"{self.duration(stat['p95']):>9} {self.duration(stat['last']):>9}"
+                )
+        else:
+            lines.append(f"No {kind} steps recorded")
+        lines.append("")
+
+        lines.append(f"REGRESSIONS (last run > p50 of earlier runs by {threshold:g}% and {min_seconds:g}s)")
+        lines.append("-" * 80)
+        regressions = self.regressions(threshold, min_seconds, kind=kind, **filters)
+        for regression in regressions:
+            lines.append(
+                f"❌ {regression['recipe']} on {regression['host']}: {kind} {regression['name']} "
+                f"took {self.duration(regression['last'])} on {regression['date']}, "
+                f"p50 {self.duration(regression['baseline'])} (+{regression['change']:.0f}%)"
+            )
+        if not regressions:
+            lines.append("✅ No regressions")
+        lines.append("")
+        lines.append("=" * 80)
+
+        return "\n".join(lines)
+
+
+def bash_script(script: str, prelude: str = "") -> str:
+    """A script as one `` && bash -ec ...`` step of a Dockerfile ``RUN``.
+
+    Each line is a single-quoted ``printf`` argument on its own continued
+    line, so bash gets the script verbatim: its own ``\\`` continuations,
+    here-documents, ``if`` blocks and bash-only commands such as
+    ``source`` work, where ``RUN`` itself runs ``/bin/sh``.
+    """
+    lines = ([prelude] if prelude else []) + script.strip("\n").split("\n")
+    quoted = ["'" + line.replace("'", "'\\''") + "'" for line in lines]
+    return "\n".join(
+        [""" && bash -ec "$(printf '%s\\n' \\"""]
+        + [f"    {line} \\" for line in quoted]
+        + ['    )" \\']
+    )
+
+
+def bash_heredoc(script: str, var: str = "script") -> str:
+    """Bash lines assigning a script verbatim to ``var``, via a quoted here-document."""
+    return "\n".join(
+        [f"IFS= read -r -d '' {var} <<'START_VM_SCRIPT' || true", script.strip("\n"), "START_VM_SCRIPT"]
+    )
+
+
 class Builder(abc.ABC):
     """Abstract base class with standard interface / common functions"""
 
@@ -490,9 +864,8 @@ class Builder(abc.ABC):
     filters = {
         "sequence": lambda val: ", ".join(repr(x) for x in val),
         "nosudo": lambda val: val.replace("sudo", " &&"),
-        "junction": lambda val: "\n".join(
-            " && " + line + " \\" for line in val.split("\n") if line
-        ),
+        "script": bash_script,
+        "heredoc": bash_heredoc,
     }
 
     # Valid section types
@@ -509,13 +882,29 @@ class Builder(abc.ABC):
         "powershell",
     }
 
+    # resources: hints understood by the generated setup.py's governor
+    RESOURCE_HINTS = {
+        "cpu_weight": r"\d+",
+        "max_jobs": r"\d+",
+        "memory": r"\d+(\.\d+)?\s*[KMGT]?(i?B)?",
+    }
+
+    # volatility: hints ordering Dockerfile layers, most stable first
+    VOLATILITY = {"stable": 0, "normal": 1, "volatile": 2}
+
     # Required recipe fields
     REQUIRED_RECIPE_FIELDS = {"name", "platform", "os", "version", "sections"}
 
-    def __init__(self, recipe_yml: str, options: argparse.Namespace):
+    def __init__(
+        self,
+        recipe_yml: str,
+        options: argparse.Namespace,
+        profiler: Optional[PhaseProfiler] = None,
+    ):
         self.recipe_yml = pathlib.Path(recipe_yml)
         # self.name = self.recipe_yml.stem
         self.options = options
+        self.profiler = profiler
         self.log = logging.getLogger(self.__class__.__name__)
         self.recipe = self._get_recipe()
         self.env = jinja2.Environment(
@@ -528,6 +917,12 @@ class Builder(abc.ABC):
     def __repr__(self):
         return "<{} recipe='{}'>".format(self.__class__.__name__, self.recipe_yml)
 
+    def phase(self, name: str):
+        """Context timing a generation phase when profiling, else a no-op."""
+        if not self.profiler:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name, str(self.recipe_yml), self.__class__.__name__)
+
     def _validate_recipe(self, recipe: dict, yml_file: pathlib.Path, skip_required: bool = False) -> None:
         """Validate recipe structure and required fields.
 
@@ -585,6 +980,38 @@ class Builder(abc.ABC):
                 )
                 raise ValueError(f"Section '{section['name']}' missing 'install' field")
 
+            for flag in ("build_cache", "build_artifact", "resources"):
+                if section.get(flag) and section_type != "shell":
+                    self.log.warning(
+                        f"Recipe {yml_file} section '{section['name']}': "
+                        f"{flag} only applies to shell sections"
+                    )
+            if section.get("build_only") and section_type != "debian_packages":
+                self.log.warning(
+                    f"Recipe {yml_file} section '{section['name']}': "
+                    f"build_only only applies to debian_packages sections"
+                )
+
+            if section.get("volatility", "normal") not in self.VOLATILITY:
+                self.log.error(
+                    f"Recipe {yml_file} section '{section['name']}' has invalid volatility "
+                    f"'{section['volatility']}'. Valid values: {list(self.VOLATILITY)}"
+                )
+                raise ValueError(f"Invalid volatility in section '{section['name']}'")
+
+            resources = section.get("resources") or {}
+            invalid = [
+                f"{key}: {value}" for key, value in resources.items()
+                if key not in self.RESOURCE_HINTS
+                or not re.fullmatch(self.RESOURCE_HINTS[key], str(value), re.IGNORECASE)
+            ] if isinstance(resources, dict) else [str(resources)]
+            if invalid:
+                self.log.error(
+                    f"Recipe {yml_file} section '{section['name']}' has invalid resources "
+                    f"{invalid}. Valid hints: {sorted(self.RESOURCE_HINTS)}"
+                )
+                raise ValueError(f"Invalid resources in section '{section['name']}'")
+
     def _load_recipe_from_file(self, name: Optional[str] = None) -> dict:
         """Returns default recipe or a named recipe."""
         yml_file = (
@@ -592,7 +1019,7 @@ class Builder(abc.ABC):
         )
 
         try:
-            with yml_file.open() as fopen:
+            with self.phase("load"), yml_file.open() as fopen:
                 content = fopen.read()
                 recipe = yaml.load(content, Loader=yaml.SafeLoader)
         except FileNotFoundError:
@@ -609,7 +1036,8 @@ class Builder(abc.ABC):
         # Skip required field validation if recipe has inheritance
         # (required fields will be validated after inheritance is resolved)
         skip_required = "inherits" in recipe
-        self._validate_recipe(recipe, yml_file, skip_required=skip_required)
+        with self.phase("validate"):
+            self._validate_recipe(recipe, yml_file, skip_required=skip_required)
 
         return recipe
 
@@ -660,32 +1088,33 @@ class Builder(abc.ABC):
 
         # Process inheritance with configuration inheritance
         if "inherits" in recipe:
-            if isinstance(recipe["inherits"], str):
-                parents = [recipe["inherits"]]
-            else:
-                parents = recipe["inherits"]
-
-            # Build up merged parent config from all parents
-            # Process parents in order (left to right), later parents override earlier ones
-            merged_parent = {}
-            for parent_name in parents:
-                parent_recipe = self._load_recipe_from_file(parent_name)
-
-                # Recursively process parent's inheritance first
-                if "inherits" in parent_recipe:
-                    parent_recipe = self._get_recipe(parent_recipe)
-
-                # Merge this parent into the accumulated parent config
-                # Treat parent_recipe as child so it overrides previous parents
-                if merged_parent:
-                    merged_parent = self._merge_configs(merged_parent, parent_recipe)
+            with self.phase("inherit"):
+                if isinstance(recipe["inherits"], str):
+                    parents = [recipe["inherits"]]
                 else:
-                    merged_parent = parent_recipe
+                    parents = recipe["inherits"]
+
+                # Build up merged parent config from all parents
+                # Process parents in order (left to right), later parents override earlier ones
+                merged_parent = {}
+                for parent_name in parents:
+                    parent_recipe = self._load_recipe_from_file(parent_name)
+
+                    # Recursively process parent's inheritance first
+                    if "inherits" in parent_recipe:
+                        parent_recipe = self._get_recipe(parent_recipe)
+
+                    # Merge this parent into the accumulated parent config
+                    # Treat parent_recipe as child so it overrides previous parents
+                    if merged_parent:
+                        merged_parent = self._merge_configs(merged_parent, parent_recipe)
+                    else:
+                        merged_parent = parent_recipe
 
-                self.log.debug(f"Inherited configuration from parent '{parent_name}'")
+                    self.log.debug(f"Inherited configuration from parent '{parent_name}'")
 
-            # Finally merge the accumulated parent config with the child
-            recipe = self._merge_configs(merged_parent, recipe)
+                # Finally merge the accumulated parent config with the child
+                recipe = self._merge_configs(merged_parent, recipe)
 
         # Handle default files
         default_path = pathlib.Path("default")
@@ -708,7 +1137,8 @@ class Builder(abc.ABC):
 
         # Validate the final merged recipe (after inheritance is complete)
         # Use a dummy path since we've already merged inheritance
-        self._validate_recipe(recipe, pathlib.Path(self.recipe_yml), skip_required=False)
+        with self.phase("validate"):
+            self._validate_recipe(recipe, pathlib.Path(self.recipe_yml), skip_required=False)
 
         recipe.update(vars(self.options))
         return recipe
@@ -735,6 +1165,25 @@ class Builder(abc.ABC):
                     f"Command failed with exit code {result.returncode}: {shell_cmd}"
                 )
 
+    @property
+    def mirror(self) -> Optional[pathlib.Path]:
+        """Local package mirror (--mirror) for builders that download packages."""
+        mirror = getattr(self.options, "mirror", None)
+        return pathlib.Path(mirror) if mirror else None
+
+    def fetch_cmd(self, cmd: List[str], cwd: Optional[pathlib.Path] = None) -> str:
+        """Run a download command, returning stdout; failures are fatal."""
+        self.log.debug("running %s", " ".join(cmd))
+        try:
+            result = subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+        except FileNotFoundError:
+            self.log.error(f"Command not found: {cmd[0]}")
+            raise
+        except subprocess.CalledProcessError as e:
+            self.log.error(f"Command failed: {' '.join(cmd)}\n{e.stderr}")
+            raise
+        return result.stdout
+
     def write_file(self, data: str):
         """Write setup file with options."""
         if self.options.strip:
@@ -766,9 +1215,10 @@ class Builder(abc.ABC):
 
         if self.options.format:
             try:
-                subprocess.run(
-                    ["shfmt", "-w", str(path)], check=True, capture_output=True
-                )
+                with self.phase("format"):
+                    subprocess.run(
+                        ["shfmt", "-w", str(path)], check=True, capture_output=True
+                    )
             except FileNotFoundError:
                 self.log.warning(f"shfmt not found in PATH, skipping format for {path}")
             except subprocess.CalledProcessError as e:
@@ -806,7 +1256,8 @@ class Builder(abc.ABC):
     def build(self):
         """Renders a template from a recipe."""
         try:
-            template = self.env.get_template(self.template)
+            with self.phase("compile"):
+                template = self.env.get_template(self.template)
         except jinja2.TemplateNotFound:
             self.log.error(f"Template not found: {self.template}")
             raise
@@ -815,7 +1266,8 @@ class Builder(abc.ABC):
             raise
 
         try:
-            rendered = template.render(**self.recipe)
+            with self.phase("render"):
+                rendered = template.render(**self.recipe)
         except jinja2.TemplateError as e:
             self.log.error(f"Error rendering template {self.template}: {e}")
             raise
@@ -840,7 +1292,104 @@ class Builder(abc.ABC):
             for section in self.recipe["sections"]:
                 self.log.info(f"[DRY-RUN]   - {section['name']} ({section['type']})")
         else:
-            self.write_file(rendered)
+            with self.phase("write"):
+                self.write_file(rendered)
+
+    def payload_roots(self) -> List[Tuple[pathlib.Path, List[str]]]:
+        """Source directories and the entries the recipe references in them."""
+        roots = [(pathlib.Path("default"), self.recipe.get("defaults", []))]
+        if self.recipe.get("config"):
+            roots.append(
+                (pathlib.Path("config") / self.recipe["config"], self.recipe.get("configs", []))
+            )
+        return roots
+
+    def collect_payload(self) -> Tuple[Dict, Dict[str, pathlib.Path]]:
+        """Walk referenced entries, returning the bundle manifest and objects."""
+        manifest = {"dirs": [], "files": {}, "symlinks": {}}
+        objects = {}
+
+        def add_file(path: pathlib.Path, rel: str):
+            digest = hashlib.sha256()
+            with path.open("rb") as fopen:
+                for chunk in iter(lambda: fopen.read(1 << 20), b""):
+                    digest.update(chunk)
+            digest = digest.hexdigest()
+            st = path.stat()
+            manifest["files"][rel] = {
+                "object": digest,
+                "mode": stat.S_IMODE(st.st_mode),
+                "mtime_ns": st.st_mtime_ns,
+            }
+            objects.setdefault(digest, path)
+
+        for root, entries in self.payload_roots():
+            for entry in sorted(entries):
+                path = root / entry
+                if path.is_symlink():
+                    manifest["symlinks"][path.as_posix()] = os.readlink(path)
+                elif path.is_dir():
+                    for dirpath, dirnames, filenames in os.walk(path):
+                        dirnames.sort()
+                        manifest["dirs"].append(pathlib.Path(dirpath).as_posix())
+                        for name in dirnames + sorted(filenames):
+                            child = pathlib.Path(dirpath) / name
+                            if child.is_symlink():
+                                manifest["symlinks"][child.as_posix()] = os.readlink(child)
+                            elif child.is_file():
+                                add_file(child, child.as_posix())
+                elif path.is_file():
+                    add_file(path, path.as_posix())
+                else:
+                    self.log.warning(f"Referenced entry not found, skipping: {path}")
+
+        return manifest, objects
+
+    @staticmethod
+    def parse_packages_index(text: str) -> Dict[str, Dict[str, str]]:
+        """Parse a Debian ``Packages`` index into {package: fields}."""
+        index = {}
+        for stanza in re.split(r"\n\s*\n", text):
+            fields, key = {}, None
+            for line in stanza.splitlines():
+                if line[:1].isspace() and key:
+                    fields[key] += "\n" + line.strip()
+                elif ":" in line:
+                    key, value = line.split(":", 1)
+                    fields[key] = value.strip()
+            if "Package" in fields:
+                index[fields["Package"]] = fields
+        return index
+
+    def debian_closure(
+        self, package: Union[str, List[str]], index: Dict[str, Dict[str, str]]
+    ) -> List[str]:
+        """Package(s) plus everything they Depends / Pre-Depends on, per the index."""
+        provides = {}
+        for name, fields in index.items():
+            for provided in fields.get("Provides", "").split(","):
+                if provided.strip():
+                    provides.setdefault(re.split(r"[\s(:]", provided.strip())[0], name)
+
+        closure, pending = set(), [package] if isinstance(package, str) else list(package)
+        while pending:
+            name = pending.pop()
+            name = name if name in index else provides.get(name)
+            if name is None or name in closure:
+                continue
+            closure.add(name)
+            for field in ("Pre-Depends", "Depends"):
+                for group in index[name].get(field, "").split(","):
+                    # First installable alternative of "a (>= 1) | b"
+                    alternatives = [
+                        re.split(r"[\s(:]", alt.strip())[0] for alt in group.split("|") if alt.strip()
+                    ]
+                    choice = next((a for a in alternatives if a in index or a in provides), None)
+                    if choice:
+                        pending.append(choice)
+                    elif alternatives:
+                        self.log.warning(f"{name}: unresolved dependency '{group.strip()}'")
+        return sorted(closure)
 
     def generate_lockfile(self) -> str:
         """Generate lockfile with pinned package versions."""
@@ -892,17 +1441,18 @@ class Builder(abc.ABC):
 
     def write_lockfile(self):
         """Write lockfile to disk."""
-        lockfile_content = self.generate_lockfile()
-        lockfile_name = f"{self.prefix}.lock.json"
-        lockfile_path = self.setup / lockfile_name
+        with self.phase("lockfile"):
+            lockfile_content = self.generate_lockfile()
+            lockfile_name = f"{self.prefix}.lock.json"
+            lockfile_path = self.setup / lockfile_name
 
-        self.log.info(f"Writing lockfile: {lockfile_path}")
-        try:
-            with lockfile_path.open("w") as f:
-                f.write(lockfile_content)
-        except OSError as e:
-            self.log.error(f"Could not write lockfile {lockfile_path}: {e}")
-            raise
+            self.log.info(f"Writing lockfile: {lockfile_path}")
+            try:
+                with lockfile_path.open("w") as f:
+                    f.write(lockfile_content)
+            except OSError as e:
+                self.log.error(f"Could not write lockfile {lockfile_path}: {e}")
+                raise
 
     @abc.abstractmethod
     def run(self):
@@ -921,14 +1471,378 @@ class ShellBuilder(Builder):
 
 
 class DockerFileBuilder(Builder):
-    """Builds a dockerfile for package installation."""
+    """Builds a dockerfile with one ``RUN`` layer per section (or ``layer:`` group), most stable first."""
 
     prefix = ""
     suffix = ".Dockerfile"
     template = "Dockerfile"
 
+    # RUN --mount options per section type for --buildkit (builds run as root)
+    CACHE_MOUNTS = {
+        "debian_packages": [
+            "type=cache,target=/var/cache/apt,sharing=locked",
+            "type=cache,target=/var/lib/apt/lists,sharing=locked",
+        ],
+        "python_packages": ["type=cache,target=/root/.cache/pip"],
+        "ruby_packages": ["type=cache,target=/var/cache/gem"],
+        "rust_packages": [
+            "type=cache,target=/root/.cargo/registry",
+            "type=cache,target=/root/.cargo/git",
+            "type=cache,target=/root/.cache/start-vm/cargo-target",
+        ],
+    }
+
+    # Install root of builder stages for --multi-stage
+    STAGE = "/stage"
+
+    # Script section types, which may build against anything installed before them
+    BARRIER_TYPES = ("shell", "powershell")
+
+    # Commands through which a script uses what a package section installed
+    PACKAGE_TOOLS = {
+        "python_packages": ("python", "python3", "pip", "pip3"),
+        "ruby_packages": ("ruby", "gem", "bundle"),
+        "rust_packages": ("cargo",),
+    }
+
+    # (sha256, files, bytes) of the build context, once the Dockerfile is written
+    context: Optional[Tuple[str, int, int]] = None
+
+    # Scripts that compile
+    SOURCE_BUILD = re.compile(r"\b(make|cmake|ninja|meson|waf|configure|cargo\s+build|gcc|g\+\+)\b")
+
+    # Where --slim reads Installed-Size from without --packages-index
+    PACKAGES_INDEX = "/var/lib/apt/lists/*_Packages"
+
+    def section_depths(self) -> Dict[str, int]:
+        """Inheritance depth of the recipe each section comes from (0: this recipe).
+
+        A recipe reached along several inheritance paths takes the longest,
+        and an overridden section the depth of its nearest definition.
+        """
+        recipes: Dict[Optional[str], Tuple[int, dict]] = {}
+
+        def visit(name: Optional[str], depth: int):
+            if name in recipes and recipes[name][0] >= depth:
+                return
+            recipe = self._load_recipe_from_file(name)
+            recipes[name] = (depth, recipe)
+            parents = recipe.get("inherits", [])
+            for parent in [parents] if isinstance(parents, str) else parents:
+                visit(parent, depth + 1)
+
+        visit(None, 0)
+        depths: Dict[str, int] = {}
+        for depth, recipe in recipes.values():
+            for section in recipe["sections"]:
+                depths[section["name"]] = min(depth, depths.get(section["name"], depth))
+        return depths
+
+    def ordered_sections(self) -> List[dict]:
+        """Recipe sections, from most stable to most volatile unless --layer-order recipe."""
+        sections = list(self.recipe["sections"])
+        if getattr(self.options, "layer_order", "stability") != "recipe":
+            depths = self.section_depths()
+            sections.sort(
+                key=lambda section: (
+                    self.VOLATILITY[section.get("volatility", "normal")],
+                    -depths.get(section["name"], 0),
+                )
+            )
+        if self.build_deps():
+            # Their packages are installed by the compiling layers instead
+            sections = [
+                dict(section, install=[]) if self.build_only(section) else section
+                for section in sections
+                if not self.build_only(section)
+                or any(section.get(key) for key in ("pre_install", "purge", "post_install"))
+            ]
+        return sections
+
+    @staticmethod
+    def build_only(section: dict) -> bool:
+        """Whether a section's packages are only needed to compile (``build_only: true``)."""
+        return section["type"] == "debian_packages" and bool(section.get("build_only"))
+
+    def builds(self, section: dict) -> bool:
+        """Whether a section compiles, needing the build-only packages."""
+        if section["type"] == "shell":
+            return bool(self.SOURCE_BUILD.search(section["install"]))
+        return section["type"] in ("python_packages", "ruby_packages", "rust_packages")
+
+    def build_deps(self) -> List[str]:
+        """Packages of build_only sections, which --slim keeps out of the image."""
+        sections = self.recipe["sections"]
+        if not getattr(self.options, "slim", False) or not any(map(self.builds, sections)):
+            return []
+        return [pkg for section in sections if self.build_only(section) for pkg in section["install"]]
+
+    @classmethod
+    def depends(cls, section: dict, earlier: dict) -> bool:
+        """Whether a section may need what an earlier one installs.
+
+        Debian packages and scripts may be anyone's toolchain or library, and
+        a package manager may build against its earlier packages (cython for
+        a later python section). A script needs a package section only when
+        it runs its tools or names one of its packages, and debian packages
+        need no other section.
+        """
+        if section.get("pre_install") or earlier.get("pre_install"):
+            return True
+        if earlier["type"] == "debian_packages" or earlier["type"] in cls.BARRIER_TYPES:
+            return True
+        if section["type"] == "debian_packages":
+            return False
+        if section["type"] in cls.BARRIER_TYPES:
+            names = cls.PACKAGE_TOOLS.get(earlier["type"], ()) + tuple(
+                PackageSpec(pkg, earlier["type"].split("_")[0]).name for pkg in earlier["install"]
+            )
+            return any(
+                re.search(rf"(?<![\w./-]){re.escape(name)}(?![\w./-])", section["install"])
+                for name in names
+            )
+        return section["type"] == earlier["type"]
+
+    def staged(self, sections: List[dict]) -> Set[str]:
+        """Names of the ordered sections --multi-stage builds in their own builder stage."""
+        if not getattr(self.options, "multi_stage", False):
+            return set()
+        staged = set()
+        for index, section in enumerate(sections):
+            if section["type"] == "shell":
+                if not section.get("build_artifact"):
+                    continue
+            elif section["type"] not in ("python_packages", "ruby_packages", "rust_packages"):
+                continue
+            if not any(self.depends(later, section) for later in sections[index + 1:]):
+                staged.add(section["name"])
+        return staged
+
+    def mounts(self, sections: List[dict], apt: bool = False) -> List[str]:
+        """BuildKit cache mounts for a RUN over the given sections."""
+        mounts: List[str] = []
+        if getattr(self.options, "buildkit", False):
+            types = ["debian_packages"] if apt else []
+            for section_type in types + [section["type"] for section in sections]:
+                for mount in self.CACHE_MOUNTS.get(section_type, []):
+                    if mount not in mounts:
+                        mounts.append(mount)
+        return mounts
+
+    def layers(self) -> List[dict]:
+        """Sections grouped into RUN layers, ordered from most stable to most volatile.
+
+        With build-only packages, consecutive compiling layers are merged so
+        they are installed and purged once for the run.
+        """
+        build_deps = self.build_deps()
+        groups: Dict[str, dict] = {}
+        sections = self.ordered_sections()
+        staged = self.staged(sections)
+        for section in sections:
+            if section["name"] in staged:
+                continue
+            name = section.get("layer") or section["name"]
+            groups.setdefault(name, {"name": name, "sections": []})
+            groups[name]["sections"].append(section)
+        layers: List[dict] = []
+        for layer in groups.values():
+            layer["builds"] = any(map(self.builds, layer["sections"]))
+            if build_deps and layer["builds"] and layers and layers[-1]["builds"]:
+                layers[-1]["name"] += "+" + layer["name"]
+                layers[-1]["sections"] += layer["sections"]
+            else:
+                layers.append(layer)
+        for layer in layers:
+            layer["build_deps"] = build_deps if layer["builds"] else []
+            layer["mounts"] = self.mounts(layer["sections"], apt=bool(layer["build_deps"]))
+        return layers
+
+    def stages(self) -> List[dict]:
+        """Builder stages for --multi-stage, one per staged section."""
+        build_deps = self.build_deps()
+        sections = self.ordered_sections()
+        staged = self.staged(sections)
+        return [
+            {
+                "name": "build-" + re.sub(r"[^a-z0-9]+", "-", section["name"].lower()).strip("-"),
+                "section": section,
+                "build_deps": build_deps if self.builds(section) else [],
+                "mounts": self.mounts([section], apt=bool(build_deps) and self.builds(section)),
+            }
+            for section in sections
+            if section["name"] in staged
+        ]
+
+    @staticmethod
+    def steps(section: dict) -> int:
+        """Install steps in a section: its packages, or one for a script."""
+        install = section.get("install") or []
+        return len(install) if isinstance(install, list) else 1
+
+    def invalidation_report(self, layers: List[dict]) -> List[str]:
+        """Lines describing what a change to each layer rebuilds."""
+        total = sum(self.steps(section) for layer in layers for section in layer["sections"])
+        lines = []
+        for index, layer in enumerate(layers):
+            rebuilt = layers[index:]
+            steps = sum(self.steps(section) for later in rebuilt for section in later["sections"])
+            names = ", ".join(section["name"] for section in layer["sections"])
+            lines.append(
+                f"layer {index + 1}/{len(layers)} {layer['name']} ({names}): a change rebuilds "
+                f"{len(rebuilt)} layer(s), {steps}/{total} install steps"
+            )
+        return lines
+
+    @staticmethod
+    def human_size(kib: int) -> str:
+        for unit in ("KiB", "MiB", "GiB"):
+            if kib < 1024 or unit == "GiB":
+                return f"{kib:.0f} {unit}" if unit == "KiB" else f"{kib:.1f} {unit}"
+            kib /= 1024
+
+    def size_report(self, layers: List[dict]) -> List[str]:
+        """Estimated installed size of each layer's debian packages, from a Packages index.
+
+        Packages that are Essential or of required priority are assumed to
+        be in the base image already; python, ruby, rust and shell installs
+        are not estimated.
+        """
+        pattern = getattr(self.options, "packages_index", None) or self.PACKAGES_INDEX
+        paths = sorted(pathlib.Path(path) for path in glob.glob(pattern))
+        if not paths:
+            self.log.debug(f"No Packages index at {pattern}: skipping the size estimate")
+            return []
+        index: Dict[str, Dict[str, str]] = {}
+        for path in paths:
+            opener = gzip.open if path.suffix == ".gz" else open
+            with opener(path, "rt", errors="replace") as fopen:
+                for name, fields in self.parse_packages_index(fopen.read()).items():
+                    index.setdefault(name, fields)
+
+        def kib(packages):
+            return sum(int(index[pkg].get("Installed-Size", 0) or 0) for pkg in packages)
+
+        seen = {
+            name for name, fields in index.items()
+            if fields.get("Essential") == "yes" or fields.get("Priority") == "required"
+        }
+        lines, total = [], 0
+        for layer in layers:
+            names = [
+                PackageSpec(pkg, "debian").name
+                for section in layer["sections"] if section["type"] == "debian_packages"
+                for pkg in section["install"]
+            ]
+            if not names:
+                continue
+            added = set(self.debian_closure(names, index)) - seen
+            seen |= added
+            total += kib(added)
+            lines.append(f"layer {layer['name']}: ~{self.human_size(kib(added))} ({len(added)} packages)")
+        build_deps = [PackageSpec(pkg, "debian").name for pkg in self.build_deps()]
+        if build_deps:
+            removed = set(self.debian_closure(build_deps, index)) - seen
+            lines.append(
+                f"build-only packages: ~{self.human_size(kib(removed))} "
+                f"({len(removed)} packages) installed and removed by each compiling layer or stage"
+            )
+        lines.append(f"estimated debian packages: ~{self.human_size(total)} (from {len(paths)} Packages index(es))")
+
+        budget = getattr(self.options, "size_budget", None)
+        if budget:
+            match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", budget, re.IGNORECASE)
+            if not match:
+                self.log.error(f"Invalid --size-budget: {budget}")
+                raise ValueError(f"Invalid size budget '{budget}'")
+            number, unit = match.groups()
+            limit = float(number) * 1024 ** " KMGT".index(unit.upper() or " ") / 1024
+            if total > limit:
+                self.log.warning(
+                    f"estimated debian packages (~{self.human_size(total)}) exceed "
+                    f"the size budget of {budget}"
+                )
+        return lines
+
+    def build(self):
+        """Renders the Dockerfile with one RUN per layer and reports cache scope."""
+        layers = self.layers()
+        stages = self.stages()
+        self.recipe["layers"] = layers
+        self.recipe["stages"] = stages
+        self.recipe["stage_root"] = self.STAGE
+        self.recipe["apt_mounts"] = self.mounts([], apt=True)
+        super().build()
+        for line in self.invalidation_report(layers):
+            self.log.info(line)
+        if stages:
+            self.log.info(
+                f"builder stages (run concurrently; a change rebuilds only its stage "
+                f"and the final copy): {', '.join(stage['name'] for stage in stages)}"
+            )
+        elif getattr(self.options, "multi_stage", False):
+            self.log.warning(
+                f"--multi-stage: every package or build_artifact section of {self.target} "
+                f"is needed by a later section, so no builder stage was produced"
+            )
+        if getattr(self.options, "slim", False):
+            for line in self.size_report(layers):
+                self.log.info(line)
+
+    def dockerignore(self) -> str:
+        """Ignore file excluding everything but the referenced dotfiles."""
+        lines = [f"# Build context for {self.target}: only the dotfiles the recipe references", "*"]
+        for root, entries in self.payload_roots():
+            lines += [f"!{(root / entry).as_posix()}" for entry in sorted(entries)]
+        return "\n".join(lines) + "\n"
+
+    def context_hash(self, dockerfile: str) -> Tuple[str, int, int]:
+        """sha256 over the Dockerfile and the context it copies, with file and byte counts.
+
+        Modification times are left out, so a fresh checkout hashes the same.
+        """
+        manifest, objects = self.collect_payload()
+        context = {
+            "dockerfile": hashlib.sha256(dockerfile.encode()).hexdigest(),
+            "files": {rel: [info["object"], info["mode"]] for rel, info in manifest["files"].items()},
+            "symlinks": manifest["symlinks"],
+        }
+        digest = hashlib.sha256(json.dumps(context, sort_keys=True).encode()).hexdigest()
+        size = sum(path.stat().st_size for path in objects.values())
+        return digest, len(manifest["files"]), size
+
+    @property
+    def tag(self) -> str:
+        """Image tag naming the recipe and its build context."""
+        name = re.sub(r"[^a-z0-9._-]+", "-", self.recipe["name"].lower())
+        return f"{name}:ctx-{self.context[0][:12]}" if self.context else f"{name}:latest"
+
+    def write_file(self, data: str):
+        """Write the Dockerfile and its .dockerignore, and hash the build context."""
+        super().write_file(data)
+        path = self.setup / f"{self.target}.dockerignore"
+        self.log.info("writing %s", path)
+        try:
+            path.write_text(self.dockerignore())
+        except OSError as e:
+            self.log.error(f"Could not write file {path}: {e}")
+            raise
+        self.context = self.context_hash(data)
+        digest, files, size = self.context
+        self.log.info(f"build context: {files} files, {size:,} bytes, sha256 {digest[:12]}")
+        if not getattr(self.options, "buildkit", False):
+            self.log.info(
+                f"{path.name} is only read by BuildKit: build with DOCKER_BUILDKIT=1 "
+                f"or docker buildx, or the whole checkout is sent as the context"
+            )
+
     def run(self):
-        self.log.info("docker build -t %s -f %s", self.name, self.target)
+        # The per-Dockerfile .dockerignore is ignored by the classic builder
+        path = self.setup / self.target
+        self.cmd(
+            "docker image inspect {0} > /dev/null 2>&1 || DOCKER_BUILDKIT=1 docker build -t {0} -f {1} .",
+            self.tag, path,
+        )
 
 
 class PowerShellBuilder(Builder):
@@ -980,6 +1894,13 @@ class PythonBuilder(Builder):
             if section.get('post_install'):
                 sec_dict['post_install'] = section['post_install']
 
+            for flag in ('build_cache', 'build_artifact'):
+                if section.get(flag):
+                    sec_dict[flag] = True
+
+            if section.get('resources'):
+                sec_dict['resources'] = dict(section['resources'])
+
             sections.append(sec_dict)
 
         # Pretty print the data structures
@@ -998,8 +1919,461 @@ class PythonBuilder(Builder):
         self.cmd("python3 {} install", path)
 
 
+class BundleBuilder(PythonBuilder):
+    """Builds a self-contained Python zipapp with the setup script and dotfiles.
+
+    Only the defaults and configs referenced by the recipe are included.
+    File content is stored once per sha256 under ``objects/`` and described
+    by ``bundle.json``; the ``__main__.py`` bootstrap streams it back out.
+    """
+
+    suffix = ".pyz"
+    bootstrap = "bundle.py"
+    # Fixed member timestamps keep bundles byte-for-byte reproducible
+    zip_date_time = (1980, 1, 1, 0, 0, 0)
+
+    def write_member(self, archive: zipfile.ZipFile, name: str, data: bytes = None,
+                     path: pathlib.Path = None, mode: int = 0o644):
+        """Add one deterministic, compressed member, streaming from path if given."""
+        info = zipfile.ZipInfo(name, date_time=self.zip_date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = (stat.S_IFREG | mode) << 16
+        with archive.open(info, "w") as fdst:
+            if path is None:
+                fdst.write(data)
+            else:
+                with path.open("rb") as fsrc:
+                    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+    def write_file(self, data: str):
+        """Write the bundle instead of a plain setup script."""
+        if self.options.strip:
+            data = "\n".join(line for line in data.split("\n") if line.strip())
+        path = self.setup / self.target
+
+        manifest, objects = self.collect_payload()
+        script = data.encode()
+        script_digest = hashlib.sha256(script).hexdigest()
+        manifest["files"]["setup.py"] = {
+            "object": script_digest, "mode": 0o755, "mtime_ns": 0,
+        }
+        manifest["setup"] = "setup.py"
+        manifest["name"] = self.recipe["name"]
+        # Content-derived id: identical payloads extract to the same place
+        manifest["id"] = hashlib.sha256(
+            json.dumps(manifest, sort_keys=True).encode()
+        ).hexdigest()
+
+        try:
+            bootstrap = self.env.get_template(self.bootstrap).render(**self.recipe)
+        except jinja2.TemplateError as e:
+            self.log.error(f"Error rendering template {self.bootstrap}: {e}")
+            raise
+
+        try:
+            self.setup.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            self.log.error(f"Could not create setup directory {self.setup}: {e}")
+            raise
+
+        self.log.info("writing %s", path)
+        try:
+            with path.open("wb") as fopen:
+                fopen.write(b"#!/usr/bin/env python3\n")
+                with zipfile.ZipFile(fopen, "w", compresslevel=9) as archive:
+                    self.write_member(archive, "__main__.py", bootstrap.encode())
+                    self.write_member(
+                        archive, "bundle.json", json.dumps(manifest, indent=1, sort_keys=True).encode()
+                    )
+                    self.write_member(archive, f"objects/{script_digest}", script)
+                    for digest, source in sorted(objects.items()):
+                        if digest != script_digest:
+                            self.write_member(archive, f"objects/{digest}", path=source)
+        except OSError as e:
+            self.log.error(f"Could not write bundle {path}: {e}")
+            raise
+
+        if self.options.executable:
+            try:
+                path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+            except OSError as e:
+                self.log.error(f"Could not make file executable {path}: {e}")
+                raise
+
+        payload = sum(objects[d].stat().st_size for d in objects) + len(script)
+        self.log.info(
+            f"bundled {len(manifest['files'])} files as {len(objects) + 1} unique objects "
+            f"({payload:,} bytes -> {path.stat().st_size:,} bytes)"
+        )
+
+
+class GemSpecLoader(yaml.SafeLoader):
+    """Safe YAML loader for gem metadata that ignores Ruby object tags."""
+
+
+GemSpecLoader.add_multi_constructor(
+    "!ruby/",
+    lambda loader, suffix, node: (
+        loader.construct_mapping(node, deep=True)
+        if isinstance(node, yaml.MappingNode)
+        else loader.construct_sequence(node, deep=True)
+        if isinstance(node, yaml.SequenceNode)
+        else loader.construct_scalar(node)
+    ),
+)
+
+
+class OfflineBundleBuilder(Builder):
+    """Pre-downloads everything a recipe installs into ``setup/<target>.offline.tar``,
+    from the network or a local ``--mirror`` directory."""
+
+    suffix = ".offline.tar"
+    FETCHERS = {
+        "debian_packages": ("debian", "fetch_debian"),
+        "python_packages": ("python", "fetch_python"),
+        "ruby_packages": ("ruby", "fetch_ruby"),
+        "rust_packages": ("rust", "fetch_rust"),
+    }
+    CRATES_API = "https://crates.io/api/v1/crates"
+
+    def fetch_debian(self, packages: List[str], dest: pathlib.Path) -> Dict[str, List[str]]:
+        """Fetch .deb files for packages and their dependency closure."""
+        names = [PackageSpec(pkg, "debian").name for pkg in packages]
+        closures = {}
+
+        if self.mirror:
+            index_path = self.mirror / "debian" / "Packages"
+            try:
+                index = self.parse_packages_index(index_path.read_text())
+            except OSError as e:
+                self.log.error(f"Could not read mirror index {index_path}: {e}")
+                raise
+            for name in names:
+                if name not in index:
+                    self.log.error(f"Package '{name}' not found in {index_path}")
+                    raise ValueError(f"Package '{name}' not found in mirror")
+                closures[name] = self.debian_closure(name, index)
+            files = {pkg: index[pkg]["Filename"] for pkgs in closures.values() for pkg in pkgs}
+            for filename in sorted(set(files.values())):
+                shutil.copy2(self.mirror / "debian" / filename, dest / pathlib.Path(filename).name)
+            debs = {pkg: pathlib.Path(filename).name for pkg, filename in files.items()}
+        else:
+            for name in names:
+                output = self.fetch_cmd(
+                    ["apt-cache", "depends", "--recurse", "--no-recommends", "--no-suggests",
+                     "--no-conflicts", "--no-breaks", "--no-replaces", "--no-enhances", name]
+                )
+                closures[name] = sorted(
+                    {line for line in output.splitlines() if line and not line[0] in " <"}
+                )
+            wanted = sorted({pkg for pkgs in closures.values() for pkg in pkgs})
+            self.fetch_cmd(["apt-get", "download"] + wanted, cwd=dest)
+            debs = {
+                pkg: match.name
+                for pkg in wanted
+                for match in sorted(dest.glob(f"{pkg}_*.deb"))[-1:]
+            }
+
+        result = {}
+        for name, closure in closures.items():
+            result[name] = [debs[pkg] for pkg in closure if pkg in debs]
+            (dest / f"{name}.closure").write_text("".join(f"{deb}\n" for deb in result[name]))
+        return result
+
+    def fetch_python(self, packages: List[str], dest: pathlib.Path) -> Dict[str, List[str]]:
+        """Fetch wheels (or sdists) for packages and their dependencies."""
+        cmd = [sys.executable, "-m", "pip", "download", "--quiet", "--dest", str(dest)]
+        if self.mirror:
+            cmd += ["--no-index", "--find-links", str(self.mirror / "python")]
+        self.fetch_cmd(cmd + list(packages))
+        return {"requirements": list(packages), "files": sorted(p.name for p in dest.iterdir())}
+
+    @staticmethod
+    def newest(paths: List[pathlib.Path]) -> Optional[pathlib.Path]:
+        """Pick the highest-versioned file among name-<version>.<ext> candidates."""
+        def version_key(path):
+            version = path.name.rsplit("-", 1)[-1]
+            return [int(part) if part.isdigit() else -1 for part in re.split(r"[.\-]", version)]
+
+        return max(paths, key=version_key) if paths else None
+
+    @staticmethod
+    def gem_dependencies(gem: pathlib.Path) -> List[str]:
+        """Runtime dependency names from a .gem file's metadata."""
+        with tarfile.open(gem) as archive:
+            spec = yaml.load(
+                gzip.decompress(archive.extractfile("metadata.gz").read()), Loader=GemSpecLoader
+            )
+        return [
+            dep["name"] for dep in spec.get("dependencies") or []
+            if str(dep.get("type", ":runtime")).lstrip(":") == "runtime"
+        ]
+
+    def fetch_ruby(self, packages: List[str], dest: pathlib.Path) -> Dict[str, Optional[str]]:
+        """Fetch gems and, recursively, their runtime dependencies."""
+        specs = [PackageSpec(pkg, "ruby") for pkg in packages]
+        versions = {spec.name: spec.version for spec in specs}
+        fetched, pending = {}, [spec.name for spec in specs]
+
+        while pending:
+            name = pending.pop()
+            if name in fetched:
+                continue
+            pattern = re.compile(rf"^{re.escape(name)}-\d.*\.gem$")
+            version = versions.get(name)
+            if self.mirror:
+                candidates = [
+                    p for p in (self.mirror / "ruby").glob(f"{name}-*.gem") if pattern.match(p.name)
+                ]
+                if version:
+                    candidates = [p for p in candidates if p.name == f"{name}-{version}.gem"]
+                gem = self.newest(candidates)
+                if gem:
+                    shutil.copy2(gem, dest / gem.name)
+            else:
+                self.fetch_cmd(
+                    ["gem", "fetch", name] + (["--version", version] if version else []), cwd=dest
+                )
+                gem = self.newest([p for p in dest.glob(f"{name}-*.gem") if pattern.match(p.name)])
+
+            if gem is None:
+                self.log.warning(f"Gem '{name}' not found, skipping")
+                fetched[name] = None
+                continue
+            fetched[name] = gem.name
+            pending.extend(self.gem_dependencies(dest / gem.name))
+
+        return fetched
+
+    def vendor_crate(self, crate_dir: pathlib.Path) -> bool:
+        """Vendor a crate's dependencies next to its sources with cargo.
+
+        With a mirror, ``mirror/rust`` is used as a cargo local registry: its
+        ``.crate`` files plus an ``index/`` (as written by
+        ``cargo local-registry``) replace crates.io, and a crate that cannot
+        be vendored from it fails the build.
+        """
+        cmd = ["cargo", "vendor", "--versioned-dirs", "--quiet"]
+        if self.mirror:
+            registry = (self.mirror / "rust").resolve()
+            if not (registry / "index").is_dir():
+                self.log.error(f"No cargo registry index in {registry}, cannot vendor {crate_dir.name}")
+                raise ValueError(f"{registry} is not a cargo local registry (missing index/)")
+            cmd += [
+                "--offline",
+                "--config", "source.crates-io.replace-with='start-vm-mirror'",
+                "--config", f"source.start-vm-mirror.local-registry='{registry}'",
+            ]
+        try:
+            self.fetch_cmd(cmd + ["vendor"], cwd=crate_dir)
+        except (OSError, subprocess.CalledProcessError):
+            if self.mirror:
+                raise ValueError(f"Could not vendor dependencies of {crate_dir.name} from {registry}")
+            self.log.warning(f"Could not vendor dependencies of {crate_dir.name}")
+            return False
+        return True
+
+    def download_crate(self, name: str, version: Optional[str], dest: pathlib.Path) -> pathlib.Path:
+        """Download a .crate file from crates.io."""
+        headers = {"User-Agent": "start-vm offline bundle builder"}
+        if not version:
+            request = urllib.request.Request(f"{self.CRATES_API}/{name}", headers=headers)
+            with urllib.request.urlopen(request) as response:
+                version = json.load(response)["crate"]["max_stable_version"]
+        path = dest / f"{name}-{version}.crate"
+        request = urllib.request.Request(f"{self.CRATES_API}/{name}/{version}/download", headers=headers)
+        with urllib.request.urlopen(request) as response, path.open("wb") as fopen:
+            shutil.copyfileobj(response, fopen)
+        return path
+
+    def fetch_rust(self, packages: List[str], dest: pathlib.Path) -> Dict[str, Dict[str, Any]]:
+        """Fetch crate sources and vendor their dependencies."""
+        result = {}
+        for pkg in packages:
+            spec = PackageSpec(pkg, "rust")
+            if self.mirror:
+                crate = self.newest(
+                    [
+                        p for p in (self.mirror / "rust").glob(f"{spec.name}-*.crate")
+                        if re.match(rf"^{re.escape(spec.name)}-\d", p.name)
+                        and (not spec.version or p.name == f"{spec.name}-{spec.version}.crate")
+                    ]
+                )
+                if crate is None:
+                    self.log.error(f"Crate '{spec.name}' not found in {self.mirror / 'rust'}")
+                    raise ValueError(f"Crate '{spec.name}' not found in mirror")
+            else:
+                crate = self.download_crate(spec.name, spec.version, dest)
+
+            # .crate files are gzipped tarballs with a single <name>-<version>/ root
+            with tarfile.open(crate) as archive:
+                root = archive.getnames()[0].split("/")[0]
+                if hasattr(tarfile, "data_filter"):
+                    archive.extractall(dest, filter="data")
+                else:
+                    archive.extractall(dest)
+            if crate.parent == dest:
+                crate.unlink()
+            shutil.rmtree(dest / spec.name, ignore_errors=True)
+            (dest / root).rename(dest / spec.name)
+            result[spec.name] = {
+                "version": root[len(spec.name) + 1:],
+                "vendored": self.vendor_crate(dest / spec.name),
+            }
+        return result
+
+    def build(self):
+        """Fetch every supported package in the recipe and write the archive."""
+        if not self.prefix:
+            self.prefix = "-".join(
+                [
+                    self.recipe["platform"],
+                    self.recipe["os"],
+                    self.recipe["version"],
+                    self.recipe["name"],
+                ]
+            )
+
+        packages = defaultdict(list)
+        for section in self.recipe["sections"]:
+            if not isinstance(section.get("install"), list):
+                continue
+            if section["type"] in self.FETCHERS:
+                packages[section["type"]].extend(section["install"])
+            elif section["type"] not in ("shell", "powershell"):
+                self.log.warning(
+                    f"Section '{section['name']}' ({section['type']}) cannot be bundled offline"
+                )
+
+        path = self.setup / self.target
+        if self.options.dry_run:
+            source = self.mirror or "the network"
+            self.log.info(f"[DRY-RUN] Would write {path} from {source}")
+            for section_type, pkgs in packages.items():
+                self.log.info(f"[DRY-RUN]   - {section_type}: {', '.join(pkgs)}")
+            return
+
+        staging = self.setup / f"{self.prefix}.offline"
+        root = staging / "offline"
+        shutil.rmtree(staging, ignore_errors=True)
+        root.mkdir(parents=True)
+
+        index = {
+            "generated_at": datetime.now().isoformat(),
+            "recipe": self.recipe["name"],
+            "mirror": str(self.mirror) if self.mirror else None,
+        }
+        try:
+            for section_type, pkgs in packages.items():
+                subdir, fetcher = self.FETCHERS[section_type]
+                (root / subdir).mkdir()
+                self.log.info(f"fetching {len(pkgs)} {section_type}")
+                index[subdir] = getattr(self, fetcher)(pkgs, root / subdir)
+            (root / "index.json").write_text(json.dumps(index, indent=2))
+
+            self.log.info("writing %s", path)
+            # Packages are already compressed: an uncompressed tar extracts at disk speed
+            with tarfile.open(path, "w") as archive:
+                archive.add(root, arcname="offline")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.log.info(f"offline bundle: {path.stat().st_size:,} bytes")
+
+    def run(self):
+        self.log.info("extract with: tar -xf %s", self.setup / self.target)
+
+
+class WheelhouseBuilder(Builder):
+    """Builds wheels for a recipe's python packages into ``--wheelhouse DIR`` with ``pip wheel``.
+
+    Wheels are for this host's Python and platform: build on a machine matching the target.
+    """
+
+    @property
+    def wheelhouse(self) -> pathlib.Path:
+        return pathlib.Path(getattr(self.options, "wheelhouse", None) or "wheelhouse")
+
+    def build(self):
+        """Build wheels for every python package in the recipe."""
+        packages = [
+            pkg
+            for section in self.recipe["sections"]
+            if section["type"] == "python_packages" and isinstance(section.get("install"), list)
+            for pkg in section["install"]
+        ]
+        if not packages:
+            self.log.info(f"No python_packages in {self.recipe_yml}")
+            return
+
+        if self.options.dry_run:
+            source = self.mirror or "the package index"
+            self.log.info(f"[DRY-RUN] Would build wheels in {self.wheelhouse} from {source}")
+            self.log.info(f"[DRY-RUN]   - python_packages: {', '.join(packages)}")
+            return
+
+        self.wheelhouse.mkdir(parents=True, exist_ok=True)
+        before = {path.name for path in self.wheelhouse.glob("*.whl")}
+        cmd = [
+            sys.executable, "-m", "pip", "wheel", "--quiet",
+            "--wheel-dir", str(self.wheelhouse), "--find-links", str(self.wheelhouse),
+        ]
+        if self.mirror:
+            cmd += ["--no-index", "--find-links", str(self.mirror / "python")]
+        self.log.info(f"building wheels for {len(packages)} python_packages")
+        self.fetch_cmd(cmd + packages)
+
+        wheels = sorted(path.name for path in self.wheelhouse.glob("*.whl"))
+        added = [name for name in wheels if name not in before]
+        for name in added:
+            self.log.debug("added %s", name)
+        self.log.info(f"wheelhouse {self.wheelhouse}: {len(wheels)} wheels ({len(added)} new)")
+
+    def run(self):
+        self.log.info("install with: setup.py install --wheelhouse %s", self.wheelhouse)
+
+
+def stats_commandline(argv: List[str]) -> int:
+    """``start_vm.py stats``: ingest timing files and report on their history."""
+    parser = argparse.ArgumentParser(
+        prog="start_vm.py stats",
+        description="Provisioning timing history: trends, p50/p95 and regressions",
+    )
+    option = parser.add_argument
+
+    # fmt: off
+    option("timings", nargs="*", type=pathlib.Path, help=f"timing JSON files or directories to ingest (default: {TimingDatabase.DEFAULT_TIMINGS})")
+    option("--check", action="store_true", help="exit with status 1 if a regression is found")
+    option("--db", type=pathlib.Path, default=TimingDatabase.DEFAULT_DB, metavar="FILE", help=f"SQLite database (default: {TimingDatabase.DEFAULT_DB})")
+    option("--host", type=str, help="only report this host")
+    option("--kind", choices=["section", "package", "hook", "script"], default="section", help="step kind to report (default: section)")
+    option("--min-seconds", type=float, default=5.0, metavar="S", help="ignore regressions smaller than S seconds (default: 5)")
+    option("--recipe", type=str, help="only report this recipe")
+    option("--threshold", type=float, default=25.0, metavar="PCT", help="regression threshold over the p50 of earlier runs (default: 25)")
+    # fmt: on
+
+    args = parser.parse_args(argv)
+    timings = args.timings
+    if not timings and TimingDatabase.DEFAULT_TIMINGS.is_dir():
+        timings = [TimingDatabase.DEFAULT_TIMINGS]
+
+    database = TimingDatabase(args.db)
+    try:
+        files, added = database.ingest(timings)
+        database.log.info(f"ingested {added} new run(s) from {files} file(s) into {database.path}")
+        filters = {"recipe": args.recipe, "host": args.host}
+        print(database.generate_report(args.kind, args.threshold, args.min_seconds, **filters))
+        regressions = database.regressions(args.threshold, args.min_seconds, kind=args.kind, **filters)
+    finally:
+        database.close()
+    return 1 if args.check and regressions else 0
+
+
 def commandline():
     """Command line interface."""
+    if sys.argv[1:2] == ["stats"]:
+        sys.exit(stats_commandline(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(description="Install Packages")
     option = parser.add_argument
 
@@ -1016,10 +2390,24 @@ def commandline():
     option("-r", "--run", action="store_true", help="run generated file")
     option("-s", "--strip", default=False, action="store_true", help="strip empty lines")
     option("-v", "--verbose", action="store_true", help="verbose output (for --validate)")
+    option("--bundle", action="store_true", help="generate self-contained Python bundle with dotfiles")
+    option("--build-wheelhouse", action="store_true", help="build wheels for all recipe python packages")
+    option("--buildkit", action="store_true", help="use BuildKit cache mounts in the dockerfile")
     option("--debug", action="store_true", help="enable debug logging")
+    option("--layer-order", choices=["stability", "recipe"], default="stability", help="order of Dockerfile layers (default: stability)")
     option("--lockfile", action="store_true", help="generate lockfile with pinned versions")
+    option("--mirror", type=str, metavar="DIR", help="resolve --offline-bundle/--build-wheelhouse packages from a local mirror")
+    option("--multi-stage", action="store_true", help="build package and build_artifact sections in parallel dockerfile stages")
+    option("--offline-bundle", action="store_true", help="download all recipe packages into an offline archive")
+    option("--packages-index", type=str, metavar="FILE", help="Packages index (glob) for the --slim size estimate")
+    option("--profile", action="store_true", help="write per-phase wall/CPU times as JSON")
+    option("--profile-output", type=str, default="profile.json", metavar="FILE", help="JSON file for --profile (default: profile.json)")
+    option("--profile-trace", type=str, metavar="FILE", help="also write the --profile phases as a Chrome trace-event file")
     option("--section", type=str, help="run section")
+    option("--size-budget", type=str, metavar="SIZE", help="warn when the --slim size estimate exceeds SIZE (e.g. 2G)")
+    option("--slim", action="store_true", help="strip binaries and remove build-only packages from the dockerfile image")
     option("--validate", action="store_true", help="validate config/ and default/ directories")
+    option("--wheelhouse", type=str, default="wheelhouse", metavar="DIR", help="wheel directory for --build-wheelhouse")
     # fmt: on
 
     args = parser.parse_args()
@@ -1043,17 +2431,27 @@ def commandline():
             "the following arguments are required: recipe (unless using --validate)"
         )
 
+    # Never write a report over a recipe
+    for target in (args.profile_output, args.profile_trace):
+        if target and (target.endswith((".yml", ".yaml")) or target in args.recipe):
+            parser.error(f"refusing to write the profile to recipe file {target}")
+
+    profiler = PhaseProfiler() if args.profile or args.profile_trace else None
+
     for recipe in args.recipe:
         if args.section:
-            builder = ShellBuilder(recipe, args)
+            builder = ShellBuilder(recipe, args, profiler)
             builder.run_section(args.section)
 
         if args.docker:
-            builder = DockerFileBuilder(recipe, args)
+            builder = DockerFileBuilder(recipe, args, profiler)
             builder.build()
 
+            if args.run:
+                builder.run()
+
         if args.shell:
-            builder = ShellBuilder(recipe, args)
+            builder = ShellBuilder(recipe, args, profiler)
             builder.build()
 
             if args.lockfile:
@@ -1063,7 +2461,7 @@ def commandline():
                 builder.run()
 
         if args.powershell:
-            builder = PowerShellBuilder(recipe, args)
+            builder = PowerShellBuilder(recipe, args, profiler)
             builder.build()
 
             if args.lockfile:
@@ -1072,8 +2470,23 @@ def commandline():
             if args.run:
                 builder.run()
 
+        if args.offline_bundle:
+            builder = OfflineBundleBuilder(recipe, args, profiler)
+            builder.build()
+
+        if args.build_wheelhouse:
+            builder = WheelhouseBuilder(recipe, args, profiler)
+            builder.build()
+
+        if args.bundle:
+            builder = BundleBuilder(recipe, args, profiler)
+            builder.build()
+
+            if args.run:
+                builder.run()
+
         if args.python:
-            builder = PythonBuilder(recipe, args)
+            builder = PythonBuilder(recipe, args, profiler)
             builder.build()
 
             if args.lockfile:
@@ -1082,6 +2495,13 @@ def commandline():
             if args.run:
                 builder.run()
 
+    if profiler:
+        profiler.write(args.profile_output, args.profile_trace)
+        log = logging.getLogger("profile")
+        for line in profiler.summary():
+            log.info(line)
+        log.info(f"wrote {args.profile_output}" + (f" and {args.profile_trace}" if args.profile_trace else ""))
+
 
 if __name__ == "__main__":
     commandline()
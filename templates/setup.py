@@ -10,15 +10,32 @@ Data-driven architecture with unified operation execution
 """
 
 import argparse
+import hashlib
+import json
+import math
+import os
 import platform
 import re
+import shlex
 import shutil
 import subprocess
 import sys
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Union
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # ============================================================================
 # RECIPE DATA
 # ============================================================================
@@ -36,7 +53,16 @@ PATHS = {
     'default_dir': Path("default"),
     'home_dir': Path.home(),
     'config_dst': Path.home() / ".config",
-    'backup_dir': None,  # Set dynamically with timestamp
+    'backup_root': Path.home() / ".dotfiles_backup",
+    'backup_dir': None,  # Set dynamically to a timestamped snapshot
+    'timings': Path.home() / ".dotfiles_backup" / "timings",
+    'manifest': Path.home() / ".local" / "state" / "start-vm" / "{{name}}.manifest.json",
+    'prefetch_dir': Path.home() / ".cache" / "start-vm" / "prefetch",
+    'wheelhouse': Path("wheelhouse"),
+    'cargo_bin': Path(os.environ.get('CARGO_HOME', Path.home() / ".cargo")) / "bin",
+    'cargo_target': Path.home() / ".cache" / "start-vm" / "cargo-target",
+    'ccache_dir': Path(os.environ.get('CCACHE_DIR', Path.home() / ".cache" / "start-vm" / "ccache")),
+    'artifacts': Path.home() / ".cache" / "start-vm" / "artifacts",
 }
 
 FILE_SETS = {{file_sets_data}}
@@ -56,26 +82,61 @@ class OperationRegistry:
             'install_cmd': lambda pkgs: ["sudo", "apt-get", "install", "-y"] + pkgs,
             'uninstall_cmd': lambda pkgs: ["sudo", "apt-get", "remove", "-y"] + pkgs,
             'purge_cmd': lambda pkgs: ["sudo", "apt-get", "purge", "-y"] + pkgs,
+            'list_cmd': ["dpkg-query", "-W", "-f=${db:Status-Status} ${Package}\n"],
+            'list_parse': lambda line: line.split()[1] if line.startswith('installed ') else None,
+            'offline_cmd': lambda pkgs, bundle: ["sudo", "apt-get", "install", "-y", "--no-download"]
+                                                + bundle.debs(pkgs),
+            # A private archive directory per section, so the system cache stays free for
+            # installs; -n: never prompt from the background
+            'prefetch_cmd': lambda pkgs, dest: ["sudo", "-n", "apt-get", "install", "-y",
+                                                "--download-only", "-o",
+                                                f"Dir::Cache::archives={dest}"] + pkgs,
+            'prefetched_cmd': lambda pkgs, dest: ["sudo", "apt-get", "install", "-y", "-o",
+                                                  f"Dir::Cache::archives={dest}"] + pkgs,
             'batch': True,
         },
         'python_packages': {
             'install_cmd': lambda pkgs: [sys.executable, "-m", "pip", "install"] + pkgs,
             'uninstall_cmd': lambda pkgs: [sys.executable, "-m", "pip", "uninstall", "-y"] + pkgs,
+            'list_cmd': [sys.executable, "-m", "pip", "list", "--format=freeze"],
+            'list_parse': lambda line: re.split(r'[=@ ]', line)[0],
+            'offline_cmd': lambda pkgs, bundle: [sys.executable, "-m", "pip", "install", "--no-index",
+                                                 "--find-links", str(bundle.root / "python")] + pkgs,
+            'prefetch_cmd': lambda pkgs, dest: [sys.executable, "-m", "pip", "download", "--quiet",
+                                                "--dest", str(dest)] + pkgs,
+            'prefetched_cmd': lambda pkgs, dest: [sys.executable, "-m", "pip", "install",
+                                                  "--find-links", str(dest)] + pkgs,
+            'wheelhouse_cmd': lambda pkgs, wheelhouse: [sys.executable, "-m", "pip", "install",
+                                                        "--no-index", "--find-links",
+                                                        str(wheelhouse)] + pkgs,
             'batch': True,
         },
         'ruby_packages': {
             'install_cmd': lambda pkg: ["gem", "install", pkg],
             'uninstall_cmd': lambda pkg: ["gem", "uninstall", "-x", pkg],
+            'list_cmd': ["gem", "list", "--no-versions"],
+            'list_parse': lambda line: line.strip(),
+            # --local resolves dependencies from .gem files in the working directory
+            'offline_cmd': lambda pkg, bundle: f"cd {shlex.quote(str(bundle.root / 'ruby'))} && "
+                                               f"gem install --local --no-document "
+                                               f"{shlex.quote(bundle.name(pkg))}",
             'batch': False,
         },
         'rust_packages': {
             'install_cmd': lambda pkg: ["cargo", "install", pkg],
             'uninstall_cmd': lambda pkg: ["cargo", "uninstall", pkg],
+            'list_cmd': ["cargo", "install", "--list"],
+            'list_parse': lambda line: None if line[:1].isspace() else line.split()[0],
+            'offline_cmd': lambda pkg, bundle: bundle.crate_cmd(pkg),
             'batch': False,
         },
         'homebrew_packages': {
             'install_cmd': lambda pkgs: ["brew", "install"] + pkgs,
             'uninstall_cmd': lambda pkgs: ["brew", "uninstall"] + pkgs,
+            'list_cmd': ["brew", "list", "-1"],
+            'list_parse': lambda line: line.strip(),
+            'prefetch_cmd': lambda pkgs, dest: ["brew", "fetch", "--deps"] + pkgs,
+            'prefetch_cache': lambda dest: None,  # brew manages its own cache
             'batch': True,
         },
         'winget_packages': {
@@ -86,6 +147,8 @@ class OperationRegistry:
         'chocolatey_packages': {
             'install_cmd': lambda pkgs: ["choco", "install", "-y"] + pkgs,
             'uninstall_cmd': lambda pkgs: ["choco", "uninstall", "-y"] + pkgs,
+            'list_cmd': ["choco", "list", "--limit-output"],
+            'list_parse': lambda line: line.split('|')[0],
             'batch': True,
         },
         'shell': {
@@ -102,18 +165,28 @@ class OperationRegistry:
     FILE_OPS = {
         'copy': {
             'check': lambda src, dst: src.exists(),
-            'exec': lambda src, dst: shutil.copytree(src, dst) if src.is_dir()
-                                      else shutil.copy2(src, dst),
-            'prep': lambda src, dst: shutil.rmtree(dst) if dst.exists() and src.is_dir() else None,
+            'plan': lambda sync, src, dst: sync.plan(src, dst),
+            'exec': lambda sync, plan, progress=None: sync.apply(plan, progress),
+        },
+        'link': {
+            'check': lambda src, dst: src.exists(),
+            'current': lambda target, dst: dst.is_symlink() and dst.resolve() == target,
+            'clear': lambda dst: shutil.rmtree(dst) if dst.is_dir() and not dst.is_symlink()
+                                 else dst.unlink(),
+            'exec': lambda target, dst: dst.symlink_to(target, target_is_directory=target.is_dir()),
         },
         'remove': {
             'check': lambda path: path.exists(),
             'exec': lambda path: shutil.rmtree(path) if path.is_dir() else path.unlink(),
         },
+        'unlink': {
+            'check': lambda path, root: path.is_symlink() and (
+                path.resolve() == root or root in path.resolve().parents),
+            'exec': lambda path: path.unlink(),
+        },
         'backup': {
-            'check': lambda path: path.exists(),
-            'exec': lambda src, dst: shutil.copytree(src, dst, dirs_exist_ok=True) if src.is_dir()
-                                      else shutil.copy2(src, dst),
+            'check': lambda path: path.exists() or path.is_symlink(),
+            'exec': lambda store, src, dst, progress=None: store.add(src, dst, progress),
         },
     }
 
@@ -135,6 +208,1438 @@ class OperationRegistry:
         },
     }
 
+# ============================================================================
+# COPY POOL (Parallel file operations)
+# ============================================================================
+
+class CopyPool:
+    """Thread pool for file copies, with progress in submission order and one
+    ``shutil.Error`` collecting every failure."""
+
+    DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.workers = max(workers, 1)
+
+    def run(self, func: Callable, items: list, label: Callable = str,
+            progress: Optional[Callable] = None) -> list:
+        """Apply func to every item, returning results in item order."""
+        results, errors = [], []
+
+        def collect(index: int, item: Any, get_result: Callable) -> None:
+            try:
+                results.append(get_result())
+            except OSError as e:
+                errors.append((label(item), str(e)))
+            if progress:
+                progress(index + 1, len(items), label(item))
+
+        if self.workers == 1 or len(items) < 2:
+            for index, item in enumerate(items):
+                collect(index, item, lambda: func(item))
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as pool:
+                futures = [pool.submit(func, item) for item in items]
+                for index, (item, future) in enumerate(zip(items, futures)):
+                    collect(index, item, future.result)
+
+        if errors:
+            raise shutil.Error(errors)
+        return results
+
+# ============================================================================
+# SYNC ENGINE (Incremental file installation)
+# ============================================================================
+
+class SyncEngine:
+    """Incremental tree sync: copies changed files and deletes stale ones.
+
+    Files are compared by size and mtime (or by content hash when
+    ``checksum`` is set). Copies use ``shutil.copy2`` so mtimes are
+    preserved and unchanged files are skipped on the next run.
+    """
+
+    STAT_KEYS = ('copied', 'skipped', 'deleted', 'bytes_copied', 'bytes_skipped')
+
+    def __init__(self, checksum: bool = False, pool: Optional[CopyPool] = None):
+        self.checksum = checksum
+        self.pool = pool or CopyPool(workers=1)
+        self.stats = {key: 0 for key in self.STAT_KEYS}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_digest(path: Path) -> str:
+        """Return the sha256 hex digest of a file."""
+        digest = hashlib.sha256()
+        with path.open('rb') as fopen:
+            for chunk in iter(lambda: fopen.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def is_current(self, src: Path, dst: Path) -> bool:
+        """Check whether dst already holds the same content as src."""
+        try:
+            src_stat, dst_stat = src.stat(), dst.lstat()
+        except OSError:
+            return False
+        if dst.is_symlink() or not dst.is_file():
+            return False
+        if src_stat.st_size != dst_stat.st_size:
+            return False
+        if self.checksum:
+            return self.file_digest(src) == self.file_digest(dst)
+        return int(src_stat.st_mtime) == int(dst_stat.st_mtime)
+
+    def plan(self, src: Path, dst: Path) -> Dict[str, list]:
+        """Compute the changes needed to make dst mirror src (read-only)."""
+        plan = {'dirs': [], 'copy': [], 'skip': [], 'delete': []}
+
+        if not src.is_dir():
+            if dst.is_dir() and not dst.is_symlink():
+                plan['delete'].append(dst)
+            key = 'skip' if self.is_current(src, dst) else 'copy'
+            plan[key].append((src, dst))
+            return plan
+
+        if dst.is_symlink() or (dst.exists() and not dst.is_dir()):
+            plan['delete'].append(dst)
+        elif dst.is_dir():
+            # Anything in dst without a same-typed counterpart in src is stale
+            for dirpath, dirnames, filenames in os.walk(dst):
+                rel = Path(dirpath).relative_to(dst)
+                for dirname in list(dirnames):
+                    if not (src / rel / dirname).is_dir():
+                        plan['delete'].append(Path(dirpath) / dirname)
+                        dirnames.remove(dirname)
+                for filename in filenames:
+                    if not (src / rel / filename).is_file():
+                        plan['delete'].append(Path(dirpath) / filename)
+
+        for dirpath, dirnames, filenames in os.walk(src):
+            rel = Path(dirpath).relative_to(src)
+            plan['dirs'].append(dst / rel)
+            for filename in sorted(filenames):
+                pair = (Path(dirpath) / filename, dst / rel / filename)
+                key = 'skip' if self.is_current(*pair) else 'copy'
+                plan[key].append(pair)
+
+        return plan
+
+    @staticmethod
+    def is_noop(plan: Dict[str, list]) -> bool:
+        """Check whether a plan leaves the destination untouched."""
+        return (not plan['copy'] and not plan['delete']
+                and all(path.is_dir() for path in plan['dirs']))
+
+    def copy_file(self, pair: tuple) -> None:
+        """Copy one (src, dst) pair, replacing a symlink at dst."""
+        src, dst = pair
+        if dst.is_symlink():
+            dst.unlink()
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src, dst)
+        with self._lock:
+            self.stats['copied'] += 1
+            self.stats['bytes_copied'] += src.stat().st_size
+
+    def apply(self, plan: Dict[str, list], progress: Optional[Callable] = None) -> None:
+        """Apply a plan produced by ``plan()``: delete, create dirs, copy."""
+        for path in plan['delete']:
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+            self.stats['deleted'] += 1
+
+        for path in plan['dirs']:
+            path.mkdir(parents=True, exist_ok=True)
+
+        for src, _ in plan['skip']:
+            self.stats['skipped'] += 1
+            self.stats['bytes_skipped'] += src.stat().st_size
+
+        self.pool.run(self.copy_file, plan['copy'], label=lambda pair: str(pair[1]),
+                      progress=progress)
+
+# ============================================================================
+# BACKUP STORE (Content-addressed, deduplicated snapshots)
+# ============================================================================
+
+class BackupStore:
+    """Backup snapshots under ``root``, whose files are hardlinked to content-addressed objects.
+
+    ``gc()`` applies the retention policy and drops objects no snapshot links to.
+    """
+
+    INDEX = 'index.json'
+    FICLONE = 0x40049409  # Linux reflink ioctl
+
+    def __init__(self, root: Path, keep: int = 10,
+                 max_age_days: Optional[int] = None,
+                 pool: Optional[CopyPool] = None):
+        self.root = root
+        self.keep = max(keep, 1)
+        self.max_age_days = max_age_days
+        self.pool = pool or CopyPool(workers=1)
+        self._index = None
+        self._lock = threading.Lock()
+        self.stats = {'files': 0, 'linked': 0, 'stored': 0, 'bytes_stored': 0,
+                      'pruned_snapshots': 0, 'pruned_objects': 0}
+
+    @property
+    def snapshots_dir(self) -> Path:
+        return self.root / 'snapshots'
+
+    @property
+    def objects_dir(self) -> Path:
+        return self.root / 'objects'
+
+    def new_snapshot(self) -> Path:
+        """Return the path of a new timestamped snapshot directory."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return self.snapshots_dir / timestamp
+
+    @classmethod
+    def clone_file(cls, src: Path, dst: Path) -> None:
+        """Copy file data via reflink or copy_file_range when available."""
+        with src.open('rb') as fsrc, dst.open('wb') as fdst:
+            if fcntl is not None and sys.platform.startswith('linux'):
+                try:
+                    fcntl.ioctl(fdst.fileno(), cls.FICLONE, fsrc.fileno())
+                    return
+                except OSError:
+                    pass
+            if hasattr(os, 'copy_file_range'):
+                try:
+                    remaining = os.fstat(fsrc.fileno()).st_size
+                    while remaining > 0:
+                        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                    return
+                except OSError:
+                    fsrc.seek(0)
+                    fdst.seek(0)
+                    fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+    def load_index(self) -> Dict[str, list]:
+        """Load the stat -> digest cache, tolerating a missing or bad file."""
+        if self._index is None:
+            try:
+                self._index = json.loads((self.root / self.INDEX).read_text())
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def save_index(self) -> None:
+        """Persist the stat -> digest cache."""
+        if self._index is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                data = json.dumps(self._index)
+            (self.root / self.INDEX).write_text(data)
+
+    def digest(self, path: Path, st: os.stat_result) -> str:
+        """Return the file digest, reusing the cached one if stat is unchanged."""
+        key = str(path.absolute())
+        signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+        with self._lock:
+            cached = self.load_index().get(key)
+        if cached and cached[:3] == signature:
+            return cached[3]
+        digest = SyncEngine.file_digest(path)
+        with self._lock:
+            self._index[key] = signature + [digest]
+        return digest
+
+    def store_object(self, path: Path, st: os.stat_result) -> Path:
+        """Add file content to the object store, returning the object path."""
+        # Objects are keyed by content and read-only permission bits
+        mode = st.st_mode & 0o7555
+        name = f"{self.digest(path, st)}.{mode:o}"
+        obj = self.objects_dir / name[:2] / name
+        if obj.exists():
+            with self._lock:
+                self.stats['linked'] += 1
+            return obj
+
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = obj.with_name(f"{obj.name}.{threading.get_ident()}.tmp")
+        self.clone_file(path, tmp)
+        shutil.copystat(path, tmp)
+        tmp.chmod(mode)
+        with self._lock:
+            # Another worker may have stored the same content meanwhile
+            if obj.exists():
+                tmp.unlink()
+                self.stats['linked'] += 1
+                return obj
+            os.replace(tmp, obj)
+            self.stats['stored'] += 1
+            self.stats['bytes_stored'] += st.st_size
+        return obj
+
+    def add_file(self, src: Path, dst: Path) -> None:
+        """Back up a single file (or symlink) to dst."""
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if dst.exists() or dst.is_symlink():
+            dst.unlink()
+        with self._lock:
+            self.stats['files'] += 1
+        if src.is_symlink():
+            os.symlink(os.readlink(src), dst)
+            return
+
+        obj = self.store_object(src, src.stat())
+        try:
+            os.link(obj, dst)
+        except OSError:
+            # Hardlinks unsupported here: fall back to a (reflinked) copy
+            self.clone_file(obj, dst)
+            shutil.copystat(obj, dst)
+
+    def add(self, src: Path, dst: Path, progress: Optional[Callable] = None) -> None:
+        """Back up a file or directory tree to dst inside a snapshot."""
+        self.load_index()
+        if src.is_symlink() or not src.is_dir():
+            self.add_file(src, dst)
+            return
+
+        pairs = []
+        for dirpath, dirnames, filenames in os.walk(src):
+            rel = Path(dirpath).relative_to(src)
+            (dst / rel).mkdir(parents=True, exist_ok=True)
+            for name in [d for d in dirnames if (Path(dirpath) / d).is_symlink()] + filenames:
+                pairs.append((Path(dirpath) / name, dst / rel / name))
+
+        self.pool.run(lambda pair: self.add_file(*pair), pairs,
+                      label=lambda pair: str(pair[0]), progress=progress)
+
+    def snapshot_age_days(self, snapshot: Path) -> float:
+        """Age of a snapshot, from its timestamp name or its mtime."""
+        try:
+            created = datetime.strptime(snapshot.name, "%Y%m%d_%H%M%S")
+        except ValueError:
+            created = datetime.fromtimestamp(snapshot.stat().st_mtime)
+        return (datetime.now() - created).total_seconds() / 86400
+
+    def gc(self) -> None:
+        """Apply the retention policy and remove unreferenced objects."""
+        if not self.snapshots_dir.is_dir():
+            return
+
+        snapshots = sorted(p for p in self.snapshots_dir.iterdir() if p.is_dir())
+        expired = snapshots[:-self.keep]
+        if self.max_age_days is not None:
+            # The newest snapshot is always kept
+            expired += [p for p in snapshots[-self.keep:-1]
+                        if self.snapshot_age_days(p) > self.max_age_days]
+
+        for snapshot in expired:
+            shutil.rmtree(snapshot)
+            self.stats['pruned_snapshots'] += 1
+
+        # Objects whose only link is the store itself are garbage
+        if self.objects_dir.is_dir():
+            for obj in self.objects_dir.glob('*/*'):
+                if obj.stat().st_nlink == 1:
+                    obj.unlink()
+                    self.stats['pruned_objects'] += 1
+            for fanout in self.objects_dir.iterdir():
+                if fanout.is_dir() and not any(fanout.iterdir()):
+                    fanout.rmdir()
+
+# ============================================================================
+# INSTALL MANIFEST (Exact uninstall)
+# ============================================================================
+
+class InstallManifest:
+    """Files, links, dirs and packages install wrote, so uninstall removes exactly those.
+
+    Edited files and packages of ``unknown`` prior presence are only removed with ``force``.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, pool: Optional[CopyPool] = None):
+        self.path = path
+        self.pool = pool or CopyPool(workers=1)
+        self.data = self.empty()
+        self.loaded = False
+        self._lock = threading.Lock()
+        self.stats = {'removed': 0, 'links': 0, 'dirs': 0, 'modified': 0, 'missing': 0}
+
+    @classmethod
+    def empty(cls) -> Dict[str, Any]:
+        return {'version': cls.VERSION, 'recipe': RECIPE['name'],
+                'files': {}, 'links': {}, 'dirs': {}, 'packages': {}}
+
+    def load(self) -> bool:
+        """Load an existing manifest, returning whether one was found."""
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != self.VERSION:
+            return False
+        self.data = {**self.empty(), **data}
+        self.loaded = True
+        return True
+
+    def is_empty(self) -> bool:
+        return not any(self.data[key] for key in ('files', 'links', 'dirs', 'packages'))
+
+    def save(self) -> None:
+        """Write the manifest atomically, or delete it once nothing is left."""
+        if self.is_empty():
+            if self.path.exists():
+                self.path.unlink()
+            return
+        with self._lock:
+            self.data['updated'] = datetime.now().isoformat(timespec='seconds')
+            text = json.dumps(self.data, indent=2, sort_keys=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(text)
+        os.replace(tmp, self.path)
+
+    def forget(self, path: Path) -> None:
+        """Drop every record at or below path."""
+        key = str(path.absolute())
+        prefix = key + os.sep
+        for kind in ('files', 'links', 'dirs'):
+            records = self.data[kind]
+            for stale in [k for k in records if k == key or k.startswith(prefix)]:
+                del records[stale]
+
+    def file_record(self, path: Path, owner: Dict[str, str]) -> tuple:
+        """Return (key, record) for an installed file, reusing unchanged hashes."""
+        key = str(path.absolute())
+        st = path.stat()
+        previous = self.data['files'].get(key)
+        if previous and [previous['size'], previous['mtime_ns']] == [st.st_size, st.st_mtime_ns]:
+            digest = previous['sha256']
+        else:
+            digest = SyncEngine.file_digest(path)
+        return key, {**owner, 'sha256': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def record_tree(self, file_set: str, entry: str, plan: Dict[str, list],
+                    created_dirs: List[Path]) -> None:
+        """Record the outcome of an applied sync plan."""
+        owner = {'set': file_set, 'entry': entry}
+        for path in plan['delete']:
+            self.forget(path)
+        for path in created_dirs:
+            self.data['dirs'][str(path.absolute())] = dict(owner)
+        dsts = [dst for _, dst in plan['copy'] + plan['skip']]
+        records = self.pool.run(lambda path: self.file_record(path, owner), dsts)
+        with self._lock:
+            for path in dsts:
+                self.data['links'].pop(str(path.absolute()), None)
+            self.data['files'].update(records)
+
+    def record_link(self, file_set: str, entry: str, path: Path, target: Path) -> None:
+        """Record a symlink created by link mode."""
+        with self._lock:
+            self.forget(path)
+            self.data['links'][str(path.absolute())] = {
+                'set': file_set, 'entry': entry, 'target': str(target)}
+
+    def record_files(self, file_set: str, entry: str, paths: List[Path]) -> None:
+        """Record files install placed outside a sync (restored binaries)."""
+        owner = {'set': file_set, 'entry': entry}
+        records = [self.file_record(path, owner) for path in paths]
+        with self._lock:
+            for path in paths:
+                self.data['links'].pop(str(path.absolute()), None)
+            self.data['files'].update(records)
+
+    def record_packages(self, section_type: str, installed: List[str],
+                        present: List[str], unknown: Optional[List[str]] = None) -> None:
+        """Record which packages install added, which were already there, and
+        which it installed without knowing whether they were."""
+        with self._lock:
+            self._record_packages(section_type, installed, present, unknown)
+
+    def _record_packages(self, section_type: str, installed: List[str],
+                         present: List[str], unknown: Optional[List[str]]) -> None:
+        record = self.data['packages'].setdefault(section_type, {'installed': [], 'present': []})
+        owned = set(record['installed']) | set(installed)
+        record['installed'] = sorted(owned)
+        record['present'] = sorted((set(record['present']) | set(present)) - owned)
+        unknown = (set(record.get('unknown', [])) | set(unknown or [])) - owned - set(record['present'])
+        if unknown:
+            record['unknown'] = sorted(unknown)
+        else:
+            record.pop('unknown', None)
+
+    def owned_packages(self, section_type: str) -> set:
+        """Packages of this type that install added."""
+        return set(self.data['packages'].get(section_type, {}).get('installed', []))
+
+    def unknown_packages(self, section_type: str) -> set:
+        """Packages of this type installed without knowing whether they were present."""
+        return set(self.data['packages'].get(section_type, {}).get('unknown', []))
+
+    def forget_packages(self, section_type: str, names: List[str]) -> None:
+        with self._lock:
+            record = self.data['packages'].get(section_type)
+            if not record:
+                return
+            for key in ('installed', 'present', 'unknown'):
+                if key in record:
+                    record[key] = sorted(set(record[key]) - set(names))
+            if not record.get('unknown'):
+                record.pop('unknown', None)
+            if not record['installed'] and not record['present'] and 'unknown' not in record:
+                del self.data['packages'][section_type]
+
+    def is_unmodified(self, path: Path, record: Dict[str, Any]) -> bool:
+        """Check whether an installed file still holds the recorded content."""
+        st = path.lstat()
+        if path.is_symlink() or not path.is_file() or st.st_size != record['size']:
+            return False
+        return (st.st_mtime_ns == record['mtime_ns']
+                or SyncEngine.file_digest(path) == record['sha256'])
+
+    def remove_file(self, key: str, force: bool = False) -> str:
+        """Remove one recorded file; returns 'removed', 'modified' or 'missing'."""
+        path = Path(key)
+        if not (path.exists() or path.is_symlink()):
+            return 'missing'
+        if not force and not self.is_unmodified(path, self.data['files'][key]):
+            return 'modified'
+        path.unlink()
+        return 'removed'
+
+    def entries(self, kind: str, file_set: str) -> List[str]:
+        return sorted(k for k, v in self.data[kind].items() if v['set'] == file_set)
+
+    def remove(self, file_set: str, force: bool = False,
+               progress: Optional[Callable] = None) -> List[str]:
+        """Remove everything recorded for a file set, returning kept paths."""
+        kept = []
+        keys = self.entries('files', file_set)
+        outcomes = self.pool.run(lambda key: self.remove_file(key, force), keys,
+                                 progress=progress)
+        for key, outcome in zip(keys, outcomes):
+            self.stats[outcome] += 1
+            if outcome == 'modified':
+                kept.append(key)
+            else:
+                del self.data['files'][key]
+
+        for key in self.entries('links', file_set):
+            path = Path(key)
+            if path.is_symlink() and os.readlink(path) == self.data['links'][key]['target']:
+                path.unlink()
+                self.stats['links'] += 1
+            elif path.exists() or path.is_symlink():
+                # Replaced by something else since install
+                kept.append(key)
+                continue
+            del self.data['links'][key]
+
+        # Deepest first so parents are empty by the time they are reached
+        for key in sorted(self.entries('dirs', file_set), key=lambda k: k.count(os.sep),
+                          reverse=True):
+            path = Path(key)
+            try:
+                path.rmdir()
+                self.stats['dirs'] += 1
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Still holds files: keep the record only while some are ours
+                if any(k.startswith(key + os.sep) for k in kept):
+                    continue
+            del self.data['dirs'][key]
+
+        return kept
+
+# ============================================================================
+# OFFLINE BUNDLE (Installs without network access)
+# ============================================================================
+
+class OfflineBundle:
+    """Extracted archive written by ``start_vm.py --offline-bundle``.
+
+    ``root`` holds ``index.json`` plus ``debian/``, ``python/``, ``ruby/``
+    and ``rust/``. Package managers with an ``offline_cmd`` install from
+    here instead of downloading.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root.resolve()
+        self.index = json.loads((self.root / 'index.json').read_text())
+
+    @staticmethod
+    def name(spec: str) -> str:
+        return re.split(r'[=<>:@~!]+', spec)[0]
+
+    def debs(self, pkgs: List[str]) -> List[str]:
+        """Absolute .deb paths covering the packages and their dependencies."""
+        debs = []
+        for pkg in pkgs:
+            closure = self.root / 'debian' / f"{self.name(pkg)}.closure"
+            for deb in closure.read_text().split():
+                path = str(self.root / 'debian' / deb)
+                if path not in debs:
+                    debs.append(path)
+        return debs
+
+    def crate_cmd(self, pkg: str) -> List[str]:
+        """cargo install from bundled sources, using vendored dependencies."""
+        crate = self.root / 'rust' / self.name(pkg)
+        cmd = ["cargo", "install", "--offline", "--path", str(crate)]
+        if (crate / 'vendor').is_dir():
+            cmd += ["--config", "source.crates-io.replace-with='vendored-sources'",
+                    "--config", f"source.vendored-sources.directory='{crate / 'vendor'}'"]
+        return cmd
+
+# ============================================================================
+# GIT MIRRORS (Local clone cache for shell sections)
+# ============================================================================
+
+class GitMirror:
+    """Bare mirrors under ``<root>/<host>/<path>.git`` that ``shell`` sections clone through.
+
+    Shallow and partial clones, and mirrors that cannot be updated, go straight to the network.
+    """
+
+    REMOTE = re.compile(r'^([a-z][a-z0-9+.-]*://|[^/:@]+@[^/:]+:)')
+    RECURSE = ('--recurse-submodules', '--recursive')
+    # Options that fetch less than a full mirror would
+    SHALLOW = ('--depth', '--shallow-since', '--shallow-exclude', '--shallow-submodules', '--filter')
+    # Options of git clone that take a separate value
+    VALUE_OPTS = {'-b', '--branch', '-o', '--origin', '-u', '--upload-pack', '-c', '--config',
+                  '--reference', '--reference-if-able', '--depth', '--shallow-since',
+                  '--shallow-exclude', '--separate-git-dir', '--template', '-j', '--jobs',
+                  '--filter', '--server-option'}
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, url: str) -> Path:
+        """Mirror location for a remote URL."""
+        rest = re.sub(r'^[a-z][a-z0-9+.-]*://', '', url)
+        rest = re.sub(r'^[^@/]*@', '', rest).replace(':', '/', 1)
+        parts = [part for part in rest.split('/') if part not in ('', '.', '..')]
+        name = parts.pop()
+        return self.root.joinpath(*parts, name if name.endswith('.git') else f"{name}.git")
+
+    def update(self, url: str) -> Optional[Path]:
+        """Create or fetch the mirror of url; None if it is unusable."""
+        path = self.path(url)
+        if (path / 'HEAD').exists():
+            result = subprocess.run(["git", "--git-dir", str(path), "fetch", "--prune", "--quiet"])
+            if result.returncode:
+                # A stale mirror still saves most of the download
+                print(f"Could not update mirror {path}, using it as is", file=sys.stderr)
+            return path
+        staging = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if subprocess.run(["git", "clone", "--mirror", "--quiet", url, str(staging)]).returncode:
+            shutil.rmtree(staging, ignore_errors=True)
+            print(f"Could not mirror {url}, cloning without a mirror", file=sys.stderr)
+            return None
+        try:
+            os.replace(staging, path)
+        except OSError:
+            # Another run created the same mirror first
+            shutil.rmtree(staging, ignore_errors=True)
+        return path
+
+    @staticmethod
+    def resolve(base: str, url: str) -> str:
+        """Resolve a relative submodule URL against its superproject's URL."""
+        if not url.startswith(('./', '../')):
+            return url
+        base = base.rstrip('/')
+        while url.startswith(('./', '../')):
+            if url.startswith('../'):
+                base = base.rsplit('/', 1)[0]
+            url = url.split('/', 1)[1]
+        return f"{base}/{url}"
+
+    @staticmethod
+    def submodules(worktree: Path) -> List[tuple]:
+        """(path, url) of each submodule declared in a checkout's .gitmodules."""
+        if not (worktree / '.gitmodules').exists():
+            return []
+        out = subprocess.run(["git", "config", "-f", str(worktree / '.gitmodules'), "-z",
+                              "--get-regexp", r"^submodule\..*\.(path|url)$"],
+                             capture_output=True, text=True).stdout
+        modules: Dict[str, Dict[str, str]] = {}
+        for record in filter(None, out.split('\0')):
+            key, _, value = record.partition('\n')
+            name, _, field = key[len('submodule.'):].rpartition('.')
+            modules.setdefault(name, {})[field] = value
+        return [(m['path'], m['url']) for m in modules.values() if 'path' in m and 'url' in m]
+
+    def update_submodules(self, worktree: Path, url: str) -> int:
+        """Check out a clone's submodules, recursively, from their mirrors."""
+        for path, sub_url in self.submodules(worktree):
+            sub_url = self.resolve(url, sub_url)
+            mirror = self.update(sub_url) if self.REMOTE.match(sub_url) else None
+            reference = ["--reference", str(mirror), "--dissociate"] if mirror else []
+            cmd = ["git", "-C", str(worktree), "submodule", "update", "--init"] + reference
+            returncode = subprocess.run(cmd + ["--", path]).returncode
+            if returncode or self.update_submodules(worktree / path, sub_url):
+                return returncode or 1
+        return 0
+
+    @classmethod
+    def parse(cls, args: List[str]) -> tuple:
+        """(positional arguments, branch) of a ``git clone`` command line."""
+        positional, branch, option = [], None, None
+        for arg in args:
+            if option:
+                if option in ('-b', '--branch'):
+                    branch = arg
+                option = None
+            elif arg in cls.VALUE_OPTS:
+                option = arg
+            elif arg.startswith('--branch='):
+                branch = arg.split('=', 1)[1]
+            elif not arg.startswith('-'):
+                positional.append(arg)
+        return positional, branch
+
+    @classmethod
+    def clones(cls, script: str) -> List[tuple]:
+        """(url, branch) of each remote a shell script clones."""
+        found = []
+        script = script.replace('\\\n', ' ')  # join continued lines
+        for match in re.finditer(r'\bgit\s+clone\b([^;&|\n]*)', script):
+            try:
+                positional, branch = cls.parse(shlex.split(match.group(1)))
+            except ValueError:
+                continue
+            if positional and cls.REMOTE.match(positional[0]):
+                found.append((positional[0], branch))
+        return found
+
+    def clone(self, args: List[str], cwd: Optional[Path] = None) -> int:
+        """Run ``git clone <args>`` through the mirror cache."""
+        positional = self.parse(args)[0]
+        url = positional[0] if positional else ''
+        shallow = any(arg.split('=', 1)[0] in self.SHALLOW for arg in args)
+        mirror = self.update(url) if self.REMOTE.match(url) and not shallow else None
+        if mirror is None:
+            return subprocess.run(["git", "clone"] + args, cwd=cwd).returncode
+
+        recurse = any(arg in self.RECURSE for arg in args)
+        args = [arg for arg in args if arg not in self.RECURSE]
+        cmd = ["git", "clone", "--reference-if-able", str(mirror), "--dissociate"] + args
+        returncode = subprocess.run(cmd, cwd=cwd).returncode
+        if returncode or not recurse:
+            return returncode
+        dest = positional[1] if len(positional) > 1 else self.humanish(url)
+        return self.update_submodules(Path(cwd or '.') / dest, url)
+
+    @staticmethod
+    def humanish(url: str) -> str:
+        """Directory name git clone picks when none is given."""
+        name = re.split(r'[/:]', url.rstrip('/'))[-1]
+        return name[:-4] if name.endswith('.git') else name
+
+    def preamble(self) -> str:
+        """Shell prologue sending a script's ``git clone`` through clone()."""
+        entry = ' '.join(shlex.quote(str(arg)) for arg in
+                         (sys.executable, Path(__file__).resolve(), 'git-clone', self.root))
+        # Written without doubled braces: this file is a Jinja template
+        return ('git() { if [ "$1" = clone ]; then shift; ' + entry + ' "$@"; '
+                'else command git "$@"; fi; }\n')
+
+# ============================================================================
+# COMPILER CACHE (ccache for source builds in shell sections)
+# ============================================================================
+
+class CompilerCache:
+    """ccache settings for ``shell`` sections marked ``build_cache: true``: a compiler
+    launcher for CMake, ``CC="ccache cc"`` for other builds."""
+
+    HIT_KEYS = ('direct_cache_hit', 'preprocessed_cache_hit')
+    MISS_KEYS = ('cache_miss',)
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        self.baseline: Optional[Dict[str, int]] = None
+
+    @property
+    def ccache(self) -> Optional[str]:
+        # Looked up at build time: an earlier section may have installed it
+        return shutil.which('ccache')
+
+    def env(self, script: str) -> Dict[str, str]:
+        """Variables that route a build script's compiles through ccache."""
+        env = {'CCACHE_DIR': str(self.cache_dir), 'CCACHE_UMASK': '002'}
+        if 'cmake' in script:
+            env['CMAKE_C_COMPILER_LAUNCHER'] = env['CMAKE_CXX_COMPILER_LAUNCHER'] = 'ccache'
+        else:
+            env['CC'] = f"ccache {os.environ.get('CC', 'cc')}"
+            env['CXX'] = f"ccache {os.environ.get('CXX', 'c++')}"
+        if 'MAKEFLAGS' not in os.environ:
+            env['MAKEFLAGS'] = f"-j{os.cpu_count() or 1}"
+        return env
+
+    @staticmethod
+    def preamble(env: Dict[str, str]) -> str:
+        """Shell prologue keeping the cache settings across sudo."""
+        # Written without doubled braces: this file is a Jinja template
+        return 'sudo() { command sudo --preserve-env=' + ','.join(env) + ' "$@"; }\n'
+
+    def counters(self) -> Optional[Dict[str, int]]:
+        """Hit and miss counters from ``ccache --print-stats``."""
+        try:
+            out = subprocess.run([self.ccache or 'ccache', '--print-stats'], capture_output=True,
+                                 text=True, check=True,
+                                 env={**os.environ, 'CCACHE_DIR': str(self.cache_dir)}).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        stats = dict(line.split('\t', 1) for line in out.splitlines() if '\t' in line)
+        return {
+            'hits': sum(int(stats.get(key, 0)) for key in self.HIT_KEYS),
+            'misses': sum(int(stats.get(key, 0)) for key in self.MISS_KEYS),
+        }
+
+    def begin(self) -> None:
+        """Snapshot the counters before the run's first cached build."""
+        if self.baseline is None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self.baseline = self.counters() or {'hits': 0, 'misses': 0}
+
+    def delta(self) -> Optional[Dict[str, int]]:
+        """Hits and misses since begin(), or None if nothing was built."""
+        current = self.counters() if self.baseline is not None else None
+        if current is None:
+            return None
+        return {key: current[key] - self.baseline[key] for key in current}
+
+# ============================================================================
+# BUILD ARTIFACTS (Prebuilt packages for source builds)
+# ============================================================================
+
+class ArtifactCache:
+    """Packaged ``DESTDIR`` installs of ``shell`` sections marked ``build_artifact: true``,
+    keyed by script, cloned commits and platform so a later run can skip the build."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.stats = {'installed': 0, 'built': 0}
+
+    @property
+    def format(self) -> str:
+        return 'deb' if shutil.which('dpkg-deb') else 'tar.gz'
+
+    @staticmethod
+    def package_name(section_name: str) -> str:
+        return 'start-vm-' + re.sub(r'[^a-z0-9+.-]+', '-', section_name.lower())
+
+    @staticmethod
+    def remote_commit(url: str, ref: Optional[str] = None) -> Optional[str]:
+        """Commit a remote ref (default: HEAD) currently points at."""
+        try:
+            out = subprocess.run(["git", "ls-remote", url, ref or 'HEAD'], capture_output=True,
+                                 text=True, check=True, timeout=60).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return out.split()[0] if out.strip() else None
+
+    def key(self, script: str) -> Optional[str]:
+        """Cache key of a build script, or None if a source commit is unknown."""
+        digest = hashlib.sha256()
+        for part in (script, RECIPE['os'], RECIPE['version'], platform.machine()):
+            digest.update(part.encode() + b'\0')
+        for url, branch in GitMirror.clones(script):
+            commit = self.remote_commit(url, branch)
+            if commit is None:
+                return None
+            digest.update(commit.encode() + b'\0')
+        return digest.hexdigest()[:16]
+
+    def path(self, section_name: str, key: str) -> Path:
+        return self.root / section_name / f"{key}.{self.format}"
+
+    @staticmethod
+    def stage() -> Path:
+        """Empty staging directory for DESTDIR installs."""
+        stage = Path(tempfile.mkdtemp(prefix='start-vm-stage-'))
+        stage.chmod(0o755)
+        return stage
+
+    def pack(self, stage: Path, section_name: str, key: str) -> Optional[Path]:
+        """Package a staged install into the cache; None if nothing was staged."""
+        if not any(stage.iterdir()):
+            return None
+        dest = self.path(section_name, key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+        if self.format == 'deb':
+            arch = subprocess.run(["dpkg", "--print-architecture"], capture_output=True,
+                                  text=True, check=True).stdout.strip()
+            (stage / 'DEBIAN').mkdir()
+            (stage / 'DEBIAN' / 'control').write_text(
+                f"Package: {self.package_name(section_name)}\n"
+                f"Version: 0+{key}\n"
+                f"Architecture: {arch}\n"
+                f"Maintainer: start-vm <start-vm@localhost>\n"
+                f"Description: {section_name} built from source by start-vm\n"
+                f" Built for the {RECIPE['name']} recipe.\n")
+            subprocess.run(["dpkg-deb", "--root-owner-group", "--build", str(stage), str(tmp)],
+                           check=True, capture_output=True)
+        else:
+            # Files and links only: extracting directory entries over / would
+            # reset the permissions of /usr, /usr/local and friends
+            with tarfile.open(tmp, 'w:gz') as archive:
+                for path in sorted(stage.rglob('*')):
+                    if path.is_dir() and not path.is_symlink():
+                        continue
+                    info = archive.gettarinfo(str(path), str(path.relative_to(stage)))
+                    info.uid = info.gid = 0
+                    info.uname = info.gname = 'root'
+                    if info.isreg():
+                        with path.open('rb') as f:
+                            archive.addfile(info, f)
+                    else:
+                        archive.addfile(info)
+        os.replace(tmp, dest)
+        return dest
+
+    def install_cmd(self, artifact: Path) -> List[str]:
+        if artifact.name.endswith('.deb'):
+            return ["sudo", "dpkg", "-i", str(artifact)]
+        return ["sudo", "tar", "-xzf", str(artifact), "-C", "/"]
+
+# ============================================================================
+# RESOURCE GOVERNOR (Job limits and scheduling for heavy sections)
+# ============================================================================
+
+class ResourceGovernor:
+    """Job counts, niceness and an optional systemd scope for ``shell`` sections with
+    ``resources:`` hints (``cpu_weight``, ``max_jobs``, ``memory``)."""
+
+    JOB_MEMORY = 1 << 30
+    DEFAULT_WEIGHT = 10  # About nice 10: each nice level is a 1.25x weight step
+    SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$', re.IGNORECASE)
+
+    def __init__(self, scope: bool = False):
+        self.scope = scope
+
+    @classmethod
+    def parse_size(cls, value: Union[int, str]) -> int:
+        """Bytes in a size such as 512M, 3G or 1.5GiB (plain numbers are bytes)."""
+        match = cls.SIZE.match(str(value))
+        if not match:
+            raise ValueError(f"Invalid memory size: {value!r}")
+        number, unit = match.groups()
+        return int(float(number) * (1 << (10 * ' KMGT'.index(unit.upper() or ' '))))
+
+    def jobs(self, resources: Dict[str, Any]) -> int:
+        jobs = os.cpu_count() or 1
+        if resources.get('max_jobs'):
+            jobs = min(jobs, int(resources['max_jobs']))
+        memory = CargoBuildEnv.mem_available()
+        if resources.get('memory'):
+            budget = self.parse_size(resources['memory'])
+            memory = min(memory, budget) if memory is not None else budget
+        if memory is not None:
+            jobs = min(jobs, memory // self.JOB_MEMORY)
+        return max(1, jobs)
+
+    def nice(self, resources: Dict[str, Any]) -> int:
+        weight = max(1, int(resources.get('cpu_weight', self.DEFAULT_WEIGHT)))
+        # Only ever lowered: raising priority needs root
+        return min(19, max(0, round(math.log(100 / weight, 1.25))))
+
+    def env(self, resources: Dict[str, Any]) -> Dict[str, str]:
+        """Job-count variables for the section's build tools."""
+        jobs = str(self.jobs(resources))
+        env = {'MAKEFLAGS': f"-j{jobs}", 'CMAKE_BUILD_PARALLEL_LEVEL': jobs, 'JOBS': jobs}
+        return {key: value for key, value in env.items() if key not in os.environ}
+
+    @staticmethod
+    def systemd() -> bool:
+        return bool(shutil.which('systemd-run')) and Path('/run/systemd/system').is_dir()
+
+    def prefix(self, resources: Dict[str, Any]) -> List[str]:
+        """Command prefix applying the scope, nice and ionice settings."""
+        prefix = []
+        if self.scope and self.systemd():
+            weight = int(resources.get('cpu_weight', self.DEFAULT_WEIGHT))
+            prefix += ["systemd-run", "--scope", "--quiet"]
+            prefix += [] if os.geteuid() == 0 else ["--user"]
+            prefix += ["-p", f"CPUWeight={weight}"]
+            if resources.get('memory'):
+                prefix += ["-p", f"MemoryMax={self.parse_size(resources['memory'])}"]
+            prefix += ["--"]
+        if shutil.which('nice'):
+            prefix += ["nice", "-n", str(self.nice(resources))]
+        if shutil.which('ionice'):
+            prefix += ["ionice", "-c2", "-n7"]
+        return prefix
+
+# ============================================================================
+# RUST BUILDS (Prebuilt binary cache, shared target dir)
+# ============================================================================
+
+class RustCache:
+    """Binaries from ``cargo install`` under ``<crate>/<version>/<target>/rustc-<release>/``,
+    each entry renamed into place once complete."""
+
+    CRATES_API = "https://crates.io/api/v1/crates"
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._toolchain: Optional[tuple] = None
+        self.stats = {'restored': 0, 'built': 0, 'stored': 0}
+
+    def toolchain(self) -> Optional[tuple]:
+        """(host target triple, rustc release), or None without rustc."""
+        if self._toolchain is None:
+            try:
+                out = subprocess.run(["rustc", "-vV"], capture_output=True, text=True,
+                                     check=True).stdout
+            except (OSError, subprocess.CalledProcessError):
+                out = ''
+            fields = dict(line.split(': ', 1) for line in out.splitlines() if ': ' in line)
+            self._toolchain = (fields['host'], fields['release']) if 'host' in fields else ()
+        return self._toolchain or None
+
+    @classmethod
+    def latest_version(cls, crate: str) -> Optional[str]:
+        """Version ``cargo install`` would pick for an unpinned crate, looked up by exact name."""
+        request = urllib.request.Request(f"{cls.CRATES_API}/{crate}",
+                                         headers={'User-Agent': 'start-vm rust cache'})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                info = json.load(response)['crate']
+        except (OSError, ValueError, KeyError):
+            return None
+        return info.get('max_stable_version') or info.get('max_version')
+
+    @staticmethod
+    def installed(crate: str) -> Optional[tuple]:
+        """(version, binaries) of an installed crate from ``cargo install --list``."""
+        try:
+            out = subprocess.run(["cargo", "install", "--list"], capture_output=True,
+                                 text=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        # "<crate> v<version>[ (<source>)]:" followed by indented binary names
+        version, binaries = None, []
+        for line in out.splitlines():
+            if line[:1].isspace():
+                if version:
+                    binaries.append(line.strip())
+            elif version:
+                break
+            else:
+                match = re.match(rf'^{re.escape(crate)} v(\S+?)(?: \(.*\))?:$', line)
+                version = match.group(1) if match else None
+        return (version, binaries) if version else None
+
+    def entry(self, crate: str, version: Optional[str]) -> Optional[Path]:
+        toolchain = self.toolchain()
+        if not toolchain or not version:
+            return None
+        target, release = toolchain
+        return self.root / crate / version / target / f"rustc-{release}"
+
+    def restore(self, entry: Path, bin_dir: Path) -> List[Path]:
+        """Copy a cached entry's binaries into bin_dir, returning their paths."""
+        info = json.loads((entry / 'entry.json').read_text())
+        bin_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for name in info['binaries']:
+            dst = bin_dir / name
+            tmp = dst.with_name(f".{name}.{os.getpid()}.tmp")
+            shutil.copy2(entry / 'bin' / name, tmp)
+            os.replace(tmp, dst)
+            paths.append(dst)
+        return paths
+
+    def store(self, crate: str, version: str, binaries: List[str], bin_dir: Path) -> Optional[Path]:
+        """Add freshly built binaries to the cache unless the key already exists."""
+        entry = self.entry(crate, version)
+        if entry is None or entry.exists():
+            return None
+        target, release = self.toolchain()
+        staging = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        (staging / 'bin').mkdir(parents=True)
+        for name in binaries:
+            shutil.copy2(bin_dir / name, staging / 'bin' / name)
+        (staging / 'entry.json').write_text(json.dumps({
+            'crate': crate, 'version': version, 'target': target, 'rustc': release,
+            'binaries': binaries, 'created': datetime.now().isoformat(timespec='seconds'),
+        }, indent=2))
+        try:
+            os.replace(staging, entry)
+        except OSError:
+            # Another machine stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+            return None
+        return entry
+
+class CargoBuildEnv:
+    """One ``CARGO_TARGET_DIR`` and a ``CARGO_BUILD_JOBS`` capped by cores and free memory
+    for a run's builds; variables already set win."""
+
+    JOB_MEMORY = 1536 << 20
+    TMPFS = Path("/dev/shm")
+    TMPFS_MIN_FREE = 4 << 30
+
+    def __init__(self, target_dir: Optional[Path] = None, jobs: Optional[int] = None):
+        self.explicit = target_dir
+        self.jobs = jobs
+        self.applied: Dict[str, str] = {}
+        self.saved: Dict[str, Optional[str]] = {}
+
+    @staticmethod
+    def mem_available() -> Optional[int]:
+        """Bytes of memory available without swapping, if the OS reports it."""
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        try:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            return None
+
+    def plan(self) -> Dict[str, str]:
+        """The CARGO_* variables this run would set."""
+        memory = self.mem_available()
+        env = {}
+        if 'CARGO_TARGET_DIR' not in os.environ:
+            target = self.explicit
+            if target is None:
+                free = shutil.disk_usage(self.TMPFS).free if self.TMPFS.is_dir() else 0
+                on_tmpfs = memory is not None and min(memory, free) >= self.TMPFS_MIN_FREE
+                root = self.TMPFS / "start-vm-cargo-target" if on_tmpfs else PATHS['cargo_target']
+                target = root / str(os.getpid())
+            env['CARGO_TARGET_DIR'] = str(target)
+        if 'CARGO_BUILD_JOBS' not in os.environ:
+            jobs = self.jobs or os.cpu_count() or 1
+            if not self.jobs and memory is not None:
+                # A target dir on tmpfs competes with the compilers for the same memory
+                if env.get('CARGO_TARGET_DIR', '').startswith(str(self.TMPFS)):
+                    memory -= self.TMPFS_MIN_FREE // 2
+                jobs = max(1, min(jobs, memory // self.JOB_MEMORY))
+            env['CARGO_BUILD_JOBS'] = str(jobs)
+        return env
+
+    def apply(self) -> Dict[str, str]:
+        """Export the plan for cargo subprocesses; later calls are no-ops."""
+        if not self.applied:
+            self.applied = self.plan()
+            for key, value in self.applied.items():
+                self.saved[key] = os.environ.get(key)
+                os.environ[key] = value
+            if 'CARGO_TARGET_DIR' in self.applied:
+                Path(self.applied['CARGO_TARGET_DIR']).mkdir(parents=True, exist_ok=True)
+        return self.applied
+
+    def cleanup(self) -> None:
+        """Remove a target dir this run created and restore the environment."""
+        target = self.applied.get('CARGO_TARGET_DIR')
+        if target and self.explicit is None:
+            shutil.rmtree(target, ignore_errors=True)
+            try:
+                Path(target).parent.rmdir()  # Only once no other run is using it
+            except OSError:
+                pass
+        for key, value in self.saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self.applied, self.saved = {}, {}
+
+# ============================================================================
+# PREFETCH (Download-ahead pipeline)
+# ============================================================================
+
+class Prefetcher:
+    """Downloads up to ``depth`` upcoming sections' packages on one background worker.
+
+    Lookahead stops at a ``pre_install`` hook; a failed prefetch falls back to a normal download.
+    """
+
+    STAT_KEYS = ('scheduled', 'ready', 'waited', 'failed', 'bytes')
+
+    def __init__(self, registry: OperationRegistry, dest: Path, depth: int = 2,
+                 skip: Optional[List[str]] = None):
+        self.registry = registry
+        self.dest = dest
+        self.depth = depth
+        self.skip = skip or []  # Section types installed from elsewhere (a wheelhouse)
+        self.futures: Dict[int, Future] = {}
+        self.fetched: Dict[str, Path] = {}  # Section name: its download directory
+        self.locks: Dict[str, threading.Lock] = {}
+        self.stats = {key: 0 for key in self.STAT_KEYS}
+        self.stats.update(seconds=0.0, wait_seconds=0.0)
+        self._worker = ThreadPoolExecutor(max_workers=1)
+
+    def directory(self, section: Dict[str, Any]) -> Path:
+        return self.dest / section['type'] / section['name']
+
+    def lock(self, section_type: str):
+        """Lock shared by a prefetch and an install writing the manager's own cache."""
+        if 'prefetch_cache' not in self.registry.PKG_MANAGERS.get(section_type, {}):
+            return nullcontext()
+        return self.locks.setdefault(section_type, threading.Lock())
+
+    def spec(self, section: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Package manager spec if the section's packages can be prefetched."""
+        mgr = self.registry.PKG_MANAGERS.get(section['type'], {})
+        install_list = section.get('install')
+        if section['type'] in self.skip:
+            return None
+        if 'prefetch_cmd' in mgr and isinstance(install_list, list) and install_list:
+            return mgr
+        return None
+
+    @staticmethod
+    def cache_size(path: Optional[Path]) -> int:
+        if path is None or not path.is_dir():
+            return 0
+        return sum(entry.stat().st_size for entry in path.iterdir() if entry.is_file())
+
+    def prefetch(self, section: Dict[str, Any]) -> None:
+        """Download one section's packages into the manager's cache."""
+        mgr = self.spec(section)
+        dest = self.directory(section)
+        cache = mgr['prefetch_cache'](dest) if 'prefetch_cache' in mgr else dest
+        with self.lock(section['type']):
+            (dest / "partial").mkdir(parents=True, exist_ok=True)  # apt needs partial/
+            before, start = self.cache_size(cache), time.monotonic()
+            result = subprocess.run(mgr['prefetch_cmd'](section['install'], dest),
+                                    capture_output=True, text=True)
+            self.stats['seconds'] += time.monotonic() - start
+            self.stats['bytes'] += max(self.cache_size(cache) - before, 0)
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"exit code {result.returncode}")
+        self.fetched[section['name']] = dest
+
+    def schedule(self, sections: List[Dict[str, Any]], current: int) -> None:
+        """Queue prefetches for the sections after ``current``."""
+        for index in range(current + 1, min(current + 1 + self.depth, len(sections))):
+            if sections[index].get('pre_install'):
+                break
+            if index not in self.futures and self.spec(sections[index]):
+                self.futures[index] = self._worker.submit(self.prefetch, sections[index])
+                self.stats['scheduled'] += 1
+
+    def wait(self, index: int) -> Optional[str]:
+        """Wait for a section's prefetch; returns an error message if it failed."""
+        future = self.futures.get(index)
+        if future is None:
+            return None
+        ready, start = future.done(), time.monotonic()
+        error = future.exception()  # blocks until the prefetch has finished
+        if ready:
+            self.stats['ready'] += 1
+        else:
+            self.stats['waited'] += 1
+            self.stats['wait_seconds'] += time.monotonic() - start
+        if error is not None:
+            self.stats['failed'] += 1
+            return str(error)
+        return None
+
+    def shutdown(self) -> None:
+        for future in self.futures.values():
+            future.cancel()
+        self._worker.shutdown(wait=True)
+
+# ============================================================================
+# SECTION SCHEDULER (Duration-aware install order across workers)
+# ============================================================================
+
+class SectionScheduler:
+    """Runs independent sections on several workers, longest chain of recorded
+    median durations first."""
+
+    BARRIER_TYPES = ('shell', 'powershell')
+    DEFAULT_SECONDS = 60.0
+    # Debian packages installing into the interpreter pip installs into
+    PYTHON_DEBS = re.compile(r'python3?-')
+
+    def __init__(self, sections: List[Dict[str, Any]], durations: Dict[str, float],
+                 runs: int = 0):
+        self.sections = sections
+        self.runs = runs
+        known = sorted(durations.values())
+        fallback = known[len(known) // 2] if known else self.DEFAULT_SECONDS
+        self.estimated = [section['name'] not in durations for section in sections]
+        self.durations = [durations.get(section['name'], fallback) for section in sections]
+        self.deps = [[j for j in range(i) if self.depends(sections[i], sections[j])]
+                     for i in range(len(sections))]
+        self.rank = self.ranks()
+
+    @classmethod
+    def from_timings(cls, sections: List[Dict[str, Any]], root: Path) -> 'SectionScheduler':
+        """Scheduler with durations from this recipe's recorded step timings."""
+        samples: Dict[str, List[float]] = {}
+        runs = 0
+        for path in sorted(root.glob(f"{RECIPE['name']}-*.json")) if root.is_dir() else []:
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if data.get('recipe') != RECIPE['name']:
+                continue
+            runs += 1
+            for step in data.get('steps', []):
+                if step.get('kind') == 'section' and step.get('status') == 'ok':
+                    samples.setdefault(step['name'], []).append(step['seconds'])
+        durations = {name: sorted(values)[len(values) // 2] for name, values in samples.items()}
+        return cls(sections, durations, runs)
+
+    @classmethod
+    def depends(cls, section: Dict[str, Any], earlier: Dict[str, Any]) -> bool:
+        """Whether a section must wait for an earlier one (see the README's --workers paragraph)."""
+        if section.get('pre_install') or earlier.get('pre_install'):
+            return True
+        if section['type'] in cls.BARRIER_TYPES or earlier['type'] in cls.BARRIER_TYPES:
+            return True
+        if {section['type'], earlier['type']} == {'python_packages', 'debian_packages'}:
+            debian = section if section['type'] == 'debian_packages' else earlier
+            if any(cls.PYTHON_DEBS.match(pkg) for pkg in debian.get('install', [])):
+                return True
+        return section['type'] == earlier['type'] or earlier['type'] == 'debian_packages'
+
+    def ranks(self) -> List[float]:
+        """Estimated time from each section's start to the end of its longest chain."""
+        rank = list(self.durations)
+        for i in reversed(range(len(self.sections))):
+            later = [rank[k] for k in range(i + 1, len(self.sections)) if i in self.deps[k]]
+            rank[i] = self.durations[i] + max(later, default=0.0)
+        return rank
+
+    def ready(self, pending: List[int], unfinished: set) -> List[int]:
+        """Pending sections whose dependencies are done, by priority."""
+        ready = [i for i in pending if not unfinished.intersection(self.deps[i])]
+        return sorted(ready, key=lambda i: (-self.rank[i], i))
+
+    def schedule(self, workers: int) -> List[Dict[str, Any]]:
+        """Simulated plan: section index, worker and estimated start and end."""
+        pending, running, plan = list(range(len(self.sections))), {}, []
+        idle, now = list(range(1, workers + 1)), 0.0
+        while pending or running:
+            for i in self.ready(pending, set(pending) | set(running))[:len(idle)]:
+                end = now + self.durations[i]
+                running[i] = (idle.pop(0), end)
+                pending.remove(i)
+                plan.append({'index': i, 'worker': running[i][0], 'start': now, 'end': end})
+            i = min(running, key=lambda i: (running[i][1], i))
+            worker, now = running.pop(i)
+            idle = sorted(idle + [worker])
+        return plan
+
+    def describe(self, workers: int) -> List[str]:
+        """The plan, one line per section, and the expected makespan."""
+        plan = self.schedule(workers)
+        source = (f"median of {self.runs} recorded run(s)" if self.runs
+                  else f"no recorded runs, {self.DEFAULT_SECONDS:.0f}s each")
+        lines = [f"Schedule on {workers} worker(s) ({source}):"]
+        for item in sorted(plan, key=lambda item: (item['start'], item['worker'])):
+            i = item['index']
+            estimate = ' (estimated)' if self.estimated[i] else ''
+            lines.append(f"  worker {item['worker']}: {item['start']:>8.1f}s - {item['end']:>8.1f}s  "
+                         f"{self.sections[i]['name']}{estimate}")
+        makespan = max((item['end'] for item in plan), default=0.0)
+        lines.append(f"Expected makespan: {makespan:.1f}s (sequential: {sum(self.durations):.1f}s)")
+        return lines
+
+    def run(self, workers: int, install: Callable[[Dict[str, Any]], None]) -> None:
+        """Install sections as their dependencies finish; the first failure stops new starts."""
+        pending, running, failed = list(range(len(self.sections))), {}, None
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='section') as pool:
+            while (pending and failed is None) or running:
+                if failed is None:
+                    free = workers - len(running)
+                    for i in self.ready(pending, set(pending) | set(running.values()))[:free]:
+                        running[pool.submit(install, self.sections[i])] = i
+                        pending.remove(i)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del running[future]
+                    if future.exception() and failed is None:
+                        failed = future.exception()
+        if failed:
+            raise failed
+
+# ============================================================================
+# STEP TIMER (Per-section, per-hook and per-package timings)
+# ============================================================================
+
+class StepTimer:
+    """Start and end of every section, hook and package-manager call, written as JSON
+    under ``PATHS['timings']``; the current section is tracked per thread."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.steps: List[Dict[str, Any]] = []
+        self.local = threading.local()
+        self.path: Optional[Path] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def step(self, kind: str, name: str):
+        """Time the enclosed block as a ``section``, ``hook``, ``package`` or ``script`` step."""
+        if kind == 'section':
+            self.local.section = name
+        record = {'kind': kind, 'section': getattr(self.local, 'section', None), 'name': name,
+                  'start': round(time.time(), 3), 'status': 'failed'}
+        started = time.perf_counter()
+        try:
+            yield
+            record['status'] = 'ok'
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 3)
+            record['end'] = round(record['start'] + record['seconds'], 3)
+            with self._lock:
+                self.steps.append(record)
+
+    def slowest(self, count: int = 10) -> List[str]:
+        """Table rows of the slowest steps, slowest first."""
+        steps = sorted(self.steps, key=lambda step: -step['seconds'])[:count]
+        return [f"{step['seconds']:>9.1f}s  {step['kind']:<8} {step['section'] or '-':<20} "
+                f"{step['name']}{'' if step['status'] == 'ok' else ' (failed)'}"
+                for step in steps]
+
+    def write(self, action: str, root: Path) -> Path:
+        """Write this run's steps to a timestamped JSON file under ``root``."""
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d_%H%M%S")
+        self.path = root / f"{RECIPE['name']}-{stamp}.json"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        failed = any(step['status'] != 'ok' for step in self.steps)
+        self.path.write_text(json.dumps({
+            'recipe': RECIPE['name'],
+            'platform': RECIPE['platform'],
+            'os': RECIPE['os'],
+            'version': RECIPE['version'],
+            'generator': 'setup.py',
+            'action': action,
+            'host': platform.node(),
+            'start': round(self.started, 3),
+            'seconds': round(time.time() - self.started, 3),
+            'status': 'failed' if failed else 'ok',
+            'steps': self.steps,
+        }, indent=2))
+        return self.path
+
 # ============================================================================
 # EXECUTION ENGINE
 # ============================================================================
@@ -142,27 +1647,251 @@ class OperationRegistry:
 class Executor:
     """Unified execution engine that consumes operation data."""
 
-    def __init__(self, dry_run: bool = False, verbose: bool = False):
+    def __init__(self, dry_run: bool = False, verbose: bool = False,
+                 checksum: bool = False, backup_keep: int = 10,
+                 backup_max_age: Optional[int] = None,
+                 jobs: int = CopyPool.DEFAULT_WORKERS, force: bool = False,
+                 offline: Optional[OfflineBundle] = None, wheelhouse: Optional[Path] = None,
+                 rust_cache: Optional[RustCache] = None,
+                 cargo: Optional[CargoBuildEnv] = None,
+                 compiler_cache: Optional[CompilerCache] = None,
+                 git_mirror: Optional[GitMirror] = None,
+                 artifacts: Optional[ArtifactCache] = None,
+                 governor: Optional[ResourceGovernor] = None,
+                 timer: Optional[StepTimer] = None):
         self.dry_run = dry_run
         self.verbose = verbose
+        self.force = force
+        self.offline = offline
+        self.wheelhouse = wheelhouse
+        self.wheelhouse_stats = {'installed': 0, 'fallbacks': 0}
+        self.rust_cache = rust_cache
+        self.cargo = cargo or CargoBuildEnv()
+        self.compiler_cache = compiler_cache or CompilerCache(PATHS['ccache_dir'])
+        self.git_mirror = git_mirror
+        self.artifacts = artifacts or ArtifactCache(PATHS['artifacts'])
+        self.governor = governor or ResourceGovernor()
+        self.timer = timer or StepTimer()
+        self.prefetcher: Optional[Prefetcher] = None
         self.registry = OperationRegistry()
+        self.pool = CopyPool(workers=jobs)
+        self.sync = SyncEngine(checksum=checksum, pool=self.pool)
+        self.backups = BackupStore(PATHS['backup_root'], keep=backup_keep,
+                                   max_age_days=backup_max_age, pool=self.pool)
+        self.manifest = InstallManifest(PATHS['manifest'], pool=self.pool)
+        self.link_stats = {'linked': 0, 'current': 0, 'conflicts': 0}
+        # Sections may install on several workers (--workers): the manifest,
+        # the timer and the log guard their own state, and sections sharing a
+        # package manager or its counters never run at the same time
+        self._log_lock = threading.Lock()
 
     def log(self, msg: str, level: str = 'info') -> None:
         """Unified logging driven by UI data."""
+        colors = self.registry.UI['colors']
         if level == 'header':
-            print()
-            colors = self.registry.UI['colors']
-            print(f"{colors['header']}{msg}{colors['end']}")
-            print("=" * 60)
+            text = f"\n{colors['header']}{msg}{colors['end']}\n{'=' * 60}"
         else:
-            colors = self.registry.UI['colors']
             labels = self.registry.UI['labels']
             color = colors.get(level, colors['info'])
             label = labels.get(level, '')
-            print(f"{color}{label}{colors['end']} {msg}")
+            text = f"{color}{label}{colors['end']} {msg}"
+        with self._log_lock:
+            print(text, flush=True)
+
+    def progress(self, done: int, total: int, label: str) -> None:
+        """Ordered per-file progress for pooled file operations (verbose only)."""
+        self.log(f"  [{done}/{total}] {label}", 'info')
+
+    def log_failure(self, what: str, error: OSError, level: str = 'error') -> None:
+        """Log a failure, expanding per-file errors aggregated by CopyPool."""
+        failures = error.args[0] if isinstance(error, shutil.Error) and error.args else None
+        if not isinstance(failures, list):
+            self.log(f"{what}: {error}", level)
+            return
+        self.log(f"{what}: {len(failures)} file(s) failed", level)
+        for *paths, why in failures:
+            self.log(f"  {paths[0]}: {why}", level)
+
+    @staticmethod
+    def package_name(spec: str) -> str:
+        """Normalized package name from a spec like 'black>=24' or 'foo@1.2'."""
+        return re.sub(r'[-_.]+', '-', re.split(r'[=<>:@~!]+', spec)[0].strip()).lower()
+
+    def query_installed(self, section_type: str) -> Optional[set]:
+        """Names of packages already installed by a manager, or None if unknown."""
+        mgr = self.registry.PKG_MANAGERS.get(section_type, {})
+        if self.dry_run or 'list_cmd' not in mgr:
+            return None
+        try:
+            result = subprocess.run(mgr['list_cmd'], capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        names = (mgr['list_parse'](line) for line in result.stdout.splitlines() if line.strip())
+        return {self.package_name(name) for name in names if name}
+
+    def install_cmd(self, section_type: str, packages: Union[str, List[str]],
+                    section: Optional[str] = None) -> Union[str, List[str]]:
+        """Install command for a package (list), from the offline bundle if given,
+        else from the section's prefetched downloads if any."""
+        mgr = self.registry.PKG_MANAGERS[section_type]
+        if self.offline and 'offline_cmd' in mgr:
+            return mgr['offline_cmd'](packages, self.offline)
+        if self.offline:
+            self.log(f"{section_type} cannot be installed offline, using the network", 'warning')
+        fetched = self.prefetcher.fetched.get(section) if self.prefetcher and section else None
+        if fetched and 'prefetched_cmd' in mgr:
+            return mgr['prefetched_cmd'](packages, fetched)
+        return mgr['install_cmd'](packages)
+
+    def install_packages(self, section_type: str, packages: Union[str, List[str]],
+                         description: str, section: Optional[str] = None) -> None:
+        """Install a package (list), from the wheelhouse first when one is present."""
+        mgr = self.registry.PKG_MANAGERS[section_type]
+        if section_type == 'rust_packages' and self.rust_cache and not self.offline:
+            self.install_crate(packages, description)
+            return
+        if self.wheelhouse and not self.offline and 'wheelhouse_cmd' in mgr:
+            cmd = mgr['wheelhouse_cmd'](packages, self.wheelhouse)
+            if self.run_cmd(cmd, f"{description} from wheelhouse", check=False) in (0, None):
+                self.wheelhouse_stats['installed'] += 1
+                return
+            # A wheelhouse built for another recipe or Python may lack wheels
+            self.wheelhouse_stats['fallbacks'] += 1
+            self.log(f"Wheelhouse {self.wheelhouse} is incomplete, using the package index",
+                     'warning')
+        cmd = self.install_cmd(section_type, packages, section)
+        self.run_cmd(cmd, description, shell=isinstance(cmd, str))
+
+    def timed_install(self, section_type: str, packages: Union[str, List[str]],
+                      description: str, section: Optional[str] = None) -> None:
+        """install_packages as a timed step, named by the package or the section type."""
+        name = packages if isinstance(packages, str) else section_type
+        with self.timer.step('package', name):
+            self.install_packages(section_type, packages, description, section)
+
+    def use_cargo_env(self) -> None:
+        """Share one target dir and tuned job count across this run's cargo builds."""
+        if self.dry_run:
+            env = ' '.join(f"{k}={v}" for k, v in self.cargo.plan().items())
+            self.log(f"[DRY-RUN] Would build crates with {env or 'the existing CARGO_* settings'}",
+                     'info')
+        elif not self.cargo.applied:
+            env = self.cargo.apply()
+            if env:
+                self.log(f"Cargo builds: {', '.join(f'{k}={v}' for k, v in env.items())}", 'info')
+
+    def install_crate(self, package: str, description: str) -> None:
+        """Install a crate from the rust artifact cache, or build and cache it."""
+        cache = self.rust_cache
+        crate, _, version = package.partition('@')
+        version = version or cache.latest_version(crate)
+        entry = cache.entry(crate, version)
+        if entry and (entry / 'entry.json').exists():
+            if self.dry_run:
+                self.log(f"[DRY-RUN] Would restore {crate} from {entry}", 'info')
+                return
+            paths = cache.restore(entry, PATHS['cargo_bin'])
+            self.manifest.record_files(f"rust:{self.package_name(crate)}", crate, paths)
+            cache.stats['restored'] += 1
+            self.log(f"Restored {crate} {version} from {entry}", 'success')
+            return
+
+        self.run_cmd(self.registry.PKG_MANAGERS['rust_packages']['install_cmd'](package),
+                     description)
+        if self.dry_run:
+            return
+        cache.stats['built'] += 1
+        installed = cache.installed(crate)
+        if installed and installed[1]:
+            try:
+                if cache.store(crate, installed[0], installed[1], PATHS['cargo_bin']):
+                    cache.stats['stored'] += 1
+            except OSError as e:
+                self.log(f"Could not cache {crate}: {e}", 'warning')
+
+    def run_shell(self, section: Dict[str, Any]) -> None:
+        """Run a shell section's script with its caches and resource limits."""
+        name, script, preamble, env = section['name'], section['install'], '', {}
+        key = stage = None
+        if section.get('build_artifact'):
+            key = self.artifacts.key(script)
+            if key is None:
+                self.log("Cannot resolve the sources' commits: building without an artifact",
+                         'warning')
+            elif self.artifacts.path(name, key).exists():
+                self.log(f"Using prebuilt {name} ({key})", 'info')
+                self.install_artifact(name, self.artifacts.path(name, key))
+                self.artifacts.stats['installed'] += 1
+                return
+        if self.git_mirror and re.search(r'\bgit\s+clone\b', script):
+            preamble += self.git_mirror.preamble()
+        if section.get('build_cache'):
+            if self.compiler_cache.ccache or self.dry_run:
+                env.update(self.compiler_cache.env(script))
+            else:
+                self.log("ccache not found: building without a compiler cache", 'warning')
+        resources, prefix = section.get('resources'), []
+        if resources:
+            env.update(self.governor.env(resources))
+            prefix = self.governor.prefix(resources)
+            self.log(f"Resources: {self.governor.jobs(resources)} job(s), "
+                     f"nice {self.governor.nice(resources)}"
+                     f"{', in a systemd scope' if prefix[:1] == ['systemd-run'] else ''}", 'info')
+        if key and not self.dry_run:
+            stage = self.artifacts.stage()
+            env['DESTDIR'] = str(stage)
+        if self.dry_run:
+            if env:
+                self.log(f"[DRY-RUN] Would build with "
+                         f"{' '.join(f'{k}={v!r}' for k, v in env.items())}", 'info')
+            if prefix:
+                self.log(f"[DRY-RUN] Would run under: {' '.join(prefix)}", 'info')
+            if key:
+                self.log(f"[DRY-RUN] Would stage the install and store it as "
+                         f"{self.artifacts.path(name, key)}", 'info')
+            self.run_cmd(script, name, shell=True)
+            return
+        if env:
+            preamble += CompilerCache.preamble(env)
+        if 'CCACHE_DIR' in env:
+            self.compiler_cache.begin()
+        try:
+            if prefix:
+                self.run_cmd(prefix + ["/bin/sh", "-c", preamble + script], name, env=env or None)
+            else:
+                self.run_cmd(preamble + script, name, shell=True, env=env or None)
+            if stage:
+                self.store_artifact(name, key, stage)
+        finally:
+            if stage:
+                # make install ran under sudo, so the staged files are root's
+                subprocess.run(["sudo", "rm", "-rf", str(stage)], check=False)
+
+    def store_artifact(self, name: str, key: str, stage: Path) -> None:
+        """Package a staged install, add it to the cache and install it."""
+        try:
+            artifact = self.artifacts.pack(stage, name, key)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.log_failure(f"Failed to package {name}", e)
+            raise
+        if artifact is None:
+            self.log(f"{name} staged nothing under DESTDIR: no artifact stored", 'warning')
+            return
+        self.artifacts.stats['built'] += 1
+        self.log(f"Stored {artifact}", 'info')
+        self.install_artifact(name, artifact)
+
+    def install_artifact(self, name: str, artifact: Path) -> None:
+        """Install a packaged build onto the live system."""
+        self.run_cmd(self.artifacts.install_cmd(artifact), f"Installing {artifact.name}")
+        if platform.system() == 'Linux':
+            self.run_cmd(["sudo", "ldconfig"], "Updating the shared library cache", check=False)
+        if artifact.name.endswith('.deb') and not self.dry_run:
+            self.manifest.record_packages('build_artifacts', [ArtifactCache.package_name(name)], [])
 
     def run_cmd(self, cmd: Union[str, List[str]], description: str,
-                shell: bool = False, check: bool = True) -> Optional[int]:
+                shell: bool = False, check: bool = True,
+                env: Optional[Dict[str, str]] = None) -> Optional[int]:
         """Execute command with standardized handling."""
         if self.dry_run:
             cmd_str = cmd if shell else ' '.join(cmd)
@@ -173,7 +1902,8 @@ class Executor:
         try:
             result = subprocess.run(
                 cmd, shell=shell, check=check,
-                capture_output=False, text=True
+                capture_output=False, text=True,
+                env={**os.environ, **env} if env else None
             )
             if result.returncode == 0:
                 self.log(f"{description} completed", 'success')
@@ -198,14 +1928,33 @@ class Executor:
             src, dst, name = kwargs['src'], kwargs['dst'], kwargs['name']
             backup = kwargs.get('backup', True)
 
+            if not op_spec['check'](src, dst):
+                if self.dry_run:
+                    self.log(f"[DRY-RUN] Would copy {src} to {dst}", 'info')
+                else:
+                    self.log(f"Source not found: {src}", 'warning')
+                return
+
+            plan = op_spec['plan'](self.sync, src, dst)
+            changes = f"{len(plan['copy'])} changed, {len(plan['delete'])} stale, " \
+                      f"{len(plan['skip'])} unchanged"
+
             if self.dry_run:
+                if self.sync.is_noop(plan):
+                    self.log(f"[DRY-RUN] Up to date: {name}", 'info')
+                    return
                 if dst.exists() and backup:
                     self.log(f"[DRY-RUN] Would backup existing {dst}", 'info')
-                self.log(f"[DRY-RUN] Would copy {src} to {dst}", 'info')
+                self.log(f"[DRY-RUN] Would sync {src} to {dst} ({changes})", 'info')
                 return
 
-            if not op_spec['check'](src, dst):
-                self.log(f"Source not found: {src}", 'warning')
+            file_set = kwargs.get('file_set', 'defaults')
+            created = [path for path in plan['dirs'] if not path.is_dir()]
+            if self.sync.is_noop(plan):
+                op_spec['exec'](self.sync, plan)
+                self.manifest.record_tree(file_set, name, plan, created)
+                if self.verbose:
+                    self.log(f"Up to date: {name}", 'success')
                 return
 
             if backup and dst.exists():
@@ -213,12 +1962,79 @@ class Executor:
 
             self.log(f"Installing {name}", 'info')
             try:
-                if op_spec['prep']:
-                    op_spec['prep'](src, dst)
-                op_spec['exec'](src, dst)
-                self.log(f"Installed {name}", 'success')
+                op_spec['exec'](self.sync, plan, self.progress if self.verbose else None)
+                self.manifest.record_tree(file_set, name, plan, created)
+                self.log(f"Installed {name} ({changes})", 'success')
             except (OSError, shutil.Error) as e:
-                self.log(f"Failed to copy {name}: {e}", 'error')
+                self.log_failure(f"Failed to copy {name}", e)
+
+        elif op_type == 'link':
+            src, dst, name = kwargs['src'], kwargs['dst'], kwargs['name']
+            backup = kwargs.get('backup', True)
+
+            if not op_spec['check'](src, dst):
+                self.log(f"Source not found: {src}", 'warning')
+                return
+
+            target = src.resolve()
+            file_set = kwargs.get('file_set', 'defaults')
+            if op_spec['current'](target, dst):
+                if not self.dry_run:
+                    self.manifest.record_link(file_set, name, dst, Path(os.readlink(dst)))
+                self.link_stats['current'] += 1
+                if self.verbose or self.dry_run:
+                    prefix = "[DRY-RUN] " if self.dry_run else ""
+                    self.log(f"{prefix}Already linked: {name}", 'info')
+                return
+
+            # Anything else at dst is a conflict: back it up and replace it.
+            # Without backups only stray symlinks are replaced.
+            conflict = dst.exists() or dst.is_symlink()
+            if conflict and not backup and not dst.is_symlink():
+                self.link_stats['conflicts'] += 1
+                self.log(f"Conflict: {dst} exists and backup is disabled, skipping {name}",
+                         'warning')
+                return
+
+            if self.dry_run:
+                if conflict:
+                    self.log(f"[DRY-RUN] Would backup and replace existing {dst}", 'info')
+                self.log(f"[DRY-RUN] Would link {dst} -> {target}", 'info')
+                return
+
+            try:
+                if conflict:
+                    if backup:
+                        self.exec_file_op('backup', src=dst, name=name)
+                    op_spec['clear'](dst)
+                op_spec['exec'](target, dst)
+                self.manifest.record_link(file_set, name, dst, target)
+                self.link_stats['linked'] += 1
+                self.log(f"Linked {name} -> {target}", 'success')
+            except (OSError, shutil.Error) as e:
+                self.log(f"Failed to link {name}: {e}", 'error')
+
+        elif op_type == 'unlink':
+            path, name, root = kwargs['path'], kwargs['name'], kwargs['root']
+
+            if not path.is_symlink():
+                if self.verbose:
+                    self.log(f"Not a link, leaving {path}", 'warning')
+                return
+
+            if not op_spec['check'](path, root):
+                self.log(f"Not removing {path}: it does not link into {root}", 'warning')
+                return
+
+            if self.dry_run:
+                self.log(f"[DRY-RUN] Would remove link {path}", 'info')
+                return
+
+            try:
+                op_spec['exec'](path)
+                self.log(f"Removed link {name}", 'success')
+            except OSError as e:
+                self.log(f"Failed to remove link {name}: {e}", 'error')
 
         elif op_type == 'remove':
             path, name = kwargs['path'], kwargs['name']
@@ -245,10 +2061,9 @@ class Executor:
             if not op_spec['check'](src):
                 return
 
-            # Initialize backup directory if needed
+            # Initialize snapshot directory if needed
             if PATHS['backup_dir'] is None:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                PATHS['backup_dir'] = PATHS['home_dir'] / f".dotfiles_backup_{timestamp}"
+                PATHS['backup_dir'] = self.backups.new_snapshot()
 
             dst = PATHS['backup_dir'] / name
 
@@ -260,58 +2075,104 @@ class Executor:
                 self.log(f"Backing up existing {src}", 'info')
 
             try:
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                op_spec['exec'](src, dst)
+                op_spec['exec'](self.backups, src, dst, self.progress if self.verbose else None)
                 if self.verbose:
                     self.log(f"Backed up to {dst}", 'success')
             except (OSError, shutil.Error) as e:
-                self.log(f"Failed to backup {name}: {e}", 'warning')
+                self.log_failure(f"Failed to backup {name}", e, 'warning')
 
-    def exec_section(self, section: Dict[str, Any], action: str) -> None:
-        """Execute section operation driven by PKG_MANAGERS data."""
+    def install_section(self, section: Dict[str, Any]) -> None:
+        """Install one section: its hooks and package installs are timed steps."""
         section_type = section['type']
         section_name = section['name']
+        self.log(f"Section: {section_name}", 'header')
 
-        if action == 'install':
-            self.log(f"Section: {section_name}", 'header')
-
-            # Pre-install hook
-            if section.get('pre_install'):
-                self.log("Running pre-install scripts...", 'info')
+        # Pre-install hook
+        if section.get('pre_install'):
+            self.log("Running pre-install scripts...", 'info')
+            with self.timer.step('hook', 'pre_install'):
                 self.run_cmd(section['pre_install'], "Pre-install", shell=True)
 
-            # Main installation
-            install_list = section.get('install', [])
-
-            if section_type == 'shell' or section_type == 'powershell':
-                self.log("Executing shell commands...", 'info')
-                self.run_cmd(install_list, section_name, shell=True)
-            elif section_type in self.registry.PKG_MANAGERS and install_list:
-                mgr = self.registry.PKG_MANAGERS[section_type]
+        # Main installation
+        install_list = section.get('install', [])
 
+        if section_type == 'shell' or section_type == 'powershell':
+            self.log("Executing shell commands...", 'info')
+            with self.timer.step('script', section_name):
+                if section_type == 'shell':
+                    self.run_shell(section)
+                else:
+                    self.run_cmd(install_list, section_name, shell=True)
+        elif section_type in self.registry.PKG_MANAGERS and install_list:
+            mgr = self.registry.PKG_MANAGERS[section_type]
+            if section_type == 'rust_packages':
+                self.use_cargo_env()
+
+            # Only packages missing beforehand are ours to uninstall later
+            before = self.query_installed(section_type)
+            names = [self.package_name(pkg) for pkg in install_list]
+            present = [name for name in names if before is not None and name in before]
+            if present and self.verbose:
+                self.log(f"Already installed: {', '.join(present)}", 'info')
+
+            # Only a manager prefetching into its own cache waits for the prefetch
+            lock = self.prefetcher.lock(section_type) if self.prefetcher else nullcontext()
+            with lock:
                 if mgr['batch']:
-                    cmd = mgr['install_cmd'](install_list)
-                    self.run_cmd(cmd, f"Installing {section_name} packages")
+                    self.timed_install(section_type, install_list,
+                                       f"Installing {section_name} packages", section_name)
+                    added = [name for name in names if name not in present]
                 else:
-                    for package in install_list:
-                        cmd = mgr['install_cmd'](package)
-                        self.run_cmd(cmd, f"Installing {package}")
-
-            # Purge packages (if specified)
-            if section.get('purge') and 'purge_cmd' in self.registry.PKG_MANAGERS.get(section_type, {}):
-                self.log("Purging unwanted packages...", 'info')
-                mgr = self.registry.PKG_MANAGERS[section_type]
-                cmd = mgr['purge_cmd'](section['purge'])
+                    added = []
+                    for package, name in zip(install_list, names):
+                        self.timed_install(section_type, package, f"Installing {package}",
+                                           section_name)
+                        if name not in present:
+                            added.append(name)
+
+            if not self.dry_run and before is None:
+                # Nothing to tell ours from pre-existing ones: never uninstall without --force
+                self.log(f"Could not list installed {section_type}: recording "
+                         f"{', '.join(added)} as possibly pre-existing", 'warning')
+                self.manifest.record_packages(section_type, [], present, added)
+            elif not self.dry_run:
+                self.manifest.record_packages(section_type, added, present)
+
+        # Purge packages (if specified)
+        if section.get('purge') and 'purge_cmd' in self.registry.PKG_MANAGERS.get(section_type, {}):
+            self.log("Purging unwanted packages...", 'info')
+            mgr = self.registry.PKG_MANAGERS[section_type]
+            cmd = mgr['purge_cmd'](section['purge'])
+            with self.timer.step('package', 'purge'):
                 self.run_cmd(cmd, f"Purging {section_name} packages")
 
-            # Post-install hook
-            if section.get('post_install'):
-                self.log("Running post-install scripts...", 'info')
+        # Post-install hook
+        if section.get('post_install'):
+            self.log("Running post-install scripts...", 'info')
+            with self.timer.step('hook', 'post_install'):
                 self.run_cmd(section['post_install'], "Post-install", shell=True)
 
+    def exec_section(self, section: Dict[str, Any], action: str) -> None:
+        """Execute section operation driven by PKG_MANAGERS data."""
+        section_type = section['type']
+        section_name = section['name']
+
+        if action == 'install':
+            with self.timer.step('section', section_name):
+                self.install_section(section)
+
         elif action == 'uninstall':
             self.log(f"Uninstalling: {section_name}", 'header')
 
+            # Packaged source builds are uninstalled by dpkg
+            package = ArtifactCache.package_name(section_name)
+            if (section.get('build_artifact')
+                    and package in self.manifest.owned_packages('build_artifacts')):
+                if not self.run_cmd(["sudo", "dpkg", "-r", package], f"Uninstalling {package}",
+                                    check=False) and not self.dry_run:
+                    self.manifest.forget_packages('build_artifacts', [package])
+                return
+
             if section_type == 'shell' or section_type == 'powershell':
                 self.log("Shell sections cannot be automatically uninstalled", 'warning')
                 return
@@ -321,13 +2182,45 @@ class Executor:
                 mgr = self.registry.PKG_MANAGERS[section_type]
                 packages = [re.split(r'[=<>:@~!]+', pkg)[0] for pkg in install_list]
 
-                if mgr['batch']:
+                # With a manifest, leave packages that install did not add
+                kept = []
+                if self.manifest.loaded:
+                    owned = self.manifest.owned_packages(section_type)
+                    if self.force:
+                        owned |= self.manifest.unknown_packages(section_type)
+                    kept = [pkg for pkg in packages if self.package_name(pkg) not in owned]
+                    unknown = [pkg for pkg in kept
+                               if self.package_name(pkg) in self.manifest.unknown_packages(section_type)]
+                    if unknown:
+                        self.log(f"Leaving packages that may have been installed before this "
+                                 f"recipe (use --force to remove): {', '.join(unknown)}", 'warning')
+                    kept = [pkg for pkg in kept if pkg not in unknown]
+                    if kept:
+                        self.log(f"Leaving packages not installed by this recipe: "
+                                 f"{', '.join(kept)}", 'info')
+                    packages = [pkg for pkg in packages if pkg not in kept and pkg not in unknown]
+
+                removed = []
+                if mgr['batch'] and packages:
                     cmd = mgr['uninstall_cmd'](packages)
-                    self.run_cmd(cmd, f"Uninstalling {section_name} packages", check=False)
-                else:
+                    if not self.run_cmd(cmd, f"Uninstalling {section_name} packages", check=False):
+                        removed = packages
+                elif not mgr['batch']:
                     for package in packages:
+                        # Restored from the rust artifact cache: cargo does not track these
+                        restored = f"rust:{self.package_name(package)}"
+                        if self.manifest.entries('files', restored):
+                            self.uninstall_from_manifest(restored)
+                            if not self.manifest.entries('files', restored):
+                                removed.append(package)
+                            continue
                         cmd = mgr['uninstall_cmd'](package)
-                        self.run_cmd(cmd, f"Uninstalling {package}", check=False)
+                        if not self.run_cmd(cmd, f"Uninstalling {package}", check=False):
+                            removed.append(package)
+
+                if self.manifest.loaded and not self.dry_run:
+                    names = [self.package_name(pkg) for pkg in removed + kept]
+                    self.manifest.forget_packages(section_type, names)
 
     def exec_file_set(self, file_set_name: str, action: str, **kwargs) -> None:
         """Execute file set operations driven by FILE_SETS data."""
@@ -355,18 +2248,59 @@ class Executor:
             if not self.dry_run and file_set_name == 'configs' and not dst_dir.exists():
                 dst_dir.mkdir(parents=True, exist_ok=True)
 
+            op_type = 'link' if kwargs.get('link') else 'copy'
             for entry in file_list:
                 src = src_dir / entry
                 dst = dst_dir / entry
-                self.exec_file_op('copy', src=src, dst=dst, name=entry,
-                                backup=kwargs.get('backup', True))
+                self.exec_file_op(op_type, src=src, dst=dst, name=entry,
+                                backup=kwargs.get('backup', True), file_set=file_set_name)
 
         elif action == 'uninstall':
             self.log(f"Uninstalling {header}", 'header')
 
+            if self.manifest.loaded:
+                self.uninstall_from_manifest(file_set_name)
+                return
+
+            # Links are only removed when they point into our tree; in link
+            # mode regular files are left alone
+            root = src_dir.resolve() if src_dir else None
             for entry in file_list:
                 dst = dst_dir / entry
-                self.exec_file_op('remove', path=dst, name=entry)
+                if root and (dst.is_symlink() or kwargs.get('link')):
+                    self.exec_file_op('unlink', path=dst, name=entry, root=root)
+                else:
+                    self.exec_file_op('remove', path=dst, name=entry)
+
+    def uninstall_from_manifest(self, file_set_name: str) -> None:
+        """Remove exactly the files, links and directories install recorded."""
+        manifest = self.manifest
+        counts = {kind: len(manifest.entries(kind, file_set_name))
+                  for kind in ('files', 'links', 'dirs')}
+
+        if self.dry_run:
+            self.log(f"[DRY-RUN] Would remove {counts['files']} file(s), {counts['links']} link(s) "
+                     f"and {counts['dirs']} directory(ies) recorded in {manifest.path}", 'info')
+            return
+
+        if not any(counts.values()):
+            if self.verbose:
+                self.log("Nothing recorded in the install manifest", 'info')
+            return
+
+        before = dict(manifest.stats)
+        try:
+            kept = manifest.remove(file_set_name, force=self.force,
+                                   progress=self.progress if self.verbose else None)
+        except (OSError, shutil.Error) as e:
+            self.log_failure("Failed to remove installed files", e)
+            return
+
+        done = {key: manifest.stats[key] - before[key] for key in before}
+        self.log(f"Removed {done['removed']} file(s), {done['links']} link(s) and "
+                 f"{done['dirs']} directory(ies)", 'success')
+        for path in kept:
+            self.log(f"Kept {path}: modified since install (use --force to remove)", 'warning')
 
 # ============================================================================
 # HIGH-LEVEL WORKFLOW (Data-driven orchestration)
@@ -443,37 +2377,156 @@ def run_workflow(workflow_name: str, executor: Executor, **kwargs) -> None:
 
     # Display header
     executor.log(workflow['header'](), 'header')
+    executor.manifest.load()
 
     # Execute steps
-    for step in workflow['steps']:
-        step_type = step['type']
-
-        if step_type == 'info_display':
-            messages = step['data']()
-            for msg in messages:
-                executor.log(msg, 'info')
-            print()
-
-            # Backup notice for install workflow
-            if workflow_name == 'install':
-                if kwargs.get('backup', True):
-                    executor.log("Backup enabled: existing files will be backed up before overwriting", 'info')
+    try:
+        for step in workflow['steps']:
+            step_type = step['type']
+
+            if step_type == 'info_display':
+                messages = step['data']()
+                for msg in messages:
+                    executor.log(msg, 'info')
+                print()
+
+                if kwargs.get('link'):
+                    executor.log(f"Link mode: dotfiles are symlinked from "
+                                 f"{PATHS['default_dir'].resolve().parent}", 'info')
+
+                # Backup notice for install workflow
+                if workflow_name == 'install':
+                    if kwargs.get('backup', True):
+                        executor.log("Backup enabled: existing files will be backed up before overwriting", 'info')
+                    else:
+                        executor.log("Backup disabled: existing files will be overwritten without backup", 'warning')
+                elif executor.manifest.loaded:
+                    executor.log(f"Using install manifest: {executor.manifest.path}", 'info')
                 else:
-                    executor.log("Backup disabled: existing files will be overwritten without backup", 'warning')
-
-        elif step_type == 'file_set':
-            executor.exec_file_set(step['name'], step['action'], **kwargs)
-
-        elif step_type == 'sections':
-            sections = reversed(SECTIONS) if step['reverse'] else SECTIONS
-            for section in sections:
-                executor.exec_section(section, step['action'])
-
-        elif step_type == 'summary':
-            print()
-            if workflow_name == 'install' and PATHS['backup_dir'] and PATHS['backup_dir'].exists():
-                executor.log(f"Backups saved to: {PATHS['backup_dir']}", 'info')
-            executor.log(step['message'], 'success')
+                    executor.log("No install manifest found: removing entries listed in the recipe",
+                                 'warning')
+
+            elif step_type == 'file_set':
+                executor.exec_file_set(step['name'], step['action'], **kwargs)
+
+            elif step_type == 'sections':
+                sections = list(reversed(SECTIONS)) if step['reverse'] else SECTIONS
+                workers = kwargs.get('workers', 1) if step['action'] == 'install' else 1
+                if workers > 1:
+                    scheduler = SectionScheduler.from_timings(sections, PATHS['timings'])
+                    lines = scheduler.describe(workers)
+                    for line in lines if executor.dry_run or executor.verbose else lines[-1:]:
+                        executor.log(line, 'info')
+                    if kwargs.get('prefetch'):
+                        executor.log("--prefetch is ignored with --workers > 1: sections already "
+                                     "download in parallel", 'warning')
+                    try:
+                        if executor.dry_run:
+                            plan = sorted(scheduler.schedule(workers),
+                                          key=lambda item: (item['start'], item['worker']))
+                            for item in plan:
+                                executor.exec_section(sections[item['index']], 'install')
+                        else:
+                            scheduler.run(workers,
+                                          lambda section: executor.exec_section(section, 'install'))
+                    finally:
+                        executor.cargo.cleanup()
+                    continue
+                depth = kwargs.get('prefetch', 0) if step['action'] == 'install' else 0
+                if depth and not executor.dry_run and not executor.offline:
+                    skip = ['python_packages'] if executor.wheelhouse else []
+                    executor.prefetcher = Prefetcher(executor.registry, PATHS['prefetch_dir'],
+                                                     depth, skip=skip)
+                try:
+                    for index, section in enumerate(sections):
+                        prefetcher = executor.prefetcher
+                        if prefetcher:
+                            prefetcher.schedule(sections, index)
+                            error = prefetcher.wait(index)
+                            if error and executor.verbose:
+                                executor.log(f"Prefetch failed for {section['name']}: {error}",
+                                             'warning')
+                        executor.exec_section(section, step['action'])
+                finally:
+                    if executor.prefetcher:
+                        executor.prefetcher.shutdown()
+                    executor.cargo.cleanup()
+
+            elif step_type == 'summary':
+                print()
+                if workflow_name == 'install' and kwargs.get('link'):
+                    stats = executor.link_stats
+                    executor.log(f"Dotfiles: {stats['linked']} linked, {stats['current']} already linked, "
+                                 f"{stats['conflicts']} conflicts skipped", 'info')
+                elif workflow_name == 'install':
+                    stats = executor.sync.stats
+                    executor.log(f"Dotfiles: {stats['copied']} copied ({stats['bytes_copied']:,} bytes), "
+                                 f"{stats['skipped']} unchanged ({stats['bytes_skipped']:,} bytes skipped), "
+                                 f"{stats['deleted']} stale removed", 'info')
+                if workflow_name == 'install' and PATHS['backup_dir'] and PATHS['backup_dir'].exists():
+                    store = executor.backups
+                    store.save_index()
+                    store.gc()
+                    executor.log(f"Backups saved to: {PATHS['backup_dir']} "
+                                 f"({store.stats['files']} files, {store.stats['stored']} new, "
+                                 f"{store.stats['linked']} deduplicated, "
+                                 f"{store.stats['bytes_stored']:,} bytes stored)", 'info')
+                    if store.stats['pruned_snapshots']:
+                        executor.log(f"Pruned {store.stats['pruned_snapshots']} old backup snapshot(s) "
+                                     f"and {store.stats['pruned_objects']} unreferenced object(s)", 'info')
+                prefetcher = executor.prefetcher
+                if prefetcher and prefetcher.stats['scheduled']:
+                    stats = prefetcher.stats
+                    executor.log(f"Prefetch: {stats['scheduled']} section(s) downloaded ahead "
+                                 f"({stats['bytes']:,} bytes in {stats['seconds']:.1f}s); "
+                                 f"{stats['ready']} ready at install, {stats['waited']} waited "
+                                 f"{stats['wait_seconds']:.1f}s, {stats['failed']} failed", 'info')
+                if executor.wheelhouse and any(executor.wheelhouse_stats.values()):
+                    stats = executor.wheelhouse_stats
+                    executor.log(f"Wheelhouse: {stats['installed']} install(s) from "
+                                 f"{executor.wheelhouse}, {stats['fallbacks']} fell back "
+                                 f"to the package index", 'info')
+                ccache = executor.compiler_cache.delta()
+                if ccache:
+                    total = ccache['hits'] + ccache['misses']
+                    rate = f" ({100 * ccache['hits'] // total}% hit rate)" if total else ""
+                    executor.log(f"Compiler cache: {ccache['hits']} hits, {ccache['misses']} misses"
+                                 f"{rate} in {executor.compiler_cache.cache_dir}", 'info')
+                artifacts = executor.artifacts.stats
+                if any(artifacts.values()):
+                    executor.log(f"Build artifacts: {artifacts['installed']} prebuilt installed, "
+                                 f"{artifacts['built']} built and stored in "
+                                 f"{executor.artifacts.root}", 'info')
+                rust_cache = executor.rust_cache
+                if rust_cache and any(rust_cache.stats.values()):
+                    stats = rust_cache.stats
+                    executor.log(f"Rust cache: {stats['restored']} crate(s) restored, "
+                                 f"{stats['built']} built, {stats['stored']} stored in "
+                                 f"{rust_cache.root}", 'info')
+                if workflow_name == 'install' and executor.timer.steps and not executor.dry_run:
+                    executor.log("Slowest steps:", 'info')
+                    for row in executor.timer.slowest():
+                        print(f"  {row}")
+                manifest = executor.manifest
+                if workflow_name == 'install' and not executor.dry_run:
+                    added = sum(len(p['installed']) for p in manifest.data['packages'].values())
+                    executor.log(f"Install manifest: {manifest.path} "
+                                 f"({len(manifest.data['files'])} files, "
+                                 f"{len(manifest.data['links'])} links, {added} packages added)", 'info')
+                elif workflow_name == 'uninstall' and manifest.stats['modified']:
+                    executor.log(f"{manifest.stats['modified']} modified file(s) kept and still "
+                                 f"recorded in {manifest.path}", 'warning')
+                executor.log(step['message'], 'success')
+    finally:
+        # Record whatever was installed, even if a later step failed
+        if not executor.dry_run:
+            executor.manifest.save()
+        if workflow_name == 'install' and executor.timer.steps and not executor.dry_run:
+            try:
+                path = executor.timer.write(workflow_name, PATHS['timings'])
+                executor.log(f"Step timings: {path}", 'info')
+            except OSError as e:
+                executor.log(f"Could not write step timings: {e}", 'warning')
 
 # ============================================================================
 # CLI INTERFACE
@@ -481,6 +2534,10 @@ def run_workflow(workflow_name: str, executor: Executor, **kwargs) -> None:
 
 def main():
     """Main entry point with argparse interface."""
+    # Internal entry point: shell sections call back here for "git clone"
+    if sys.argv[1:2] == ['git-clone']:
+        sys.exit(GitMirror(Path(sys.argv[2])).clone(sys.argv[3:]))
+
     parser = argparse.ArgumentParser(
         description=f"Setup script for {RECIPE['name']}",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -491,10 +2548,27 @@ Examples:
   %(prog)s install --dry-run       # Show what would be installed
   %(prog)s install --verbose       # Verbose output with backup details
   %(prog)s install --no-backup     # Install without backing up existing files
+  %(prog)s install --checksum      # Detect changed dotfiles by content hash
+  %(prog)s install --link          # Symlink dotfiles instead of copying them
+  %(prog)s install --offline offline  # Install packages from an offline bundle
+  %(prog)s install --wheelhouse /mnt/wheels  # Install python packages from shared wheels
+  %(prog)s install --rust-cache /mnt/rust    # Share prebuilt rust binaries
+  %(prog)s install --git-mirror /mnt/git     # Share mirrors of cloned repositories
+  %(prog)s install --artifacts /mnt/debs     # Share packaged source builds
+  %(prog)s install --systemd-scope           # Contain heavy builds in cgroups
+  %(prog)s install --workers 3 --dry-run     # Show the parallel schedule
   %(prog)s uninstall --dry-run -v  # Show what would be uninstalled
+  %(prog)s uninstall --force       # Also remove dotfiles edited since install
 
 Note: By default, existing dotfiles and config files are backed up to
-      ~/.dotfiles_backup_<timestamp>/ before being overwritten.
+      ~/.dotfiles_backup/snapshots/<timestamp>/ before being overwritten.
+      Unchanged content is hardlinked between snapshots and only the
+      newest --backup-keep snapshots are retained. Dotfiles
+      are synced incrementally: only changed files are copied and files
+      no longer in the source tree are removed. Install records what it
+      wrote in ~/.local/state/start-vm/, and uninstall removes exactly that.
+      Install times every section, hook and package install, prints the
+      slowest and writes them all to ~/.dotfiles_backup/timings/.
         """
     )
 
@@ -518,6 +2592,126 @@ Note: By default, existing dotfiles and config files are backed up to
         action='store_true',
         help='Skip backing up existing files (default: backup enabled)'
     )
+    parser.add_argument(
+        '--link',
+        action='store_true',
+        help='Symlink dotfiles and configs from this checkout instead of copying; '
+             'on uninstall, only remove links into this checkout'
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Download packages for up to N upcoming sections while the current one '
+             'installs (default: 0, off)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Install independent sections on N workers, longest recorded first; '
+             'shell and pre_install sections still run alone, in order (default: 1)'
+    )
+    parser.add_argument(
+        '--offline',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help='Install packages from an extracted offline bundle (start_vm.py --offline-bundle)'
+    )
+    parser.add_argument(
+        '--wheelhouse',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help='Install python packages from prebuilt wheels (start_vm.py --build-wheelhouse) '
+             f"when present (default: {PATHS['wheelhouse']})"
+    )
+    parser.add_argument(
+        '--rust-cache',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help='Reuse and populate prebuilt rust binaries in DIR, e.g. ~/.cache/start-vm/rust '
+             '(default: no cache)'
+    )
+    parser.add_argument(
+        '--cargo-jobs',
+        type=int,
+        default=None,
+        metavar='N',
+        help='Parallel rustc jobs for cargo builds (default: cores, capped by free memory)'
+    )
+    parser.add_argument(
+        '--cargo-target-dir',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help='Shared, kept target dir for cargo builds (default: a temporary one, '
+             'on tmpfs when memory allows)'
+    )
+    parser.add_argument(
+        '--ccache-dir',
+        type=Path,
+        default=PATHS['ccache_dir'],
+        metavar='DIR',
+        help=f"ccache directory for build_cache sections (default: {PATHS['ccache_dir']})"
+    )
+    parser.add_argument(
+        '--git-mirror',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help='Clone repositories in shell sections through bare mirrors in DIR, '
+             'e.g. ~/.cache/start-vm/git (default: no mirrors)'
+    )
+    parser.add_argument(
+        '--artifacts',
+        type=Path,
+        default=PATHS['artifacts'],
+        metavar='DIR',
+        help=f"Packaged builds of build_artifact sections (default: {PATHS['artifacts']})"
+    )
+    parser.add_argument(
+        '--systemd-scope',
+        action='store_true',
+        help='Run sections with resources: hints in a transient systemd scope '
+             '(CPUWeight, MemoryMax) when systemd is available'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='On uninstall, also remove installed files modified since install, '
+             'and packages not known to be absent before install'
+    )
+    parser.add_argument(
+        '--backup-keep',
+        type=int,
+        default=10,
+        metavar='N',
+        help='Number of backup snapshots to retain (default: 10)'
+    )
+    parser.add_argument(
+        '--backup-max-age',
+        type=int,
+        default=None,
+        metavar='DAYS',
+        help='Also prune backup snapshots older than DAYS (newest is always kept)'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=CopyPool.DEFAULT_WORKERS,
+        metavar='N',
+        help=f'Parallel file copy workers (default: {CopyPool.DEFAULT_WORKERS})'
+    )
+    parser.add_argument(
+        '--checksum',
+        action='store_true',
+        help='Compare dotfiles by content hash instead of size and mtime'
+    )
     parser.add_argument(
         '--version',
         action='version',
@@ -530,7 +2724,32 @@ Note: By default, existing dotfiles and config files are backed up to
     current_platform = platform.system().lower()
     current_platform = 'darwin' if current_platform == 'darwin' else current_platform
 
-    executor = Executor(dry_run=args.dry_run, verbose=args.verbose)
+    offline = None
+    if args.offline:
+        try:
+            offline = OfflineBundle(args.offline)
+        except (OSError, ValueError) as e:
+            print(f"Cannot use offline bundle {args.offline}: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    # The wheelhouse is optional: without wheels, packages come from the index
+    wheelhouse = args.wheelhouse or PATHS['wheelhouse']
+    if not (wheelhouse.is_dir() and any(wheelhouse.glob('*.whl'))):
+        if args.wheelhouse:
+            print(f"No wheels in {args.wheelhouse}, using the package index", file=sys.stderr)
+        wheelhouse = None
+
+    executor = Executor(dry_run=args.dry_run, verbose=args.verbose,
+                        checksum=args.checksum, backup_keep=args.backup_keep,
+                        backup_max_age=args.backup_max_age, jobs=args.jobs,
+                        force=args.force, offline=offline,
+                        wheelhouse=wheelhouse.resolve() if wheelhouse else None,
+                        rust_cache=RustCache(args.rust_cache) if args.rust_cache else None,
+                        cargo=CargoBuildEnv(args.cargo_target_dir, jobs=args.cargo_jobs),
+                        compiler_cache=CompilerCache(args.ccache_dir),
+                        git_mirror=GitMirror(args.git_mirror.resolve()) if args.git_mirror else None,
+                        artifacts=ArtifactCache(args.artifacts.resolve()),
+                        governor=ResourceGovernor(scope=args.systemd_scope))
 
     if args.verbose:
         executor.log(f"Current platform: {current_platform}", 'info')
@@ -547,7 +2766,8 @@ Note: By default, existing dotfiles and config files are backed up to
     # Execute workflow
     try:
         if args.action == 'install':
-            run_workflow('install', executor, backup=not args.no_backup)
+            run_workflow('install', executor, backup=not args.no_backup, link=args.link,
+                         prefetch=args.prefetch, workers=args.workers)
         elif args.action == 'uninstall':
             if not args.dry_run:
                 executor.log("This will remove installed packages and files!", 'warning')
@@ -555,7 +2775,7 @@ Note: By default, existing dotfiles and config files are backed up to
                 if response.lower() != 'y':
                     executor.log("Aborted", 'info')
                     sys.exit(0)
-            run_workflow('uninstall', executor)
+            run_workflow('uninstall', executor, link=args.link)
     except KeyboardInterrupt:
         print()
         executor.log("Interrupted by user", 'warning')
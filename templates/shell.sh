@@ -43,10 +43,72 @@ CONFIG_FILES=(
 DRY_RUN=false
 VERBOSE=false
 BACKUP=true
+CHECKSUM=false
+LINK=false
 ACTION=""
 
-# Backup directory (will be set dynamically with timestamp)
+# Extracted offline bundle (start_vm.py --offline-bundle) to install from
+OFFLINE_DIR=""
+
+# Prebuilt wheels (start_vm.py --build-wheelhouse), used when present
+WHEELHOUSE="wheelhouse"
+
+# Prebuilt cargo install binaries (--rust-cache), keyed by crate, version,
+# target triple and rustc release; a plain directory that may be shared
+RUST_CACHE=""
+CARGO_BIN="${CARGO_HOME:-$HOME/.cargo}/bin"
+
+# Cargo builds share one target dir (removed on exit unless given with
+# --cargo-target-dir) and a job count capped by cores and free memory
+CARGO_JOBS=""
+CARGO_ENV_DONE=false
+CARGO_TARGET_OWNED=""
+
+# ccache for shell sections with build_cache: true
+BUILD_CACHE_DIR="${CCACHE_DIR:-$HOME/.cache/start-vm/ccache}"
+BUILD_CACHE_VARS=(CCACHE_DIR CCACHE_UMASK CC CXX CMAKE_C_COMPILER_LAUNCHER CMAKE_CXX_COMPILER_LAUNCHER MAKEFLAGS)
+BUILD_CACHE_SAVED=()
+BUILD_CACHE_BASELINE=""
+
+# Bare mirrors of the repositories shell sections clone (--git-mirror)
+GIT_MIRROR=""
+
+# Packaged builds of shell sections with build_artifact: true
+ARTIFACT_DIR="$HOME/.cache/start-vm/artifacts"
+ARTIFACT_KEY=""
+ARTIFACT_STAGE=""
+ARTIFACT_INSTALLED=0
+ARTIFACT_BUILT=0
+
+# Variables the sudo function keeps while a section builds
+SUDO_PRESERVE=()
+
+# Backup snapshots live under BACKUP_ROOT; BACKUP_DIR is set dynamically
+# to a timestamped snapshot and PREV_BACKUP to the snapshot before it
+BACKUP_ROOT="$HOME/.dotfiles_backup"
 BACKUP_DIR=""
+PREV_BACKUP=""
+BACKUP_KEEP=10
+
+# Step timings: sections, hooks and package-manager calls, written as JSON
+# under TIMING_DIR. TIMING_OPEN is the stack of running steps.
+TIMING_DIR="$BACKUP_ROOT/timings"
+TIMING_STARTED=""
+TIMING_STAMP=""
+TIMING_STEPS=()
+TIMING_OPEN=()
+TIMING_DEPTH=0
+TIMING_SECTION=""
+TIMING_DONE=false
+
+# Dotfile sync counters (entries updated / already up to date)
+SYNC_UPDATED=0
+SYNC_SKIPPED=0
+
+# Link mode counters (links created / already linked / conflicts skipped)
+LINK_CREATED=0
+LINK_CURRENT=0
+LINK_CONFLICTS=0
 
 print_header() {
     echo
@@ -90,6 +152,78 @@ run_command() {
     fi
 }
 
+latest_backup_snapshot() {
+    local snapshot
+    local latest=""
+    for snapshot in "$BACKUP_ROOT"/snapshots/*/; do
+        if [ -d "$snapshot" ]; then
+            latest="${snapshot%/}"
+        fi
+    done
+    echo "$latest"
+}
+
+# Copy into a backup snapshot. Files unchanged since the previous snapshot
+# are hardlinked (rsync --link-dest, or cmp without rsync); otherwise
+# copy-on-write clones are used where the filesystem supports them.
+snapshot_copy() {
+    local src="$1"
+    local dst="$2"
+    local prev="$3"
+
+    if command -v rsync >/dev/null 2>&1; then
+        if [ -d "$src" ] && [ ! -L "$src" ]; then
+            if [ -d "$prev" ]; then
+                rsync -a --link-dest="$prev/" "$src/" "$dst/"
+            else
+                rsync -a "$src/" "$dst/"
+            fi
+        elif [ -e "$prev" ]; then
+            rsync -a --link-dest="$(dirname "$prev")/" "$src" "$dst"
+        else
+            rsync -a "$src" "$dst"
+        fi
+    else
+        if ! cp -rf --reflink=auto "$src" "$dst" 2>/dev/null; then
+            rm -rf "$dst"
+            cp -rf "$src" "$dst" || return 1
+        fi
+        if [ -n "$prev" ] && [ -e "$prev" ]; then
+            local file old
+            while IFS= read -r -d '' file; do
+                old="$prev${file#"$dst"}"
+                if [ -f "$old" ] && [ ! -L "$old" ] && cmp -s "$file" "$old" \
+                    && ln "$old" "$file.link.$$" 2>/dev/null; then
+                    mv -f "$file.link.$$" "$file"
+                fi
+            done < <(find "$dst" -type f -print0)
+        fi
+    fi
+}
+
+# Retention: keep only the newest BACKUP_KEEP snapshots
+prune_backups() {
+    local snapshots=()
+    local count=0
+    local snapshot
+    for snapshot in "$BACKUP_ROOT"/snapshots/*/; do
+        if [ -d "$snapshot" ]; then
+            snapshots+=("${snapshot%/}")
+            count=$((count + 1))
+        fi
+    done
+
+    local keep=$((BACKUP_KEEP < 1 ? 1 : BACKUP_KEEP))
+    local excess=$((count - keep))
+    local i
+    for ((i = 0; i < excess; i++)); do
+        rm -rf "${snapshots[$i]}"
+    done
+    if [ "$excess" -gt 0 ]; then
+        print_info "Pruned $excess old backup snapshot(s)"
+    fi
+}
+
 backup_file_or_dir() {
     local path="$1"
     local name="$2"
@@ -99,7 +233,8 @@ backup_file_or_dir() {
     fi
 
     if [ -z "$BACKUP_DIR" ]; then
-        BACKUP_DIR="$HOME/.dotfiles_backup_$(date +%Y%m%d_%H%M%S)"
+        PREV_BACKUP=$(latest_backup_snapshot)
+        BACKUP_DIR="$BACKUP_ROOT/snapshots/$(date +%Y%m%d_%H%M%S)"
     fi
 
     local backup_path="$BACKUP_DIR/$name"
@@ -116,7 +251,12 @@ backup_file_or_dir() {
     # Create backup directory structure
     mkdir -p "$(dirname "$backup_path")"
 
-    if cp -rf "$path" "$backup_path"; then
+    local prev_path=""
+    if [ -n "$PREV_BACKUP" ] && [ "$PREV_BACKUP" != "$BACKUP_DIR" ]; then
+        prev_path="$PREV_BACKUP/$name"
+    fi
+
+    if snapshot_copy "$path" "$backup_path" "$prev_path"; then
         if [ "$VERBOSE" = true ]; then
             print_success "Backed up to $backup_path"
         fi
@@ -127,21 +267,87 @@ backup_file_or_dir() {
     fi
 }
 
+# Incremental sync: only changed files are copied and stale files removed.
+# Uses rsync when available, otherwise falls back to a full copy of the
+# entries diff finds changed.
+sync_file_or_dir() {
+    local src="$1"
+    local dst="$2"
+    shift 2
+
+    if command -v rsync >/dev/null 2>&1; then
+        local opts=(-a --delete "$@")
+        if [ "$CHECKSUM" = true ]; then
+            opts+=(--checksum)
+        fi
+        if [ -d "$src" ]; then
+            rsync "${opts[@]}" "$src/" "$dst/"
+        else
+            rsync "${opts[@]}" "$src" "$dst"
+        fi
+    elif [ "$#" -gt 0 ]; then
+        # Without rsync, list the differences diff finds (or any error it prints)
+        diff -rq --no-dereference "$src" "$dst" 2>&1 || true
+    else
+        if [ -d "$src" ] || [ -L "$dst" ]; then
+            rm -rf "$dst"
+        fi
+        cp -rf "$src" "$dst"
+    fi
+}
+
+# Print the pending changes (one per line) needed to bring dst up to date
+pending_changes() {
+    local src="$1"
+    local dst="$2"
+
+    if [ ! -e "$dst" ] && [ ! -L "$dst" ]; then
+        echo "$dst"
+        return 0
+    fi
+    if [ -d "$src" ] && { [ -L "$dst" ] || [ ! -d "$dst" ]; }; then
+        echo "$dst"
+        return 0
+    fi
+    if [ ! -d "$src" ] && [ -d "$dst" ] && [ ! -L "$dst" ]; then
+        echo "$dst"
+        return 0
+    fi
+    sync_file_or_dir "$src" "$dst" --dry-run --itemize-changes | grep -v '^\.d' || true
+}
+
 copy_file_or_dir() {
     local src="$1"
     local dst="$2"
     local name="$3"
 
-    if [ "$DRY_RUN" = true ]; then
-        if [ -e "$dst" ] && [ "$BACKUP" = true ]; then
-            print_info "[DRY-RUN] Would backup existing $dst"
+    if [ ! -e "$src" ]; then
+        if [ "$DRY_RUN" = true ]; then
+            print_info "[DRY-RUN] Would copy $src to $dst"
+        else
+            print_warning "Source not found: $src"
         fi
-        print_info "[DRY-RUN] Would copy $src to $dst"
         return 0
     fi
 
-    if [ ! -e "$src" ]; then
-        print_warning "Source not found: $src"
+    local changes
+    changes=$(pending_changes "$src" "$dst" | wc -l | tr -d ' ')
+
+    if [ "$changes" -eq 0 ]; then
+        SYNC_SKIPPED=$((SYNC_SKIPPED + 1))
+        if [ "$DRY_RUN" = true ]; then
+            print_info "[DRY-RUN] Up to date: $name"
+        elif [ "$VERBOSE" = true ]; then
+            print_success "Up to date: $name"
+        fi
+        return 0
+    fi
+
+    if [ "$DRY_RUN" = true ]; then
+        if [ -e "$dst" ] && [ "$BACKUP" = true ]; then
+            print_info "[DRY-RUN] Would backup existing $dst"
+        fi
+        print_info "[DRY-RUN] Would sync $src to $dst ($changes changes)"
         return 0
     fi
 
@@ -151,18 +357,137 @@ copy_file_or_dir() {
     fi
 
     print_info "Installing $name"
-    if [ "$VERBOSE" = true ] && [ -e "$dst" ]; then
-        print_warning "Overwriting existing $dst"
+
+    # Replace entries whose type changed (e.g. a file where a dir is expected)
+    if [ -d "$src" ] && { [ -L "$dst" ] || { [ -e "$dst" ] && [ ! -d "$dst" ]; }; }; then
+        rm -f "$dst"
+    elif [ ! -d "$src" ] && [ -d "$dst" ] && [ ! -L "$dst" ]; then
+        rm -rf "$dst"
     fi
 
-    if cp -rf "$src" "$dst"; then
-        print_success "Installed $name"
+    if sync_file_or_dir "$src" "$dst"; then
+        SYNC_UPDATED=$((SYNC_UPDATED + 1))
+        print_success "Installed $name ($changes changes)"
     else
         print_error "Failed to copy $name"
         return 1
     fi
 }
 
+# Absolute, symlink-free path of an existing file or directory
+abs_path() {
+    echo "$(cd "$(dirname "$1")" && pwd -P)/$(basename "$1")"
+}
+
+link_file_or_dir() {
+    local src="$1"
+    local dst="$2"
+    local name="$3"
+
+    if [ ! -e "$src" ]; then
+        print_warning "Source not found: $src"
+        return 0
+    fi
+
+    local target
+    target=$(abs_path "$src")
+
+    if [ -L "$dst" ] && [ "$(readlink "$dst")" = "$target" ]; then
+        LINK_CURRENT=$((LINK_CURRENT + 1))
+        if [ "$DRY_RUN" = true ]; then
+            print_info "[DRY-RUN] Already linked: $name"
+        elif [ "$VERBOSE" = true ]; then
+            print_success "Already linked: $name"
+        fi
+        return 0
+    fi
+
+    # Anything else at dst is a conflict: back it up and replace it.
+    # Without backups only stray symlinks are replaced.
+    local conflict=false
+    if [ -e "$dst" ] || [ -L "$dst" ]; then
+        conflict=true
+    fi
+    if [ "$conflict" = true ] && [ "$BACKUP" = false ] && [ ! -L "$dst" ]; then
+        LINK_CONFLICTS=$((LINK_CONFLICTS + 1))
+        print_warning "Conflict: $dst exists and backup is disabled, skipping $name"
+        return 0
+    fi
+
+    if [ "$DRY_RUN" = true ]; then
+        if [ "$conflict" = true ]; then
+            print_info "[DRY-RUN] Would backup and replace existing $dst"
+        fi
+        print_info "[DRY-RUN] Would link $dst -> $target"
+        return 0
+    fi
+
+    if [ "$conflict" = true ]; then
+        if [ "$BACKUP" = true ]; then
+            backup_file_or_dir "$dst" "$name"
+        fi
+        rm -rf "$dst"
+    fi
+
+    if ln -s "$target" "$dst"; then
+        LINK_CREATED=$((LINK_CREATED + 1))
+        print_success "Linked $name -> $target"
+    else
+        print_error "Failed to link $name"
+        return 1
+    fi
+}
+
+# Remove a link only if it points into root (our checkout)
+unlink_if_ours() {
+    local path="$1"
+    local root="$2"
+    local name="$3"
+
+    if [ ! -L "$path" ]; then
+        if [ "$VERBOSE" = true ]; then
+            print_warning "Not a link, leaving $path"
+        fi
+        return 0
+    fi
+
+    local root_abs
+    if ! root_abs=$(cd "$root" 2>/dev/null && pwd -P); then
+        print_warning "Not removing $path: source tree $root not found"
+        return 0
+    fi
+
+    case "$(readlink "$path")" in
+        "$root_abs"|"$root_abs"/*)
+            if [ "$DRY_RUN" = true ]; then
+                print_info "[DRY-RUN] Would remove link $path"
+            elif rm -f "$path"; then
+                print_success "Removed link $name"
+            else
+                print_error "Failed to remove link $name"
+                return 1
+            fi
+            ;;
+        *)
+            print_warning "Not removing $path: it does not link into $root_abs"
+            ;;
+    esac
+}
+
+# Uninstall one dotfile entry: links are only removed when they point into
+# our tree, and in link mode regular files are left alone
+uninstall_file_or_dir() {
+    local path="$1"
+    local root="$2"
+    local name="$3"
+
+    if [ -L "$path" ] || [ "$LINK" = true ]; then
+        unlink_if_ours "$path" "$root" "$name"
+    else
+        remove_file_or_dir "$path" "$name"
+    fi
+}
+
 remove_file_or_dir() {
     local path="$1"
     local name="$2"
@@ -194,6 +519,584 @@ strip_version_spec() {
     echo "$package" | sed -E 's/(==|>=|<=|>|<|~=|!=|=|:|@).*//'
 }
 
+# Package installers: with --offline DIR, packages come from the extracted
+# offline bundle and nothing is downloaded
+offline_debs() {
+    local pkg
+    for pkg in "$@"; do
+        pkg=$(strip_version_spec "$pkg")
+        sed "s|^|$OFFLINE_DIR/debian/|" "$OFFLINE_DIR/debian/$pkg.closure"
+    done | awk '!seen[$0]++'
+}
+
+apt_install() {
+    if [ -n "$OFFLINE_DIR" ]; then
+        local debs
+        mapfile -t debs < <(offline_debs "$@")
+        sudo apt-get install -y --no-download "${debs[@]}"
+    else
+        sudo apt-get install -y "$@"
+    fi
+}
+
+pip_install() {
+    if [ -n "$OFFLINE_DIR" ]; then
+        sudo -H pip3 install --no-index --find-links "$OFFLINE_DIR/python" "$@"
+    elif compgen -G "$WHEELHOUSE/*.whl" > /dev/null; then
+        sudo -H pip3 install --no-index --find-links "$WHEELHOUSE" "$@" || {
+            print_warning "Wheelhouse $WHEELHOUSE is incomplete, using the package index"
+            sudo -H pip3 install "$@"
+        }
+    else
+        sudo -H pip3 install "$@"
+    fi
+}
+
+gem_install() {
+    if [ -n "$OFFLINE_DIR" ]; then
+        # --local resolves dependencies from .gem files in the working directory
+        (cd "$OFFLINE_DIR/ruby" && gem install --local --no-document "$(strip_version_spec "$1")")
+    else
+        gem install "$1"
+    fi
+}
+
+rust_cache_entry() {
+    local crate="$1" version="$2" toolchain host release
+    toolchain=$(rustc -vV 2>/dev/null) || return 1
+    host=$(sed -n 's/^host: //p' <<< "$toolchain")
+    release=$(sed -n 's/^release: //p' <<< "$toolchain")
+    [ -n "$version" ] && [ -n "$host" ] || return 1
+    echo "$RUST_CACHE/$crate/$version/$host/rustc-$release"
+}
+
+rust_cache_store() {
+    local crate="$1" listing version entry staging name
+    local binaries=()
+    # "<crate> v<version>[ (<source>)]:" followed by indented binary names
+    listing=$(cargo install --list 2>/dev/null | awk -v crate="$crate" '
+        /^[^ ]/ { found = ($1 == crate); if (found) { sub(/^v/, "", $2); sub(/:$/, "", $2); print $2 }; next }
+        found { print $1 }')
+    version=$(head -n 1 <<< "$listing")
+    mapfile -t binaries < <(tail -n +2 <<< "$listing")
+    [ -n "$version" ] && [ -n "${binaries[*]}" ] || return 0
+    entry=$(rust_cache_entry "$crate" "$version") || return 0
+    [ -e "$entry" ] && return 0
+
+    # Stage, then rename into place so readers never see a partial entry
+    staging="$(dirname "$entry")/.$(basename "$entry").$$.tmp"
+    mkdir -p "$staging/bin"
+    for name in "${binaries[@]}"; do
+        cp -p "$CARGO_BIN/$name" "$staging/bin/"
+    done
+    printf '{"crate": "%s", "version": "%s", "target": "%s", "rustc": "%s", "binaries": [%s]}\n' \
+        "$crate" "$version" "$(basename "$(dirname "$entry")")" "${entry##*/rustc-}" \
+        "$(printf '"%s", ' "${binaries[@]}" | sed 's/, $//')" > "$staging/entry.json"
+    if [ -e "$entry" ]; then
+        rm -rf "$staging"
+    else
+        mv "$staging" "$entry"
+        print_info "Cached $crate $version in $entry"
+    fi
+}
+
+cargo_build_env() {
+    [ "$CARGO_ENV_DONE" = true ] && return 0
+    CARGO_ENV_DONE=true
+    local mem_kb="" shm_kb root jobs
+    if [ -r /proc/meminfo ]; then
+        mem_kb=$(awk '/^MemAvailable:/ {print $2}' /proc/meminfo)
+    fi
+    if [ -z "${CARGO_TARGET_DIR:-}" ]; then
+        # tmpfs when at least 4 GiB of memory and /dev/shm space are free
+        root="$HOME/.cache/start-vm/cargo-target"
+        shm_kb=$(df -Pk /dev/shm 2>/dev/null | awk 'NR == 2 {print $4}')
+        if [ -n "$mem_kb" ] && [ -n "$shm_kb" ] && [ "$mem_kb" -ge 4194304 ] && [ "$shm_kb" -ge 4194304 ]; then
+            root="/dev/shm/start-vm-cargo-target"
+            mem_kb=$((mem_kb - 2097152))
+        fi
+        CARGO_TARGET_OWNED="$root/$$"
+        export CARGO_TARGET_DIR="$CARGO_TARGET_OWNED"
+        mkdir -p "$CARGO_TARGET_DIR"
+    fi
+    if [ -z "${CARGO_BUILD_JOBS:-}" ]; then
+        jobs=${CARGO_JOBS:-$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)}
+        # About 1.5 GiB per rustc / linker job
+        if [ -z "$CARGO_JOBS" ] && [ -n "$mem_kb" ] && [ $((mem_kb / 1572864)) -lt "$jobs" ]; then
+            jobs=$((mem_kb / 1572864))
+            [ "$jobs" -ge 1 ] || jobs=1
+        fi
+        export CARGO_BUILD_JOBS="$jobs"
+    fi
+    print_info "Cargo builds: CARGO_TARGET_DIR=$CARGO_TARGET_DIR, CARGO_BUILD_JOBS=$CARGO_BUILD_JOBS"
+}
+
+cargo_build_cleanup() {
+    if [ -n "$CARGO_TARGET_OWNED" ]; then
+        rm -rf "$CARGO_TARGET_OWNED"
+        rmdir "$(dirname "$CARGO_TARGET_OWNED")" 2>/dev/null || true
+        CARGO_TARGET_OWNED=""
+    fi
+}
+
+# Version cargo install picks for an unpinned crate, by exact name
+crate_latest_version() {
+    curl -fsSL --max-time 30 -A "start-vm rust cache" "https://crates.io/api/v1/crates/$1" 2>/dev/null |
+        sed -n 's/.*"max_stable_version":"\([^"]*\)".*/\1/p'
+}
+
+cargo_install() {
+    if [ -z "$OFFLINE_DIR" ] && [ -n "$RUST_CACHE" ]; then
+        local crate version entry
+        crate=$(strip_version_spec "$1")
+        version="${1#*@}"
+        if [ "$version" = "$1" ]; then
+            version=$(crate_latest_version "$crate")
+        fi
+        entry=$(rust_cache_entry "$crate" "$version") || entry=""
+        if [ -n "$entry" ] && [ -f "$entry/entry.json" ]; then
+            mkdir -p "$CARGO_BIN"
+            cp -p "$entry"/bin/* "$CARGO_BIN"/
+            print_info "Restored $crate $version from $entry"
+            return 0
+        fi
+        cargo_build_env
+        cargo install "$1"
+        rust_cache_store "$crate"
+        return
+    fi
+    cargo_build_env
+    if [ -z "$OFFLINE_DIR" ]; then
+        cargo install "$1"
+        return
+    fi
+    local crate
+    crate="$OFFLINE_DIR/rust/$(strip_version_spec "$1")"
+    if [ -d "$crate/vendor" ]; then
+        cargo install --offline --path "$crate" \
+            --config "source.crates-io.replace-with='vendored-sources'" \
+            --config "source.vendored-sources.directory='$crate/vendor'"
+    else
+        cargo install --offline --path "$crate"
+    fi
+}
+
+cargo_uninstall() {
+    local crate="$1" bin
+    if cargo install --list 2>/dev/null | grep -q "^$crate "; then
+        cargo uninstall "$crate"
+        return
+    fi
+    # Restored from the rust artifact cache: cargo does not track these, so
+    # remove binaries that are still identical to a cached copy
+    [ -n "$RUST_CACHE" ] || return 0
+    for bin in "$RUST_CACHE/$crate"/*/*/*/bin/*; do
+        if [ -f "$bin" ] && cmp -s "$bin" "$CARGO_BIN/$(basename "$bin")"; then
+            rm -f "$CARGO_BIN/$(basename "$bin")"
+        fi
+    done
+}
+
+# Git mirrors: a git clone in a shell section first creates or fetches a
+# bare mirror of the remote, then clones with --reference-if-able and
+# --dissociate, so only new objects come from the network. Submodules are
+# handled one by one: --dissociate drops the alternates they would use.
+# Shallow and partial clones bypass the mirrors.
+GIT_REMOTE_RE='^([a-z][a-z0-9+.-]*://|[^/:@]+@[^/:]+:)'
+
+git_mirror_path() {
+    local rest="${1#*://}"
+    rest="${rest#*@}"
+    rest="${rest/:/\/}"
+    rest="${rest%/}"
+    echo "$GIT_MIRROR/${rest%.git}.git"
+}
+
+git_mirror_update() {
+    local url="$1" path staging
+    path="$(git_mirror_path "$url")"
+    if [ -f "$path/HEAD" ]; then
+        # A stale mirror still saves most of the download
+        command git --git-dir "$path" fetch --prune --quiet ||
+            print_warning "Could not update mirror $path, using it as is" >&2
+    else
+        staging="$(dirname "$path")/.$(basename "$path").$$.tmp"
+        rm -rf "$staging"
+        mkdir -p "$(dirname "$path")"
+        if ! command git clone --mirror --quiet "$url" "$staging"; then
+            rm -rf "$staging"
+            print_warning "Could not mirror $url, cloning without a mirror" >&2
+            return 1
+        fi
+        # Another run may have created the same mirror first
+        if [ -e "$path" ]; then
+            rm -rf "$staging"
+        else
+            mv "$staging" "$path"
+        fi
+    fi
+    echo "$path"
+}
+
+git_mirror_submodules() {
+    local worktree="$1" url="$2" key name sub_path sub_url base mirror reference
+    [ -f "$worktree/.gitmodules" ] || return 0
+    while read -r key sub_url; do
+        name="${key#submodule.}"
+        name="${name%.url}"
+        sub_path="$(command git config -f "$worktree/.gitmodules" "submodule.$name.path")" || continue
+        # Relative URLs are relative to the superproject's remote
+        case "$sub_url" in
+            ./*|../*)
+                base="${url%/}"
+                while :; do
+                    case "$sub_url" in
+                        ../*) sub_url="${sub_url#../}"; base="${base%/*}" ;;
+                        ./*) sub_url="${sub_url#./}" ;;
+                        *) break ;;
+                    esac
+                done
+                sub_url="$base/$sub_url"
+                ;;
+        esac
+        reference=()
+        if [[ "$sub_url" =~ $GIT_REMOTE_RE ]] && mirror="$(git_mirror_update "$sub_url")"; then
+            reference=(--reference "$mirror" --dissociate)
+        fi
+        command git -C "$worktree" submodule update --init "${reference[@]}" -- "$sub_path" || return 1
+        git_mirror_submodules "$worktree/$sub_path" "$sub_url" || return 1
+    done < <(command git config -f "$worktree/.gitmodules" --get-regexp '^submodule\..*\.url$')
+}
+
+# Split git clone arguments into GIT_CLONE_POSITIONAL (remote, directory),
+# GIT_CLONE_BRANCH, GIT_CLONE_RECURSE, GIT_CLONE_SHALLOW and GIT_CLONE_ARGS
+# (the rest)
+git_clone_parse() {
+    local arg option=""
+    GIT_CLONE_POSITIONAL=() GIT_CLONE_ARGS=() GIT_CLONE_BRANCH="" GIT_CLONE_RECURSE=false
+    GIT_CLONE_SHALLOW=false
+    for arg in "$@"; do
+        if [ -n "$option" ]; then
+            case "$option" in -b|--branch) GIT_CLONE_BRANCH="$arg" ;; esac
+            option=""
+        else
+            case "$arg" in
+                --recurse-submodules|--recursive) GIT_CLONE_RECURSE=true; continue ;;
+                --depth|--shallow-since|--shallow-exclude|--filter) GIT_CLONE_SHALLOW=true; option="$arg" ;;
+                --depth=*|--shallow-*|--filter=*) GIT_CLONE_SHALLOW=true ;;
+                -b|--branch|-o|--origin|-u|--upload-pack|-c|--config|--reference|\
+                --reference-if-able|--separate-git-dir|--template|-j|--jobs|\
+                --server-option) option="$arg" ;;
+                --branch=*) GIT_CLONE_BRANCH="${arg#--branch=}" ;;
+                -*) ;;
+                *) GIT_CLONE_POSITIONAL+=("$arg") ;;
+            esac
+        fi
+        GIT_CLONE_ARGS+=("$arg")
+    done
+}
+
+# Shell sections run in this shell, so their git clones come through here
+git() {
+    if [ "$1" != clone ] || [ -z "$GIT_MIRROR" ]; then
+        command git "$@"
+        return
+    fi
+    shift
+    local mirror dest url
+    git_clone_parse "$@"
+    url="${GIT_CLONE_POSITIONAL[0]:-}"
+    if [ "$GIT_CLONE_SHALLOW" = true ] || ! [[ "$url" =~ $GIT_REMOTE_RE ]] ||
+        ! mirror="$(git_mirror_update "$url")"; then
+        command git clone "$@"
+        return
+    fi
+    command git clone --reference-if-able "$mirror" --dissociate "${GIT_CLONE_ARGS[@]}" || return
+    if [ "$GIT_CLONE_RECURSE" = true ]; then
+        dest="${url%/}"
+        dest="${GIT_CLONE_POSITIONAL[1]:-${dest##*[/:]}}"
+        git_mirror_submodules "${dest%.git}" "$url"
+    fi
+}
+
+# sudo resets the environment: while a section exports build settings
+# (SUDO_PRESERVE), sudo is a function that keeps them for install steps
+sudo_preserve() {
+    SUDO_PRESERVE+=("$@")
+    sudo() {
+        command sudo --preserve-env="$(IFS=,; echo "${SUDO_PRESERVE[*]}")" "$@"
+    }
+}
+
+sudo_release() {
+    local var drop kept=()
+    for var in "${SUDO_PRESERVE[@]}"; do
+        for drop in "$@"; do
+            [ "$var" = "$drop" ] && continue 2
+        done
+        kept+=("$var")
+    done
+    SUDO_PRESERVE=("${kept[@]}")
+    [ -n "${SUDO_PRESERVE[*]}" ] || unset -f sudo
+}
+
+# Compiler cache: CMake builds get CMAKE_<LANG>_COMPILER_LAUNCHER, other
+# builds CC="ccache cc" (never both: ccache refuses to invoke itself)
+build_cache_stats() {
+    CCACHE_DIR="$BUILD_CACHE_DIR" ccache --print-stats 2>/dev/null | awk '
+        $1 == "direct_cache_hit" || $1 == "preprocessed_cache_hit" { hits += $2 }
+        $1 == "cache_miss" { misses += $2 }
+        END { print hits + 0, misses + 0 }'
+}
+
+build_cache_env() {
+    local kind="$1" var
+    if ! command -v ccache > /dev/null; then
+        print_warning "ccache not found: building without a compiler cache"
+        return 0
+    fi
+    if [ "$DRY_RUN" = true ]; then
+        print_info "[DRY-RUN] Would build with ccache in $BUILD_CACHE_DIR"
+        return 0
+    fi
+    # Sections share the shell, so save what build_cache_reset restores
+    BUILD_CACHE_SAVED=()
+    for var in "${BUILD_CACHE_VARS[@]}"; do
+        if [ -n "${!var+x}" ]; then
+            BUILD_CACHE_SAVED+=("export $var=$(printf '%q' "${!var}")")
+        else
+            BUILD_CACHE_SAVED+=("unset $var")
+        fi
+    done
+
+    mkdir -p "$BUILD_CACHE_DIR"
+    [ -n "$BUILD_CACHE_BASELINE" ] || BUILD_CACHE_BASELINE=$(build_cache_stats)
+    export CCACHE_DIR="$BUILD_CACHE_DIR" CCACHE_UMASK=002
+    if [ "$kind" = cmake ]; then
+        export CMAKE_C_COMPILER_LAUNCHER=ccache CMAKE_CXX_COMPILER_LAUNCHER=ccache
+    else
+        export CC="ccache ${CC:-cc}" CXX="ccache ${CXX:-c++}"
+    fi
+    if [ -z "${MAKEFLAGS:-}" ]; then
+        export MAKEFLAGS="-j$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)"
+    fi
+    sudo_preserve "${BUILD_CACHE_VARS[@]}"
+}
+
+build_cache_reset() {
+    local saved
+    for saved in "${BUILD_CACHE_SAVED[@]}"; do
+        eval "$saved"
+    done
+    BUILD_CACHE_SAVED=()
+    sudo_release "${BUILD_CACHE_VARS[@]}"
+}
+
+build_cache_report() {
+    [ -n "$BUILD_CACHE_BASELINE" ] || return 0
+    local before_hits before_misses hits misses
+    read -r before_hits before_misses <<< "$BUILD_CACHE_BASELINE"
+    read -r hits misses <<< "$(build_cache_stats)"
+    print_info "Compiler cache: $((hits - before_hits)) hits, $((misses - before_misses)) misses in $BUILD_CACHE_DIR"
+}
+
+# Build artifacts: a shell section with build_artifact: true installs into
+# a staged DESTDIR, which is packaged (.deb, or .tar.gz without dpkg-deb)
+# and stored under a key over the script, the commits it clones and the
+# platform. A later run with the same key installs the package instead.
+artifact_format() {
+    if command -v dpkg-deb > /dev/null; then echo deb; else echo tar.gz; fi
+}
+
+artifact_package_name() {
+    echo "start-vm-$(echo "$1" | tr 'A-Z' 'a-z' | sed -E 's/[^a-z0-9+.-]+/-/g')"
+}
+
+artifact_key() {
+    local script="$1" line commit commits=()
+    while read -r line; do
+        git_clone_parse $line
+        [[ "${GIT_CLONE_POSITIONAL[0]:-}" =~ $GIT_REMOTE_RE ]] || continue
+        commit="$(command git ls-remote "${GIT_CLONE_POSITIONAL[0]}" "${GIT_CLONE_BRANCH:-HEAD}" 2>/dev/null |
+            awk 'NR == 1 { print $1 }')"
+        [ -n "$commit" ] || return 1
+        commits+=("$commit")
+    done < <(awk '{ if (sub(/\\$/, " ")) printf "%s", $0; else print }' <<< "$script" |
+        grep -oE 'git[[:space:]]+clone[^;&|]*' | sed -E 's/^git[[:space:]]+clone//')
+    printf '%s\0' "$script" "$OS_NAME" "$OS_VERSION" "$(uname -m)" "${commits[@]}" |
+        { sha256sum 2>/dev/null || shasum -a 256; } | cut -c1-16
+}
+
+artifact_deploy() {
+    local artifact="$1"
+    case "$artifact" in
+        *.deb) run_command "Installing $(basename "$artifact")" "sudo dpkg -i '$artifact'" ;;
+        *) run_command "Installing $(basename "$artifact")" "sudo tar -xzf '$artifact' -C /" ;;
+    esac
+    if [ "$(uname -s)" = Linux ]; then
+        run_command "Updating the shared library cache" "sudo ldconfig" || true
+    fi
+}
+
+# Returns 0 if a prebuilt package was installed, otherwise 1 with DESTDIR
+# pointing at a fresh stage for artifact_store
+artifact_install() {
+    local name="$1" artifact
+    ARTIFACT_STAGE=""
+    if ! ARTIFACT_KEY="$(artifact_key "$2")"; then
+        print_warning "Cannot resolve the sources' commits: building without an artifact"
+        return 1
+    fi
+    artifact="$ARTIFACT_DIR/$name/$ARTIFACT_KEY.$(artifact_format)"
+    if [ -f "$artifact" ]; then
+        print_info "Using prebuilt $name ($ARTIFACT_KEY)"
+        artifact_deploy "$artifact"
+        ARTIFACT_INSTALLED=$((ARTIFACT_INSTALLED + 1))
+        return 0
+    fi
+    if [ "$DRY_RUN" = true ]; then
+        print_info "[DRY-RUN] Would stage the install and store it as $artifact"
+        return 1
+    fi
+    ARTIFACT_STAGE="$(mktemp -d "${TMPDIR:-/tmp}/start-vm-stage-XXXXXX")"
+    chmod 755 "$ARTIFACT_STAGE"
+    export DESTDIR="$ARTIFACT_STAGE"
+    sudo_preserve DESTDIR
+    return 1
+}
+
+artifact_store() {
+    local name="$1" stage="$ARTIFACT_STAGE" artifact tmp
+    [ -n "$stage" ] || return 0
+    ARTIFACT_STAGE=""
+    unset DESTDIR
+    sudo_release DESTDIR
+    if [ -z "$(ls -A "$stage")" ]; then
+        print_warning "$name staged nothing under DESTDIR: no artifact stored"
+        rm -rf "$stage"
+        return 0
+    fi
+    artifact="$ARTIFACT_DIR/$name/$ARTIFACT_KEY.$(artifact_format)"
+    tmp="$(dirname "$artifact")/.$(basename "$artifact").$$.tmp"
+    mkdir -p "$(dirname "$artifact")"
+    if [ "$(artifact_format)" = deb ]; then
+        mkdir "$stage/DEBIAN"
+        printf '%s\n' "Package: $(artifact_package_name "$name")" "Version: 0+$ARTIFACT_KEY" \
+            "Architecture: $(dpkg --print-architecture)" "Maintainer: start-vm <start-vm@localhost>" \
+            "Description: $name built from source by start-vm" \
+            " Built for the $RECIPE_NAME recipe." > "$stage/DEBIAN/control"
+        dpkg-deb --root-owner-group --build "$stage" "$tmp" > /dev/null
+    else
+        # Files and links only: extracting directory entries over / would
+        # reset the permissions of /usr, /usr/local and friends
+        (cd "$stage" && find . ! -type d -print0 | tar --null --no-recursion -T - -czf "$tmp")
+    fi
+    mv "$tmp" "$artifact"
+    # make install ran under sudo, so the staged files are root's
+    sudo rm -rf "$stage"
+    ARTIFACT_BUILT=$((ARTIFACT_BUILT + 1))
+    print_info "Stored $artifact"
+    artifact_deploy "$artifact"
+}
+
+artifact_uninstall() {
+    local package
+    package="$(artifact_package_name "$1")"
+    if command -v dpkg-query > /dev/null &&
+        [ "$(dpkg-query -W -f='${Status}' "$package" 2>/dev/null)" = "install ok installed" ]; then
+        run_command "Uninstalling $package" "sudo dpkg -r $package" || true
+    else
+        print_warning "Shell sections cannot be automatically uninstalled"
+    fi
+}
+
+artifact_report() {
+    if [ "$ARTIFACT_INSTALLED" -gt 0 ] || [ "$ARTIFACT_BUILT" -gt 0 ]; then
+        print_info "Build artifacts: $ARTIFACT_INSTALLED prebuilt installed, $ARTIFACT_BUILT built and stored in $ARTIFACT_DIR"
+    fi
+}
+
+# Epoch seconds, with microseconds on bash 5 (EPOCHREALTIME)
+timing_now() {
+    if [ -n "${EPOCHREALTIME:-}" ]; then
+        echo "${EPOCHREALTIME/,/.}"
+    else
+        date +%s
+    fi
+}
+
+timing_begin() {
+    local kind="$1" name="$2"
+    if [ -z "$TIMING_STARTED" ]; then
+        TIMING_STARTED=$(timing_now)
+        TIMING_STAMP=$(date +%Y%m%d_%H%M%S)
+    fi
+    [ "$kind" = section ] && TIMING_SECTION="$name"
+    TIMING_OPEN[TIMING_DEPTH]="$(timing_now)"$'\t'"$kind"$'\t'"$name"
+    TIMING_DEPTH=$((TIMING_DEPTH + 1))
+}
+
+timing_end() {
+    local status="${1:-ok}" start kind name end
+    TIMING_DEPTH=$((TIMING_DEPTH - 1))
+    IFS=$'\t' read -r start kind name <<< "${TIMING_OPEN[TIMING_DEPTH]}"
+    end=$(timing_now)
+    TIMING_STEPS+=("$(awk -v s="$start" -v e="$end" 'BEGIN { printf "%.3f", e - s }')"$'\t'"$kind"$'\t'"$TIMING_SECTION"$'\t'"$name"$'\t'"$start"$'\t'"$end"$'\t'"$status")
+}
+
+# Run a command as a timed step; a failure still exits (set -e), and the
+# EXIT trap records the open steps as failed
+timed() {
+    timing_begin "$1" "$2"
+    shift 2
+    "$@"
+    timing_end
+}
+
+json_string() {
+    local value="${1//\\/\\\\}"
+    printf '"%s"' "${value//\"/\\\"}"
+}
+
+timing_report() {
+    [ "$TIMING_DONE" = false ] && [ -n "$TIMING_STARTED" ] && [ "$DRY_RUN" = false ] || return 0
+    TIMING_DONE=true
+    local status=ok step seconds kind section name start end step_status path sep=""
+    while [ "$TIMING_DEPTH" -gt 0 ]; do
+        timing_end failed
+        status=failed
+    done
+    print_info "Slowest steps:"
+    printf '%s\n' "${TIMING_STEPS[@]}" | sort -t $'\t' -k1,1 -rn | head -n 10 \
+        | while IFS=$'\t' read -r seconds kind section name start end step_status; do
+            printf '  %9.1fs  %-8s %-20s %s%s\n' "$seconds" "$kind" "${section:--}" "$name" \
+                "$([ "$step_status" = ok ] || echo " (failed)")"
+        done
+    path="$TIMING_DIR/$RECIPE_NAME-$TIMING_STAMP.json"
+    mkdir -p "$TIMING_DIR" || return 0
+    {
+        printf '{\n  "recipe": %s,\n  "platform": %s,\n  "os": %s,\n  "version": %s,\n' \
+            "$(json_string "$RECIPE_NAME")" "$(json_string "$PLATFORM")" \
+            "$(json_string "$OS_NAME")" "$(json_string "$OS_VERSION")"
+        printf '  "generator": "shell.sh",\n  "action": "install",\n  "host": %s,\n' \
+            "$(json_string "$(hostname 2>/dev/null || uname -n)")"
+        printf '  "start": %s,\n  "seconds": %s,\n  "status": "%s",\n  "steps": [' "$TIMING_STARTED" \
+            "$(awk -v s="$TIMING_STARTED" -v e="$(timing_now)" 'BEGIN { printf "%.3f", e - s }')" "$status"
+        for step in "${TIMING_STEPS[@]}"; do
+            IFS=$'\t' read -r seconds kind section name start end step_status <<< "$step"
+            printf '%s\n    {"kind": "%s", "section": %s, "name": %s, "start": %s, "seconds": %s, "end": %s, "status": "%s"}' \
+                "$sep" "$kind" "$(json_string "$section")" "$(json_string "$name")" "$start" "$seconds" "$end" "$step_status"
+            sep=","
+        done
+        printf '\n  ]\n}\n'
+    } > "$path" && print_info "Step timings: $path"
+}
+
+on_exit() {
+    timing_report
+    cargo_build_cleanup
+}
+
 install_default_files() {
     print_header "Installing default dotfiles"
 
@@ -203,7 +1106,11 @@ install_default_files() {
     fi
 
     for entry in "${DEFAULT_FILES[@]}"; do
-        copy_file_or_dir "$DEFAULT_DIR/$entry" "$HOME/$entry" "$entry"
+        if [ "$LINK" = true ]; then
+            link_file_or_dir "$DEFAULT_DIR/$entry" "$HOME/$entry" "$entry"
+        else
+            copy_file_or_dir "$DEFAULT_DIR/$entry" "$HOME/$entry" "$entry"
+        fi
     done
 }
 
@@ -222,7 +1129,11 @@ install_config_files() {
     fi
 
     for entry in "${CONFIG_FILES[@]}"; do
-        copy_file_or_dir "$CONFIG_DIR/$entry" "$CONFIG_DST/$entry" "$entry"
+        if [ "$LINK" = true ]; then
+            link_file_or_dir "$CONFIG_DIR/$entry" "$CONFIG_DST/$entry" "$entry"
+        else
+            copy_file_or_dir "$CONFIG_DIR/$entry" "$CONFIG_DST/$entry" "$entry"
+        fi
     done
 }
 
@@ -230,7 +1141,7 @@ uninstall_default_files() {
     print_header "Uninstalling default dotfiles"
 
     for entry in "${DEFAULT_FILES[@]}"; do
-        remove_file_or_dir "$HOME/$entry" "$entry"
+        uninstall_file_or_dir "$HOME/$entry" "$DEFAULT_DIR" "$entry"
     done
 }
 
@@ -238,7 +1149,7 @@ uninstall_config_files() {
     print_header "Uninstalling .config folders"
 
     for entry in "${CONFIG_FILES[@]}"; do
-        remove_file_or_dir "$CONFIG_DST/$entry" "$entry"
+        uninstall_file_or_dir "$CONFIG_DST/$entry" "$CONFIG_DIR" "$entry"
     done
 }
 
@@ -248,33 +1159,49 @@ install_section_{{loop.index}}() {
 
 {% if section.pre_install %}    # Pre-install scripts
     print_info "Running pre-install scripts..."
-    run_command "Pre-install" {{section.pre_install | tojson}}
+    local pre_install
+    {{section.pre_install | heredoc("pre_install")}}
+    timed hook pre_install run_command "Pre-install" "$pre_install"
 
 {% endif %}{% if section.type == "debian_packages" %}    # Install Debian packages
-    run_command "Installing {{section.name}} debian packages" \
-        "sudo apt-get install -y {% for package in section.install %}{{package}} {% endfor %}"
+    timed package debian_packages run_command "Installing {{section.name}} debian packages" \
+        "apt_install {% for package in section.install %}{{package}} {% endfor %}"
 {% elif section.type == "python_packages" %}    # Install Python packages
-    run_command "Installing {{section.name}} python packages" \
-        "sudo -H pip3 install {% for package in section.install %}{{package}} {% endfor %}"
+    timed package python_packages run_command "Installing {{section.name}} python packages" \
+        "pip_install {% for package in section.install %}{{package}} {% endfor %}"
 {% elif section.type == "ruby_packages" %}    # Install Ruby gems
-{% for package in section.install %}    run_command "Installing {{package}}" "gem install {{package}}"
+{% for package in section.install %}    timed package "{{package}}" run_command "Installing {{package}}" "gem_install {{package}}"
 {% endfor %}{% elif section.type == "rust_packages" %}    # Install Rust crates
-{% for package in section.install %}    run_command "Installing {{package}}" "cargo install {{package}}"
+{% for package in section.install %}    timed package "{{package}}" run_command "Installing {{package}}" "cargo_install {{package}}"
 {% endfor %}{% elif section.type == "homebrew_packages" %}    # Install Homebrew packages
-    run_command "Installing {{section.name}} homebrew packages" \
+    timed package homebrew_packages run_command "Installing {{section.name}} homebrew packages" \
         "brew install {% for package in section.install %}{{package}} {% endfor %}"
 {% elif section.type == "shell" %}    # Execute shell commands
     print_info "Executing shell commands..."
-    run_command "{{section.name}}" {{section.install | tojson}}
+    local script
+    {{section.install | heredoc}}
+{% if section.build_artifact %}    # Install the packaged build, or build into a staged DESTDIR and package it
+    if ! artifact_install "{{section.name}}" "$script"; then
+{% if section.build_cache %}        build_cache_env {{ "cmake" if "cmake" in section.install else "cc" }}
+{% endif %}        timed script "{{section.name}}" run_command "{{section.name}}" "$script"
+{% if section.build_cache %}        build_cache_reset
+{% endif %}        artifact_store "{{section.name}}"
+    fi
+{% else %}{% if section.build_cache %}    build_cache_env {{ "cmake" if "cmake" in section.install else "cc" }}
 {% endif %}
+    timed script "{{section.name}}" run_command "{{section.name}}" "$script"
+{% if section.build_cache %}    build_cache_reset
+{% endif %}{% endif %}{% endif %}
 {% if section.purge %}    # Purge packages
     print_info "Purging unwanted packages..."
-    run_command "Purging {{section.name}} packages" \
+    timed package purge run_command "Purging {{section.name}} packages" \
         "sudo apt-get purge -y {% for package in section.purge %}{{package}} {% endfor %}"
 {% endif %}
 {% if section.post_install %}    # Post-install scripts
     print_info "Running post-install scripts..."
-    run_command "Post-install" {{section.post_install | tojson}}
+    local post_install
+    {{section.post_install | heredoc("post_install")}}
+    timed hook post_install run_command "Post-install" "$post_install"
 {% endif %}}
 
 uninstall_section_{{loop.index}}() {
@@ -293,11 +1220,12 @@ uninstall_section_{{loop.index}}() {
     run_command "Uninstalling $pkg" "gem uninstall -x $pkg" || true
 {% endfor %}{% elif section.type == "rust_packages" %}    # Uninstall Rust crates
 {% for package in section.install %}    local pkg=$(strip_version_spec "{{package}}")
-    run_command "Uninstalling $pkg" "cargo uninstall $pkg" || true
+    run_command "Uninstalling $pkg" "cargo_uninstall $pkg" || true
 {% endfor %}{% elif section.type == "homebrew_packages" %}    # Uninstall Homebrew packages
     local packages=({% for package in section.install %}"$(strip_version_spec '{{package}}')" {% endfor %})
     run_command "Uninstalling {{section.name}} homebrew packages" \
         "brew uninstall ${packages[@]}" || true
+{% elif section.type == "shell" and section.build_artifact %}    artifact_uninstall "{{section.name}}"
 {% elif section.type == "shell" %}    print_warning "Shell sections cannot be automatically uninstalled"
 {% endif %}}
 
@@ -316,12 +1244,21 @@ install_all() {
 
     install_default_files
     install_config_files
-{% for section in sections %}    install_section_{{loop.index}}
+{% for section in sections %}    timed section "{{section.name}}" install_section_{{loop.index}}
 {% endfor %}
     echo
+    if [ "$LINK" = true ]; then
+        print_info "Dotfiles: $LINK_CREATED linked, $LINK_CURRENT already linked, $LINK_CONFLICTS conflicts skipped"
+    else
+        print_info "Dotfiles: $SYNC_UPDATED entries updated, $SYNC_SKIPPED already up to date"
+    fi
     if [ "$BACKUP" = true ] && [ -n "$BACKUP_DIR" ] && [ -d "$BACKUP_DIR" ]; then
         print_info "Backups saved to: $BACKUP_DIR"
+        prune_backups
     fi
+    build_cache_report
+    artifact_report
+    timing_report
     print_success "Installation complete!"
 }
 
@@ -352,6 +1289,26 @@ Options:
     -n, --dry-run      Show what would be done without executing
     -v, --verbose      Enable verbose output
     --no-backup        Skip backing up existing files (default: backup enabled)
+    --backup-keep N    Number of backup snapshots to retain (default: 10)
+    --checksum         Compare dotfiles by content instead of size and mtime
+    --link             Symlink dotfiles from this checkout instead of copying;
+                       on uninstall, only remove links into this checkout
+    --offline DIR      Install packages from an extracted offline bundle
+    --wheelhouse DIR   Install python packages from prebuilt wheels when
+                       present (default: wheelhouse)
+    --rust-cache DIR   Reuse and populate prebuilt rust binaries in DIR,
+                       e.g. ~/.cache/start-vm/rust (default: no cache)
+    --cargo-jobs N     Parallel rustc jobs (default: cores, capped by memory)
+    --ccache-dir DIR   ccache directory for build_cache sections
+                       (default: ~/.cache/start-vm/ccache)
+    --cargo-target-dir DIR
+                       Shared, kept target dir for cargo builds (default: a
+                       temporary one, on tmpfs when memory allows)
+    --git-mirror DIR   Clone repositories in shell sections through bare
+                       mirrors in DIR, e.g. ~/.cache/start-vm/git
+                       (default: no mirrors)
+    --artifacts DIR    Packaged builds of build_artifact sections
+                       (default: ~/.cache/start-vm/artifacts)
     -h, --help         Show this help message
 
 Examples:
@@ -360,10 +1317,20 @@ Examples:
     $0 install --dry-run       # Show what would be installed
     $0 install --verbose       # Verbose output with backup details
     $0 install --no-backup     # Install without backing up existing files
+    $0 install --link          # Symlink dotfiles instead of copying them
+    $0 install --offline offline  # Install packages from an offline bundle
+    $0 install --wheelhouse /mnt/wheels  # Use shared prebuilt wheels
+    $0 install --rust-cache /mnt/rust    # Share prebuilt rust binaries
+    $0 install --git-mirror /mnt/git     # Share mirrors of cloned repositories
+    $0 install --artifacts /mnt/debs     # Share packaged source builds
     $0 uninstall --dry-run -v  # Show what would be uninstalled
 
 Note: By default, existing dotfiles and config files are backed up to
-      ~/.dotfiles_backup_<timestamp>/ before being overwritten.
+      ~/.dotfiles_backup/snapshots/<timestamp>/ before being overwritten.
+      Files unchanged since the previous snapshot are hardlinked. Dotfiles
+      are synced incrementally with rsync when it is available.
+      Install times every section, hook and package install, prints the
+      slowest and writes them all to ~/.dotfiles_backup/timings/.
 
 Generated by start-vm for $RECIPE_NAME ($PLATFORM/$OS_NAME)
 EOF
@@ -393,6 +1360,63 @@ while [ $# -gt 0 ]; do
             BACKUP=false
             shift
             ;;
+        --checksum)
+            CHECKSUM=true
+            shift
+            ;;
+        --link)
+            LINK=true
+            shift
+            ;;
+        --backup-keep)
+            BACKUP_KEEP="$2"
+            shift 2
+            ;;
+        --offline)
+            if [ ! -f "$2/index.json" ]; then
+                print_error "Not an offline bundle: $2"
+                exit 1
+            fi
+            OFFLINE_DIR="$(cd "$2" && pwd)"
+            shift 2
+            ;;
+        --wheelhouse)
+            if [ ! -d "$2" ]; then
+                print_warning "No wheelhouse at $2, using the package index"
+            fi
+            WHEELHOUSE="$2"
+            shift 2
+            ;;
+        --rust-cache)
+            RUST_CACHE="$2"
+            shift 2
+            ;;
+        --cargo-jobs)
+            CARGO_JOBS="$2"
+            shift 2
+            ;;
+        --ccache-dir)
+            BUILD_CACHE_DIR="$2"
+            shift 2
+            ;;
+        --cargo-target-dir)
+            export CARGO_TARGET_DIR="$2"
+            shift 2
+            ;;
+        --git-mirror)
+            case "$2" in
+                /*) GIT_MIRROR="$2" ;;
+                *) GIT_MIRROR="$PWD/$2" ;;
+            esac
+            shift 2
+            ;;
+        --artifacts)
+            case "$2" in
+                /*) ARTIFACT_DIR="$2" ;;
+                *) ARTIFACT_DIR="$PWD/$2" ;;
+            esac
+            shift 2
+            ;;
         -h|--help)
             show_help
             exit 0
@@ -413,6 +1437,7 @@ if [ -z "$ACTION" ]; then
 fi
 
 # Execute action
+trap on_exit EXIT
 case "$ACTION" in
     install)
         install_all
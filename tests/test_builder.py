@@ -6,10 +6,21 @@ Run with: pytest tests/test_builder.py
 """
 
 import argparse
+import gzip
+import importlib.util
+import io
 import json
+import logging
+import os
 import pathlib
+import shutil
+import subprocess
 import tempfile
 import sys
+import tarfile
+import threading
+import time
+import zipfile
 from unittest import mock
 
 import pytest
@@ -18,7 +29,21 @@ import yaml
 # Add parent directory to path to import start_vm
 sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
 
-from start_vm import Builder, ShellBuilder, DockerFileBuilder, PythonBuilder
+from start_vm import (
+    Builder,
+    BundleBuilder,
+    DockerFileBuilder,
+    OfflineBundleBuilder,
+    PhaseProfiler,
+    PythonBuilder,
+    ShellBuilder,
+    TimingDatabase,
+    WheelhouseBuilder,
+    stats_commandline,
+)
+
+# Expected generator output; regenerate with UPDATE_GOLDEN=1 pytest
+GOLDEN = pathlib.Path(__file__).parent / "golden"
 
 
 @pytest.fixture
@@ -81,6 +106,109 @@ echo "{{name}}"
     return tmp_path, recipe_path
 
 
+@pytest.fixture
+def generated_setup(mock_options, tmp_path):
+    """Render templates/setup.py for a small recipe and import it as a module."""
+    recipes_dir = tmp_path / "recipes"
+    recipes_dir.mkdir()
+    recipe = {
+        "name": "generated",
+        "platform": "linux",
+        "os": "ubuntu",
+        "version": "22.04",
+        "release": "jammy",
+        "sections": [
+            {"name": "core", "type": "debian_packages", "install": ["vim"]}
+        ],
+    }
+    recipe_path = recipes_dir / "generated.yml"
+    recipe_path.write_text(yaml.dump(recipe))
+
+    builder = PythonBuilder(str(recipe_path), mock_options)
+    builder.setup = tmp_path / "setup"
+    builder.build()
+
+    script = next(builder.setup.glob("*.py"))
+    spec = importlib.util.spec_from_file_location("generated_setup", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def dotfiles_env(generated_setup, tmp_path, monkeypatch):
+    """Point the generated setup.py at a temporary checkout, home, backups and manifest.
+
+    The checkout's defaults are .vim (with colors/dark.vim) and .vimrc, and
+    the recipe has no sections. Returns ``(module, checkout, home)``.
+    """
+    module = generated_setup
+    checkout = tmp_path / "checkout" / "default"
+    (checkout / ".vim" / "colors").mkdir(parents=True)
+    (checkout / ".vim" / "colors" / "dark.vim").write_text("hi Normal")
+    (checkout / ".vimrc").write_text("set nocompatible")
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setitem(module.PATHS, "default_dir", checkout)
+    monkeypatch.setitem(module.PATHS, "home_dir", home)
+    monkeypatch.setitem(module.PATHS, "backup_root", tmp_path / "backups")
+    monkeypatch.setitem(module.PATHS, "backup_dir", None)
+    monkeypatch.setitem(module.PATHS, "manifest", tmp_path / "manifest.json")
+    monkeypatch.setitem(module.PATHS, "timings", tmp_path / "timings")
+    monkeypatch.setitem(module.FILE_SETS, "defaults", [".vim", ".vimrc"])
+    monkeypatch.setattr(module, "SECTIONS", [])
+    return module, checkout, home
+
+
+@pytest.fixture
+def shell_setup(mock_options, tmp_path, monkeypatch):
+    """Render templates/shell.sh in a scratch checkout and run it with HOME=tmp_path/home.
+
+    Returns ``run(sections, *args, hide=())``. ``sudo`` is a stub that runs
+    commands as they are, but only logs (to tmp_path/sudo.log) those that
+    would change the host: dpkg, ldconfig, tar and apt-get. Commands named
+    in ``hide`` (e.g. rsync) are left off the script's PATH.
+    """
+    checkout = tmp_path / "checkout"
+    (checkout / "default").mkdir(parents=True)
+    (checkout / "templates").symlink_to(pathlib.Path(__file__).parent.parent / "templates")
+    (tmp_path / "home").mkdir()
+    stubs = tmp_path / "stubs"
+    stubs.mkdir()
+    (stubs / "sudo").write_text(
+        '#!/bin/sh\n'
+        'while [ "${1#-}" != "$1" ]; do shift; done\n'
+        'case "$1" in dpkg|ldconfig|tar|apt-get) echo "$*" >> "$SUDO_LOG"; exit 0 ;; esac\n'
+        'exec "$@"\n'
+    )
+    (stubs / "sudo").chmod(0o755)
+    monkeypatch.chdir(checkout)
+
+    def run(sections, *args, hide=()):
+        recipe = {"name": "shelltest", "platform": "linux", "os": "debian", "version": "12",
+                  "release": "bookworm", "sections": sections}
+        (checkout / "shelltest.yml").write_text(yaml.dump(recipe))
+        builder = ShellBuilder(str(checkout / "shelltest.yml"), mock_options)
+        builder.setup = checkout / "setup"
+        builder.build()
+        path = os.environ["PATH"]
+        if hide:
+            # One directory linking every command on PATH but the hidden ones
+            bin_dir = tmp_path / ("without-" + "-".join(sorted(hide)))
+            bin_dir.mkdir(exist_ok=True)
+            for directory in path.split(os.pathsep):
+                for entry in os.scandir(directory) if os.path.isdir(directory) else []:
+                    if entry.name not in hide and not (bin_dir / entry.name).is_symlink():
+                        (bin_dir / entry.name).symlink_to(entry.path)
+            path = str(bin_dir)
+        env = {**os.environ, "HOME": str(tmp_path / "home"), "SUDO_LOG": str(tmp_path / "sudo.log"),
+               "PATH": f"{stubs}{os.pathsep}{path}"}
+        return subprocess.run(["bash", str(builder.setup / builder.target), *args], cwd=checkout,
+                              env=env, input="y\n", capture_output=True, text=True)
+
+    return run
+
+
 class TestBuilderValidation:
     """Test recipe validation functionality."""
 
@@ -158,6 +286,29 @@ class TestBuilderValidation:
         with pytest.raises(ValueError, match="missing 'install' field"):
             builder = ShellBuilder(str(recipe_path), mock_options)
 
+    def test_validate_section_resources(self, mock_options, tmp_path):
+        """Test that validation catches unknown or malformed resources hints."""
+        recipe_path = tmp_path / "invalid.yml"
+        recipe = {
+            "name": "test",
+            "platform": "linux",
+            "os": "ubuntu",
+            "version": "20.04",
+            "sections": [
+                {
+                    "name": "build",
+                    "type": "shell",
+                    "resources": {"max_jobs": 4, "memory": "lots"},
+                    "install": "make",
+                }
+            ],
+        }
+        with recipe_path.open("w") as f:
+            yaml.dump(recipe, f)
+
+        with pytest.raises(ValueError, match="Invalid resources"):
+            builder = ShellBuilder(str(recipe_path), mock_options)
+
 
 class TestBuilderRecipeLoading:
     """Test recipe loading and inheritance."""
@@ -260,6 +411,435 @@ class TestBuilderTemplateRendering:
                 assert "apt-get" in rendered
 
 
+class TestDockerLayers:
+    """Test per-section Dockerfile layers ordered for cache reuse."""
+
+    @pytest.fixture
+    def child_recipe(self, tmp_path):
+        """A child recipe over a base recipe, with volatility and layer hints."""
+        base = {
+            "name": "base",
+            "platform": "linux",
+            "os": "ubuntu",
+            "version": "22.04",
+            "sections": [
+                {"name": "core", "type": "debian_packages", "install": ["git", "vim"]},
+                {"name": "tools", "type": "shell", "install": "# fetch\nmake tools"},
+            ],
+        }
+        child = {
+            "inherits": "base",
+            "name": "child",
+            "sections": [
+                {"name": "app", "type": "shell", "volatility": "volatile", "install": "make app"},
+                {"name": "libs", "type": "python_packages", "layer": "python", "install": ["numpy"]},
+                {"name": "tools", "type": "shell", "install": "make tools-v2"},
+                {"name": "cli", "type": "python_packages", "layer": "python", "install": ["click", "rich"]},
+                {"name": "keys", "type": "shell", "volatility": "stable", "install": "gpg --import keys"},
+            ],
+        }
+        (tmp_path / "base.yml").write_text(yaml.dump(base))
+        recipe_path = tmp_path / "child.yml"
+        recipe_path.write_text(yaml.dump(child))
+        return recipe_path
+
+    def test_layers_ordered_stable_first(self, mock_options, child_recipe):
+        """Test volatility first, then parent sections, then recipe order, with groups."""
+        builder = DockerFileBuilder(str(child_recipe), mock_options)
+
+        assert builder.section_depths() == {"app": 0, "libs": 0, "tools": 0, "cli": 0, "keys": 0, "core": 1}
+        layers = builder.layers()
+        assert [layer["name"] for layer in layers] == ["keys", "core", "python", "tools", "app"]
+        assert [section["name"] for section in layers[2]["sections"]] == ["libs", "cli"]
+
+        report = builder.invalidation_report(layers)
+        assert report[1] == "layer 2/5 core (core): a change rebuilds 4 layer(s), 7/8 install steps"
+        assert report[-1].endswith("a change rebuilds 1 layer(s), 1/8 install steps")
+
+        mock_options.layer_order = "recipe"
+        assert [layer["name"] for layer in builder.layers()] == ["app", "python", "tools", "keys", "core"]
+
+    def test_rendered_run_per_layer(self, mock_options, child_recipe):
+        """Test that each layer renders as its own RUN instruction."""
+        builder = DockerFileBuilder(str(child_recipe), mock_options)
+        with mock.patch.object(builder, "write_file") as mock_write:
+            builder.build()
+
+        rendered = mock_write.call_args[0][0]
+        runs = [line for line in rendered.splitlines() if line.startswith("RUN ")]
+        assert runs == [f'RUN echo "layer: {name}" \\' for name in ("keys", "core", "python", "tools", "app")]
+        assert " && bash -ec \"$(printf '%s\\n' \\\n    'make tools-v2' \\\n    )\" \\" in rendered
+        assert "fetch" not in rendered
+        assert rendered.split("\n##\n## dotfiles:")[0].rstrip().endswith('&& echo "done: app"')
+
+    @pytest.mark.parametrize(
+        "golden, flags",
+        [
+            ("plain", {}),
+            ("buildkit", {"buildkit": True}),
+            ("multistage", {"buildkit": True, "multi_stage": True}),
+            ("slim", {"slim": True}),
+            ("slim-multistage", {"slim": True, "multi_stage": True}),
+        ],
+    )
+    def test_golden_dockerfile(self, mock_options, tmp_path, golden, flags):
+        """Test the rendered Dockerfile against tests/golden (UPDATE_GOLDEN=1 rewrites it)."""
+        recipe = {
+            "name": "golden",
+            "platform": "linux",
+            "os": "debian",
+            "version": "12",
+            "sections": [
+                {"name": "core", "type": "debian_packages", "install": ["git", "ruby"]},
+                {"name": "toolchain", "type": "debian_packages", "build_only": True, "install": ["libasound2-dev"]},
+                {"name": "py", "type": "python_packages", "install": ["requests"]},
+                {"name": "gems", "type": "ruby_packages", "install": ["rake"]},
+                {"name": "crates", "type": "rust_packages", "install": ["ripgrep"], "purge": ["cargo"]},
+                {
+                    "name": "jack",
+                    "type": "shell",
+                    "build_artifact": True,
+                    "install": "git clone https://github.com/jackaudio/jack2.git\n"
+                               "cd jack2 && ./waf configure && \\\n  ./waf build && sudo ./waf install\n"
+                               'source "$HOME/.profile"',
+                },
+            ],
+        }
+        recipe_path = tmp_path / "golden.yml"
+        recipe_path.write_text(yaml.dump(recipe))
+        vars(mock_options).update(flags)
+        builder = DockerFileBuilder(str(recipe_path), mock_options)
+        with mock.patch.object(builder, "write_file") as mock_write:
+            builder.build()
+
+        rendered = mock_write.call_args[0][0]
+        golden = GOLDEN / f"{golden}.Dockerfile"
+        if os.environ.get("UPDATE_GOLDEN"):
+            golden.write_text(rendered)
+        assert rendered == golden.read_text()
+
+    def test_multi_stage_independent_sections(self, mock_options, tmp_path):
+        """Test that only sections no later section may depend on get a builder stage."""
+        recipe = {
+            "name": "stages",
+            "platform": "linux",
+            "os": "debian",
+            "version": "12",
+            "sections": [
+                {"name": "core", "type": "debian_packages", "install": ["git"]},
+                {"name": "py_modules", "type": "python_packages", "install": ["cython", "wheel"]},
+                {"name": "py_audio", "type": "python_packages", "install": ["pyaudio"]},
+                {"name": "jack", "type": "shell", "build_artifact": True, "install": "./waf install"},
+                {"name": "supercollider", "type": "shell", "install": "cmake .. && make install"},
+                {"name": "crates", "type": "rust_packages", "install": ["ripgrep"]},
+                {"name": "gems", "type": "ruby_packages", "install": ["rake"]},
+                {"name": "extras", "type": "debian_packages", "install": ["sox"]},
+                {"name": "docs", "type": "shell", "install": "rake docs"},
+            ],
+        }
+        recipe_path = tmp_path / "stages.yml"
+        recipe_path.write_text(yaml.dump(recipe))
+        vars(mock_options).update(multi_stage=True)
+        builder = DockerFileBuilder(str(recipe_path), mock_options)
+
+        # jack is followed by a shell build linking against it, py_modules by a python
+        # section and gems by a script running rake; later debian packages need nothing
+        assert [layer["name"] for layer in builder.layers()] == [
+            "core", "py_modules", "jack", "supercollider", "gems", "extras", "docs"]
+        assert [stage["name"] for stage in builder.stages()] == ["build-py-audio", "build-crates"]
+        with mock.patch.object(builder, "write_file") as mock_write:
+            builder.build()
+        rendered = mock_write.call_args[0][0]
+        assert "cargo install --root /stage/usr/local \\\n    ripgrep" in rendered
+        assert "    './waf install' \\\n    )\" \\\n && echo \"done: jack\"" in rendered
+
+    def test_multi_stage_recipe(self, mock_options, tmp_path, caplog):
+        """Test that a recipe ending in shell and debian sections still gets a builder stage."""
+        vars(mock_options).update(multi_stage=True, slim=True)
+        builder = DockerFileBuilder("recipes/bullseye-ttplus.yml", mock_options)
+        with mock.patch.object(builder, "write_file") as mock_write, caplog.at_level(logging.WARNING):
+            builder.build()
+        rendered = mock_write.call_args[0][0]
+        assert [line for line in rendered.splitlines() if line.startswith("FROM ")] == [
+            "FROM debian:11 AS base", "FROM base AS build-py-audio2", "FROM base"]
+        assert "no builder stage" not in caplog.text
+
+        recipe = {
+            "name": "nostages",
+            "platform": "linux",
+            "os": "debian",
+            "version": "12",
+            "sections": [
+                {"name": "py", "type": "python_packages", "install": ["requests"]},
+                {"name": "check", "type": "shell", "install": "python3 -c 'import requests'"},
+            ],
+        }
+        recipe_path = tmp_path / "nostages.yml"
+        recipe_path.write_text(yaml.dump(recipe))
+        builder = DockerFileBuilder(str(recipe_path), mock_options)
+        with mock.patch.object(builder, "write_file"), caplog.at_level(logging.WARNING):
+            builder.build()
+        assert builder.stages() == []
+        assert "no builder stage was produced" in caplog.text
+
+    def test_slim_size_report(self, mock_options, tmp_path, caplog):
+        """Test the --slim size estimate from a Packages index and the size budget."""
+        index = tmp_path / "Packages"
+        index.write_text(
+            "Package: libc6\nPriority: required\nInstalled-Size: 12000\n\n"
+            "Package: git\nInstalled-Size: 39936\nDepends: libc6, git-man (>= 1:2)\n\n"
+            "Package: git-man\nInstalled-Size: 2048\n\n"
+            "Package: cmake\nInstalled-Size: 30720\nDepends: cmake-data | cmake-data-alt, libc6\n\n"
+            "Package: cmake-data\nInstalled-Size: 10240\n"
+        )
+        recipe = {
+            "name": "slim",
+            "platform": "linux",
+            "os": "debian",
+            "version": "12",
+            "sections": [
+                {"name": "core", "type": "debian_packages", "install": ["git"]},
+                {"name": "toolchain", "type": "debian_packages", "build_only": True, "install": ["cmake"]},
+                {"name": "tool", "type": "shell", "install": "cmake . && make install"},
+            ],
+        }
+        recipe_path = tmp_path / "slim.yml"
+        recipe_path.write_text(yaml.dump(recipe))
+        vars(mock_options).update(slim=True, packages_index=str(index), size_budget="40M")
+        builder = DockerFileBuilder(str(recipe_path), mock_options)
+
+        assert builder.build_deps() == ["cmake"]
+        layers = builder.layers()
+        assert [layer["name"] for layer in layers] == ["core", "tool"]
+        assert layers[1]["build_deps"] == ["cmake"]
+        with caplog.at_level(logging.WARNING):
+            assert builder.size_report(layers) == [
+                "layer core: ~41.0 MiB (2 packages)",
+                "build-only packages: ~40.0 MiB (2 packages) installed and removed by each compiling layer or stage",
+                "estimated debian packages: ~41.0 MiB (from 1 Packages index(es))",
+            ]
+        assert "exceed the size budget of 40M" in caplog.text
+
+    def test_slim_build_only_sections(self, mock_options, tmp_path):
+        """Test that only build_only packages are purged, once per run of compiling layers."""
+        recipe = {
+            "name": "slim",
+            "platform": "linux",
+            "os": "debian",
+            "version": "12",
+            "sections": [
+                {"name": "core", "type": "debian_packages", "install": ["git", "puredata-dev"]},
+                {
+                    "name": "toolchain",
+                    "type": "debian_packages",
+                    "build_only": True,
+                    "install": ["build-essential", "libjack-jackd2-dev"],
+                },
+                {"name": "jack", "type": "shell", "install": "./waf configure && ./waf install"},
+                {"name": "plugins", "type": "shell", "install": "make && sudo make install"},
+                {"name": "gems", "type": "ruby_packages", "install": ["rake"]},
+                {"name": "dotfiles", "type": "shell", "install": "ln -s a b"},
+            ],
+        }
+        recipe_path = tmp_path / "slim.yml"
+        recipe_path.write_text(yaml.dump(recipe))
+        vars(mock_options).update(slim=True)
+        builder = DockerFileBuilder(str(recipe_path), mock_options)
+
+        assert builder.build_deps() == ["build-essential", "libjack-jackd2-dev"]
+        layers = builder.layers()
+        # puredata-dev stays, the toolchain section is dropped, jack and plugins share one RUN
+        assert [layer["name"] for layer in layers] == ["core", "jack+plugins+gems", "dotfiles"]
+        assert layers[0]["sections"][0]["install"] == ["git", "puredata-dev"]
+        assert layers[2]["build_deps"] == []
+        with mock.patch.object(builder, "write_file") as mock_write:
+            builder.build()
+        rendered = mock_write.call_args[0][0]
+        assert rendered.count("libjack-jackd2-dev") == 1
+        assert rendered.count("apt-get purge -y --auto-remove") == 1
+        assert "puredata-dev" in rendered
+
+        # Without --slim the build_only section is installed as usual
+        vars(mock_options).update(slim=False)
+        builder = DockerFileBuilder(str(recipe_path), mock_options)
+        assert builder.build_deps() == []
+        assert "toolchain" in [layer["name"] for layer in builder.layers()]
+
+    def test_build_context(self, mock_options, tmp_path, monkeypatch, caplog):
+        """Test the .dockerignore, the dotfile COPY lines, the context hash and the build command."""
+        (tmp_path / "templates").symlink_to(pathlib.Path(__file__).parent.parent / "templates")
+        (tmp_path / "default").mkdir()
+        (tmp_path / "default" / ".vimrc").write_text("syntax on\n")
+        (tmp_path / "config" / "dev" / "nvim").mkdir(parents=True)
+        (tmp_path / "config" / "dev" / "nvim" / "init.vim").write_text("set number\n")
+        (tmp_path / "config" / "other").mkdir()
+        (tmp_path / "config" / "other" / "unused").write_text("not referenced")
+        recipe = {
+            "name": "Context",
+            "platform": "linux",
+            "os": "ubuntu",
+            "version": "22.04",
+            "config": "dev",
+            "sections": [{"name": "core", "type": "debian_packages", "install": ["vim"]}],
+        }
+        (tmp_path / "context.yml").write_text(yaml.dump(recipe))
+        monkeypatch.chdir(tmp_path)
+
+        def build():
+            builder = DockerFileBuilder("context.yml", mock_options)
+            builder.build()
+            return builder
+
+        caplog.set_level(logging.INFO)
+        builder = build()
+        ignore = (builder.setup / f"{builder.target}.dockerignore").read_text().splitlines()
+        assert ignore[1:] == ["*", "!default/.vimrc", "!config/dev/nvim"]
+        dockerfile = (builder.setup / builder.target).read_text()
+        assert "COPY default/ /root/\nCOPY config/dev/ /root/.config/\n" in dockerfile
+        assert builder.context[1:] == (2, 21)
+        assert builder.tag == f"context:ctx-{builder.context[0][:12]}"
+
+        (tmp_path / "config" / "other" / "unused").write_text("still not referenced")
+        assert build().tag == builder.tag
+        (tmp_path / "default" / ".vimrc").write_text("syntax off\n")
+        assert build().tag != builder.tag
+
+        # The per-Dockerfile .dockerignore needs BuildKit
+        assert "is only read by BuildKit" in caplog.text
+        vars(mock_options).update(dry_run=True)
+        builder.run()
+        assert f"DOCKER_BUILDKIT=1 docker build -t {builder.tag} -f " in caplog.text
+
+    def test_invalid_volatility(self, mock_options, child_recipe):
+        """Test that validation catches an unknown volatility hint."""
+        child_recipe.write_text(child_recipe.read_text().replace("volatile", "often"))
+        with pytest.raises(ValueError, match="Invalid volatility"):
+            DockerFileBuilder(str(child_recipe), mock_options)
+
+
+class TestPhaseProfiler:
+    """Test --profile phase timing."""
+
+    @pytest.fixture
+    def profiled(self, mock_options, temp_recipe_dir, monkeypatch):
+        """Profile building a child recipe and its lockfile."""
+        tmp_path, recipe_path = temp_recipe_dir
+        child = tmp_path / "recipes" / "child.yml"
+        child.write_text(yaml.dump({"inherits": "test", "name": "child", "sections": []}))
+        monkeypatch.chdir(tmp_path)
+        profiler = PhaseProfiler()
+        builder = ShellBuilder(str(child), mock_options, profiler)
+        builder.setup = tmp_path / "setup"
+        builder.build()
+        builder.write_lockfile()
+        return profiler, str(child)
+
+    def test_phases_and_self_time(self, profiled):
+        """Test that every phase is recorded and nested phases are not counted twice."""
+        profiler, child = profiled
+        report = profiler.report()
+
+        assert set(report["phases"]) == {"load", "inherit", "validate", "compile", "render", "write", "lockfile"}
+        assert report["phases"]["load"]["count"] == 2
+        assert list(report["recipes"]) == [child]
+        inherit = next(event for event in report["events"] if event["phase"] == "inherit")
+        load = [event for event in report["events"] if event["phase"] == "load"]
+        assert load[1]["start_ms"] >= inherit["start_ms"]
+        assert inherit["self_wall_ms"] <= inherit["wall_ms"] - load[1]["wall_ms"] + 0.001
+        total = sum(totals["wall_ms"] for totals in report["phases"].values())
+        assert total == pytest.approx(report["recipes"][child]["wall_ms"], abs=0.01)
+
+    def test_chrome_trace(self, profiled, tmp_path):
+        """Test the trace-event file: complete events on one thread per recipe."""
+        profiler, child = profiled
+        profiler.write(str(tmp_path / "out" / "profile.json"), str(tmp_path / "out" / "trace.json"))
+
+        trace = json.loads((tmp_path / "out" / "trace.json").read_text())
+        slices = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        assert len(slices) == len(profiler.events)
+        assert {event["tid"] for event in slices} == {1}
+        assert all(event["cat"] == "ShellBuilder" and event["dur"] >= 0 for event in slices)
+        assert {"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": child}} in trace["traceEvents"]
+        assert json.loads((tmp_path / "out" / "profile.json").read_text())["phases"]["render"]["count"] == 1
+
+    def test_profile_does_not_take_a_recipe(self, temp_recipe_dir, monkeypatch):
+        """Test that --profile is a flag: the recipes after it are built, not overwritten."""
+        import start_vm
+
+        tmp_path, recipe_path = temp_recipe_dir
+        other = recipe_path.with_name("other.yml")
+        other.write_text(recipe_path.read_text().replace("name: test", "name: other"))
+        recipe = recipe_path.read_text()
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(sys, "argv", ["start_vm.py", "-b", "--profile", str(recipe_path), str(other)])
+        start_vm.commandline()
+
+        assert recipe_path.read_text() == recipe
+        assert sorted(path.name for path in (tmp_path / "setup").iterdir()) == [
+            "linux-ubuntu-20.04-other.sh", "linux-ubuntu-20.04-test.sh"]
+        assert set(json.loads((tmp_path / "profile.json").read_text())["recipes"]) == {
+            str(recipe_path), str(other)}
+
+        monkeypatch.setattr(sys, "argv", ["start_vm.py", "-b", "--profile-output", str(other), str(recipe_path)])
+        with pytest.raises(SystemExit):
+            start_vm.commandline()
+
+
+class TestTimingDatabase:
+    """Test start_vm.py stats over the timing files of generated scripts."""
+
+    @pytest.fixture
+    def timings(self, tmp_path):
+        """Five daily runs of one recipe; the last one's core section is slow."""
+        timings = tmp_path / "timings"
+        timings.mkdir()
+        for day, core in enumerate([100, 104, 98, 101, 160]):
+            start = 1790000000 + day * 86400
+            run = {
+                "recipe": "ttplus", "host": "pi4", "generator": "setup.py", "action": "install",
+                "start": start, "seconds": core + 300, "status": "ok",
+                "steps": [
+                    {"kind": "section", "section": "core", "name": "core",
+                     "start": start, "seconds": core, "status": "ok"},
+                    {"kind": "section", "section": "jack", "name": "jack",
+                     "start": start + core, "seconds": 300 + day, "status": "ok"},
+                ],
+            }
+            (timings / f"ttplus-{day}.json").write_text(json.dumps(run))
+        (timings / "broken.json").write_text("{")
+        return timings
+
+    def test_ingest_is_idempotent(self, timings, tmp_path):
+        """Test that runs are added once and unreadable files are skipped."""
+        database = TimingDatabase(tmp_path / "db" / "timings.db")
+        assert database.ingest([timings]) == (6, 5)
+        assert database.ingest([timings / "ttplus-0.json"]) == (1, 0)
+        assert database.db.execute("SELECT COUNT(*) FROM steps").fetchone() == (10,)
+        database.close()
+
+    def test_percentiles_and_regressions(self, timings, tmp_path):
+        """Test p50/p95 per section and a regression against the earlier runs."""
+        database = TimingDatabase(tmp_path / "timings.db")
+        database.ingest([timings])
+
+        stats = {stat["name"]: stat for stat in database.section_stats()}
+        assert stats["core"]["runs"] == 5
+        assert stats["core"]["p50"] == 101
+        assert stats["core"]["p95"] == pytest.approx(148.8)
+        assert TimingDatabase.percentile([1, 2, 3, 4], 50) == 2.5
+        assert [(r["name"], r["baseline"]) for r in database.regressions()] == [("core", 100.5)]
+        assert database.regressions(threshold=75) == []
+        assert database.regressions(recipe="other") == []
+        assert "section core took 2m40.0s on" in database.generate_report()
+
+    def test_stats_check_exit_status(self, timings, tmp_path, capsys):
+        """Test that --check fails on a regression and passes under a higher threshold."""
+        db = str(tmp_path / "timings.db")
+        assert stats_commandline([str(timings), "--db", db, "--check"]) == 1
+        assert "PROVISIONING TIMING REPORT" in capsys.readouterr().out
+        assert stats_commandline([str(timings), "--db", db, "--check", "--threshold", "100"]) == 0
+
+
 class TestBuilderDryRun:
     """Test dry-run functionality."""
 
@@ -315,6 +895,14 @@ class TestBuilderFilters:
         assert "sudo" not in result
         assert "&&" in result
 
+    def test_heredoc_filter(self):
+        """Test that the heredoc filter hands bash the script verbatim."""
+        script = "echo 'a' \\\n  && echo \"$HOME\"\nprintf '%s\\n' x\n"
+        lines = Builder.filters["heredoc"](script, "cmd")
+        out = subprocess.run(["bash", "-c", lines + '\nprintf %s "$cmd"'],
+                             capture_output=True, text=True).stdout
+        assert out == script
+
 
 class TestBuilderErrorHandling:
     """Test error handling."""
@@ -1052,5 +1640,1553 @@ if __name__ == '__main__':
         assert builder.template == "setup.py"
 
 
+class TestSyncEngine:
+    """Test incremental dotfile sync in the generated setup.py and shell.sh."""
+
+    def test_sync_copies_then_skips_unchanged(self, generated_setup, tmp_path):
+        """Test that a second sync copies nothing."""
+        src = tmp_path / "src"
+        (src / "sub").mkdir(parents=True)
+        (src / "a.txt").write_text("alpha")
+        (src / "sub" / "b.txt").write_text("beta")
+        dst = tmp_path / "dst"
+
+        sync = generated_setup.SyncEngine()
+        sync.apply(sync.plan(src, dst))
+        assert (dst / "sub" / "b.txt").read_text() == "beta"
+        assert sync.stats["copied"] == 2
+
+        plan = sync.plan(src, dst)
+        assert sync.is_noop(plan)
+        sync.apply(plan)
+        assert sync.stats["copied"] == 2
+        assert sync.stats["skipped"] == 2
+        assert sync.stats["bytes_skipped"] == len("alpha") + len("beta")
+
+    def test_sync_removes_stale_and_updates_changed(self, generated_setup, tmp_path):
+        """Test that stale files are deleted and changed files recopied."""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "keep.txt").write_text("same")
+        (src / "edit.txt").write_text("new content")
+        dst = tmp_path / "dst"
+
+        sync = generated_setup.SyncEngine()
+        sync.apply(sync.plan(src, dst))
+        (dst / "stale").mkdir()
+        (dst / "stale" / "old.txt").write_text("old")
+        (src / "edit.txt").write_text("newer content")
+
+        plan = sync.plan(src, dst)
+        assert [s.name for s, _ in plan["copy"]] == ["edit.txt"]
+        assert plan["delete"] == [dst / "stale"]
+        sync.apply(plan)
+        assert not (dst / "stale").exists()
+        assert (dst / "edit.txt").read_text() == "newer content"
+
+    def test_sync_checksum_detects_same_size_edit(self, generated_setup, tmp_path):
+        """Test that checksum mode catches edits that keep size and mtime."""
+        import os
+
+        src = tmp_path / "a.txt"
+        dst = tmp_path / "b.txt"
+        src.write_text("aaaa")
+        dst.write_text("bbbb")
+        stat = src.stat()
+        os.utime(dst, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        assert generated_setup.SyncEngine().is_current(src, dst)
+        assert not generated_setup.SyncEngine(checksum=True).is_current(src, dst)
+
+    @pytest.mark.parametrize("rsync", [True, False], ids=["rsync", "no-rsync"])
+    def test_shell_sync_counts_and_deletes(self, shell_setup, tmp_path, rsync):
+        """Test that a second shell install updates nothing and removed sources are deleted."""
+        if rsync and not shutil.which("rsync"):
+            pytest.skip("rsync is not installed")
+        hide = () if rsync else ("rsync",)
+        default = tmp_path / "checkout" / "default"
+        (default / ".vim" / "plugin").mkdir(parents=True)
+        (default / ".vim" / "plugin" / "a.vim").write_text("let a = 1")
+        (default / ".vim" / "plugin" / "b.vim").write_text("let b = 1")
+        (default / ".vimrc").write_text("set nocompatible")
+        (default / ".bashrc").write_text("set -o vi")
+        home = tmp_path / "home"
+
+        result = shell_setup([], "install", hide=hide)
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert "Dotfiles: 3 entries updated, 0 already up to date" in result.stdout
+        assert (home / ".vim" / "plugin" / "b.vim").read_text() == "let b = 1"
+
+        result = shell_setup([], "install", hide=hide)
+        assert "Dotfiles: 0 entries updated, 3 already up to date" in result.stdout
+
+        (default / ".vim" / "plugin" / "b.vim").unlink()
+        (default / ".vimrc").write_text("set number")
+        result = shell_setup([], "install", "--no-backup", hide=hide)
+        assert "Dotfiles: 2 entries updated, 1 already up to date" in result.stdout
+        assert not (home / ".vim" / "plugin" / "b.vim").exists()
+        assert (home / ".vim" / "plugin" / "a.vim").exists()
+        assert (home / ".vimrc").read_text() == "set number"
+
+    @pytest.mark.parametrize("rsync", [True, False], ids=["rsync", "no-rsync"])
+    def test_shell_sync_type_changes(self, shell_setup, tmp_path, rsync):
+        """Test that shell installs replace entries whose type changed, without following links."""
+        if rsync and not shutil.which("rsync"):
+            pytest.skip("rsync is not installed")
+        hide = () if rsync else ("rsync",)
+        default = tmp_path / "checkout" / "default"
+        for name in (".dir_over_file", ".dir_over_link"):
+            (default / name).mkdir()
+            (default / name / "inner").write_text("inner")
+        (default / ".file_over_dir").write_text("file")
+        (default / ".file_over_link").write_text("file")
+        home = tmp_path / "home"
+        (home / ".dir_over_file").write_text("was a file")
+        (home / ".file_over_dir").mkdir()
+        (home / ".file_over_dir" / "old").write_text("old")
+        outside = tmp_path / "outside"
+        (outside / "linked_dir").mkdir(parents=True)
+        (outside / "linked_file").write_text("keep me")
+        (home / ".dir_over_link").symlink_to(outside / "linked_dir")
+        (home / ".file_over_link").symlink_to(outside / "linked_file")
+
+        result = shell_setup([], "install", hide=hide)
+
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert "Dotfiles: 4 entries updated, 0 already up to date" in result.stdout
+        for name in (".dir_over_file", ".dir_over_link"):
+            assert not (home / name).is_symlink()
+            assert (home / name / "inner").read_text() == "inner"
+        for name in (".file_over_dir", ".file_over_link"):
+            assert not (home / name).is_symlink()
+            assert (home / name).read_text() == "file"
+        assert list((outside / "linked_dir").iterdir()) == []
+        assert (outside / "linked_file").read_text() == "keep me"
+        assert (home / ".dotfiles_backup" / "snapshots").is_dir()
+
+
+class TestCopyPool:
+    """Test the parallel copy pool in the generated setup.py."""
+
+    def test_progress_reported_in_order(self, generated_setup):
+        """Test that progress follows submission order, not completion order."""
+        import time
+
+        seen = []
+        pool = generated_setup.CopyPool(workers=4)
+        results = pool.run(
+            lambda n: time.sleep(0.01 * (5 - n)) or n,
+            list(range(5)),
+            progress=lambda done, total, label: seen.append((done, total, label)),
+        )
+
+        assert results == [0, 1, 2, 3, 4]
+        assert seen == [(i + 1, 5, str(i)) for i in range(5)]
+
+    def test_errors_aggregated(self, generated_setup):
+        """Test that all failures are collected after every job has run."""
+        import shutil
+
+        done = []
+
+        def job(n):
+            if n % 2:
+                raise OSError(f"boom {n}")
+            done.append(n)
+
+        with pytest.raises(shutil.Error) as excinfo:
+            generated_setup.CopyPool(workers=3).run(job, list(range(6)))
+
+        assert sorted(done) == [0, 2, 4]
+        assert excinfo.value.args[0] == [("1", "boom 1"), ("3", "boom 3"), ("5", "boom 5")]
+
+    def test_sync_with_parallel_pool(self, generated_setup, tmp_path):
+        """Test that a multi-worker pool copies every file."""
+        src = tmp_path / "src"
+        for i in range(20):
+            (src / f"d{i % 3}").mkdir(parents=True, exist_ok=True)
+            (src / f"d{i % 3}" / f"f{i}.txt").write_text(str(i))
+        dst = tmp_path / "dst"
+
+        sync = generated_setup.SyncEngine(pool=generated_setup.CopyPool(workers=4))
+        sync.apply(sync.plan(src, dst))
+
+        assert sync.stats["copied"] == 20
+        assert (dst / "d1" / "f1.txt").read_text() == "1"
+
+
+class TestBackupStore:
+    """Test deduplicated backup snapshots in the generated setup.py and shell.sh."""
+
+    def test_unchanged_content_is_hardlinked(self, generated_setup, tmp_path):
+        """Test that a second snapshot links instead of copying."""
+        src = tmp_path / "dotdir"
+        src.mkdir()
+        (src / "big.txt").write_text("x" * 1000)
+        store = generated_setup.BackupStore(tmp_path / "store")
+
+        first = store.snapshots_dir / "20240101_000000"
+        second = store.snapshots_dir / "20240102_000000"
+        store.add(src, first / "dotdir")
+        store.add(src, second / "dotdir")
+
+        assert store.stats["stored"] == 1
+        assert store.stats["linked"] == 1
+        a, b = first / "dotdir" / "big.txt", second / "dotdir" / "big.txt"
+        assert a.read_text() == b.read_text()
+        assert a.stat().st_ino == b.stat().st_ino
+
+    def test_digest_index_reused(self, generated_setup, tmp_path):
+        """Test that unchanged files are not rehashed."""
+        src = tmp_path / "file.txt"
+        src.write_text("content")
+        store = generated_setup.BackupStore(tmp_path / "store")
+        store.add(src, tmp_path / "store" / "snapshots" / "s1" / "file.txt")
+        store.save_index()
+
+        store = generated_setup.BackupStore(tmp_path / "store")
+        with mock.patch.object(generated_setup.SyncEngine, "file_digest") as digest:
+            store.add(src, tmp_path / "store" / "snapshots" / "s2" / "file.txt")
+        digest.assert_not_called()
+
+    def test_concurrent_store_counts_once(self, generated_setup, tmp_path):
+        """Test that workers storing the same content count it as stored once."""
+        files = []
+        for n in range(4):
+            path = tmp_path / f"copy{n}.txt"
+            path.write_text("same content")
+            files.append(path)
+        store = generated_setup.BackupStore(tmp_path / "store")
+        barrier = threading.Barrier(len(files))
+        clone_file = store.clone_file
+
+        def racing_clone(src, dst):
+            # Every worker has missed the object before any of them stores it
+            barrier.wait(timeout=5)
+            clone_file(src, dst)
+
+        with mock.patch.object(store, "clone_file", racing_clone):
+            threads = [
+                threading.Thread(target=store.store_object, args=(path, path.stat()))
+                for path in files
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert store.stats["stored"] == 1
+        assert store.stats["linked"] == 3
+        assert store.stats["bytes_stored"] == len("same content")
+        assert len(store.load_index()) == 4
+        assert len(list(store.objects_dir.glob("*/*"))) == 1
+
+    def test_gc_applies_retention(self, generated_setup, tmp_path):
+        """Test that old snapshots and their unique objects are pruned."""
+        store = generated_setup.BackupStore(tmp_path / "store", keep=2)
+        src = tmp_path / "file.txt"
+        for day in range(1, 4):
+            src.write_text(f"version {day}")
+            store.add(src, store.snapshots_dir / f"2024010{day}_000000" / "file.txt")
+
+        store.gc()
+
+        remaining = sorted(p.name for p in store.snapshots_dir.iterdir())
+        assert remaining == ["20240102_000000", "20240103_000000"]
+        assert store.stats["pruned_snapshots"] == 1
+        assert store.stats["pruned_objects"] == 1
+        assert len(list(store.objects_dir.glob("*/*"))) == 2
+
+    @pytest.mark.parametrize("rsync", [True, False], ids=["rsync", "no-rsync"])
+    def test_shell_snapshots_hardlinked_and_pruned(self, shell_setup, tmp_path, rsync):
+        """Test that shell snapshots hardlink unchanged files and keep only --backup-keep of them."""
+        if rsync and not shutil.which("rsync"):
+            pytest.skip("rsync is not installed")
+        hide = () if rsync else ("rsync",)
+        default = tmp_path / "checkout" / "default"
+        (default / ".vim").mkdir()
+        (default / ".vim" / "same.vim").write_text("unchanged")
+        (default / ".vim" / "edit.vim").write_text("version 0")
+        snapshots = tmp_path / "home" / ".dotfiles_backup" / "snapshots"
+        for day in range(1, 4):
+            (snapshots / f"2020010{day}_000000").mkdir(parents=True)
+
+        # Each install after the first backs up the .vim it replaces
+        shell_setup([], "install", hide=hide)
+        for version in (1, 2):
+            (default / ".vim" / "edit.vim").write_text(f"version {version}")
+            result = shell_setup([], "install", "--backup-keep", "2", hide=hide)
+            assert result.returncode == 0, result.stdout + result.stderr
+            # Snapshot names have a resolution of one second
+            max(snapshots.iterdir()).rename(snapshots / f"2021010{version}_000000")
+
+        assert sorted(path.name for path in snapshots.iterdir()) == ["20210101_000000", "20210102_000000"]
+        first, second = (snapshots / name / ".vim" for name in ("20210101_000000", "20210102_000000"))
+        assert (first / "same.vim").stat().st_ino == (second / "same.vim").stat().st_ino
+        assert (second / "same.vim").stat().st_nlink > 1
+        assert (first / "edit.vim").stat().st_ino != (second / "edit.vim").stat().st_ino
+        assert "Pruned" in result.stdout
+
+
+class TestLinkMode:
+    """Test symlink install mode in the generated setup.py and shell.sh."""
+
+    def test_link_install_is_idempotent(self, dotfiles_env):
+        """Test that entries are linked once and then left alone."""
+        module, checkout, home = dotfiles_env
+        executor = module.Executor()
+
+        executor.exec_file_set("defaults", "install", link=True)
+        assert (home / ".vimrc").resolve() == (checkout / ".vimrc").resolve()
+        assert executor.link_stats["linked"] == 2
+
+        executor.exec_file_set("defaults", "install", link=True)
+        assert executor.link_stats["linked"] == 2
+        assert executor.link_stats["current"] == 2
+
+    def test_link_conflict_backed_up(self, dotfiles_env):
+        """Test that an existing file is backed up before being replaced."""
+        module, checkout, home = dotfiles_env
+        (home / ".vimrc").write_text("user settings")
+        executor = module.Executor()
+
+        executor.exec_file_set("defaults", "install", link=True)
+
+        assert (home / ".vimrc").is_symlink()
+        assert (module.PATHS["backup_dir"] / ".vimrc").read_text() == "user settings"
+
+    def test_link_conflict_skipped_without_backup(self, dotfiles_env):
+        """Test that conflicts are not overwritten when backup is disabled."""
+        module, checkout, home = dotfiles_env
+        (home / ".vimrc").write_text("user settings")
+        executor = module.Executor()
+
+        executor.exec_file_set("defaults", "install", link=True, backup=False)
+
+        assert not (home / ".vimrc").is_symlink()
+        assert executor.link_stats["conflicts"] == 1
+
+    def test_uninstall_removes_only_our_links(self, dotfiles_env, tmp_path):
+        """Test that uninstall leaves links into other trees alone."""
+        module, checkout, home = dotfiles_env
+        executor = module.Executor()
+        executor.exec_file_set("defaults", "install", link=True)
+        (home / ".vimrc").unlink()
+        other = tmp_path / "other_vimrc"
+        other.write_text("elsewhere")
+        (home / ".vimrc").symlink_to(other)
+
+        executor.exec_file_set("defaults", "uninstall", link=True)
+
+        assert not (home / ".vim").exists()
+        assert (home / ".vimrc").is_symlink()
+        assert (checkout / ".vim").is_dir()
+
+    @pytest.fixture
+    def shell_link_env(self, shell_setup, tmp_path):
+        """A scratch checkout with .vim and .vimrc defaults, and its home."""
+        default = tmp_path / "checkout" / "default"
+        (default / ".vim").mkdir()
+        (default / ".vimrc").write_text("set nocompatible")
+        return shell_setup, default, tmp_path / "home"
+
+    def test_shell_link_install(self, shell_link_env):
+        """Test that shell.sh links entries once, backing up a conflicting file."""
+        run, default, home = shell_link_env
+        (home / ".vimrc").write_text("user settings")
+
+        result = run([], "install", "--link")
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert "Dotfiles: 2 linked, 0 already linked, 0 conflicts skipped" in result.stdout
+        assert (home / ".vimrc").resolve() == (default / ".vimrc").resolve()
+        backups = list((home / ".dotfiles_backup" / "snapshots").glob("*/.vimrc"))
+        assert [path.read_text() for path in backups] == ["user settings"]
+
+        result = run([], "install", "--link")
+        assert "Dotfiles: 0 linked, 2 already linked, 0 conflicts skipped" in result.stdout
+
+    def test_shell_link_conflict_skipped_without_backup(self, shell_link_env):
+        """Test that shell.sh --no-backup leaves a conflicting file in place."""
+        run, default, home = shell_link_env
+        (home / ".vimrc").write_text("user settings")
+
+        result = run([], "install", "--link", "--no-backup")
+
+        assert "Dotfiles: 1 linked, 0 already linked, 1 conflicts skipped" in result.stdout
+        assert not (home / ".vimrc").is_symlink()
+        assert (home / ".vimrc").read_text() == "user settings"
+        assert not (home / ".dotfiles_backup").exists()
+
+    def test_shell_uninstall_removes_only_our_links(self, shell_link_env, tmp_path):
+        """Test that shell.sh uninstall leaves links into other trees and regular files alone."""
+        run, default, home = shell_link_env
+        (default / ".bashrc").write_text("set -o vi")
+        run([], "install", "--link")
+        (home / ".bashrc").unlink()
+        (home / ".bashrc").write_text("local edits")
+        (home / ".vimrc").unlink()
+        other = tmp_path / "other_vimrc"
+        other.write_text("elsewhere")
+        (home / ".vimrc").symlink_to(other)
+
+        result = run([], "uninstall", "--link")
+
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert not (home / ".vim").exists()
+        assert (home / ".vimrc").is_symlink()
+        assert "does not link into" in result.stdout
+        assert (home / ".bashrc").read_text() == "local edits"
+        assert (default / ".vim").is_dir()
+        assert other.read_text() == "elsewhere"
+
+
+class TestInstallManifest:
+    """Test manifest-driven uninstall in the generated setup.py."""
+
+    def test_install_records_files_and_dirs(self, dotfiles_env):
+        """Test that install records every written file with its hash."""
+        module, _, home = dotfiles_env
+        module.run_workflow("install", module.Executor())
+
+        data = json.loads(module.PATHS["manifest"].read_text())
+        vimrc = data["files"][str(home / ".vimrc")]
+        assert vimrc["sha256"] == module.SyncEngine.file_digest(home / ".vimrc")
+        assert str(home / ".vim" / "colors" / "dark.vim") in data["files"]
+        assert str(home / ".vim" / "colors") in data["dirs"]
+
+    def test_uninstall_keeps_modified_files(self, dotfiles_env):
+        """Test that user edits and user files survive uninstall unless forced."""
+        module, _, home = dotfiles_env
+        module.run_workflow("install", module.Executor())
+        (home / ".vimrc").write_text("my own settings")
+        (home / ".vim" / "notes.txt").write_text("mine")
+
+        module.run_workflow("uninstall", module.Executor())
+
+        assert (home / ".vimrc").read_text() == "my own settings"
+        assert (home / ".vim" / "notes.txt").exists()
+        assert not (home / ".vim" / "colors").exists()
+        data = json.loads(module.PATHS["manifest"].read_text())
+        assert list(data["files"]) == [str(home / ".vimrc")]
+
+        module.run_workflow("uninstall", module.Executor(force=True))
+
+        assert not (home / ".vimrc").exists()
+        assert not module.PATHS["manifest"].exists()
+
+    def test_preexisting_packages_left_installed(self, dotfiles_env, monkeypatch):
+        """Test that only packages install added are uninstalled."""
+        module, _, home = dotfiles_env
+        section = {"name": "py", "type": "python_packages", "install": ["black>=24", "Flask"]}
+        commands = []
+        executor = module.Executor()
+        monkeypatch.setattr(executor, "query_installed", lambda section_type: {"flask"})
+        monkeypatch.setattr(executor, "run_cmd",
+                            lambda cmd, *args, **kwargs: commands.append(cmd) or 0)
+
+        executor.exec_section(section, "install")
+        assert executor.manifest.data["packages"]["python_packages"] == {
+            "installed": ["black"], "present": ["flask"]}
+
+        executor.manifest.loaded = True
+        executor.exec_section(section, "uninstall")
+        assert commands[-1][-3:] == ["uninstall", "-y", "black"]
+        assert executor.manifest.is_empty()
+
+    def test_unlisted_packages_need_force(self, dotfiles_env, monkeypatch):
+        """Test that packages installed when list_cmd failed are only uninstalled with --force."""
+        module, _, home = dotfiles_env
+        spec = dict(module.OperationRegistry.PKG_MANAGERS["python_packages"])
+        spec["list_cmd"] = [sys.executable, "-c", "import sys; sys.exit('pip is broken')"]
+        monkeypatch.setitem(module.OperationRegistry.PKG_MANAGERS, "python_packages", spec)
+        section = {"name": "py", "type": "python_packages", "install": ["black>=24", "Flask"]}
+        commands = []
+
+        def executor(**kwargs):
+            executor = module.Executor(**kwargs)
+            monkeypatch.setattr(executor, "run_cmd",
+                                lambda cmd, *args, **kwargs: commands.append(cmd) or 0)
+            return executor
+
+        installer = executor()
+        installer.exec_section(section, "install")
+        assert installer.manifest.data["packages"]["python_packages"] == {
+            "installed": [], "present": [], "unknown": ["black", "flask"]}
+
+        installer.manifest.loaded = True
+        installer.exec_section(section, "uninstall")
+        assert not any("uninstall" in cmd for cmd in commands)
+        assert installer.manifest.unknown_packages("python_packages") == {"black", "flask"}
+
+        forced = executor(force=True)
+        forced.manifest, forced.manifest.loaded = installer.manifest, True
+        forced.exec_section(section, "uninstall")
+        assert commands[-1][-4:] == ["uninstall", "-y", "black", "Flask"]
+        assert forced.manifest.is_empty()
+
+
+class TestPrefetcher:
+    """Test the download-ahead pipeline in the generated setup.py."""
+
+    @pytest.fixture
+    def prefetcher(self, generated_setup, tmp_path, monkeypatch):
+        """A prefetcher whose python 'download' writes one file per package."""
+        download = (
+            "import pathlib, sys\n"
+            "dest = pathlib.Path(sys.argv[1])\n"
+            "for name in sys.argv[2:]:\n"
+            "    if name == 'missing':\n"
+            "        sys.exit('No matching distribution found for missing')\n"
+            "    (dest / (name + '.whl')).write_text(name * 10)\n"
+        )
+        spec = dict(generated_setup.OperationRegistry.PKG_MANAGERS["python_packages"])
+        spec["prefetch_cmd"] = lambda pkgs, dest: [sys.executable, "-c", download, str(dest)] + pkgs
+        monkeypatch.setitem(generated_setup.OperationRegistry.PKG_MANAGERS, "python_packages", spec)
+        prefetcher = generated_setup.Prefetcher(
+            generated_setup.OperationRegistry(), tmp_path / "prefetch", depth=2)
+        yield prefetcher
+        prefetcher.shutdown()
+
+    @staticmethod
+    def section(name, install, **extra):
+        return dict(name=name, type="python_packages", install=install, **extra)
+
+    def test_lookahead_stops_at_pre_install(self, prefetcher):
+        """Test that only sections up to the depth and before a pre_install hook are queued."""
+        sections = [
+            self.section("a", ["one"]),
+            self.section("b", ["two"]),
+            self.section("c", ["three"], pre_install=["add-apt-repository x"]),
+            self.section("d", ["four"]),
+        ]
+        prefetcher.schedule(sections, 0)
+        assert sorted(prefetcher.futures) == [1]
+
+        prefetcher.schedule(sections, 2)
+        assert sorted(prefetcher.futures) == [1, 3]
+        assert prefetcher.stats["scheduled"] == 2
+
+    def test_prefetch_fills_cache_and_counts_stats(self, prefetcher):
+        """Test that downloaded bytes are measured and the install uses the cache."""
+        sections = [self.section("a", []), self.section("b", ["alpha", "beta"])]
+        prefetcher.schedule(sections, 0)
+
+        assert prefetcher.wait(1) is None
+        assert prefetcher.fetched == {"b": prefetcher.dest / "python_packages" / "b"}
+        assert prefetcher.stats["bytes"] == 90
+        assert prefetcher.stats["ready"] + prefetcher.stats["waited"] == 1
+        assert (prefetcher.fetched["b"] / "alpha.whl").exists()
+
+    def test_failed_prefetch_is_reported_not_raised(self, prefetcher):
+        """Test that a failed download is counted and leaves the normal install in place."""
+        sections = [self.section("a", []), self.section("b", ["missing"])]
+        prefetcher.schedule(sections, 0)
+
+        assert "missing" in prefetcher.wait(1)
+        assert prefetcher.stats["failed"] == 1
+        assert "b" not in prefetcher.fetched
+
+    def test_apt_installs_from_its_own_directory(self, generated_setup, tmp_path):
+        """Test that apt prefetches per section and its install does not wait on the next one."""
+        executor = generated_setup.Executor()
+        executor.prefetcher = prefetcher = generated_setup.Prefetcher(
+            executor.registry, tmp_path / "prefetch")
+        try:
+            section = {"name": "audio", "type": "debian_packages", "install": ["jackd2"]}
+            spec = prefetcher.spec(section)
+            dest = prefetcher.directory(section)
+            assert f"Dir::Cache::archives={dest}" in spec["prefetch_cmd"](["jackd2"], dest)
+
+            prefetcher.fetched["audio"] = dest
+            cmd = executor.install_cmd("debian_packages", ["jackd2"], "audio")
+            assert cmd == ["sudo", "apt-get", "install", "-y", "-o", f"Dir::Cache::archives={dest}", "jackd2"]
+            assert executor.install_cmd("debian_packages", ["vim"], "core")[-2:] == ["-y", "vim"]
+
+            # Private directories need no lock; brew's shared cache does
+            assert not hasattr(prefetcher.lock("debian_packages"), "acquire")
+            assert prefetcher.lock("homebrew_packages") is prefetcher.lock("homebrew_packages")
+            assert hasattr(prefetcher.lock("homebrew_packages"), "acquire")
+        finally:
+            prefetcher.shutdown()
+
+
+class TestBundleBuilder:
+    """Test the self-contained zipapp bundle."""
+
+    @pytest.fixture
+    def bundle_dir(self, tmp_path, monkeypatch):
+        """Repository-like tree with defaults, two configs and the real templates."""
+        (tmp_path / "templates").symlink_to(pathlib.Path(__file__).parent.parent / "templates")
+        (tmp_path / "default" / ".vim").mkdir(parents=True)
+        (tmp_path / "default" / ".vimrc").write_text("syntax on\n")
+        (tmp_path / "default" / ".vim" / "copy.vim").write_text("syntax on\n")
+        (tmp_path / "config" / "dev" / "nvim").mkdir(parents=True)
+        (tmp_path / "config" / "dev" / "nvim" / "init.vim").write_text("set number\n")
+        (tmp_path / "config" / "other").mkdir()
+        (tmp_path / "config" / "other" / "unused").write_text("not referenced")
+        (tmp_path / "recipes").mkdir()
+        recipe = {
+            "name": "bundled",
+            "platform": "linux",
+            "os": "ubuntu",
+            "version": "22.04",
+            "release": "jammy",
+            "config": "dev",
+            "sections": [{"name": "core", "type": "debian_packages", "install": ["vim"]}],
+        }
+        (tmp_path / "recipes" / "bundled.yml").write_text(yaml.dump(recipe))
+        monkeypatch.chdir(tmp_path)
+        return tmp_path
+
+    def build(self, mock_options):
+        builder = BundleBuilder("recipes/bundled.yml", mock_options)
+        builder.build()
+        return builder.setup / builder.target
+
+    def test_bundle_contains_only_referenced_content(self, bundle_dir, mock_options):
+        """Test that the bundle holds referenced files, stored once per content."""
+        path = self.build(mock_options)
+
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read("bundle.json"))
+            objects = [n for n in archive.namelist() if n.startswith("objects/")]
+
+        assert path.read_bytes().startswith(b"#!/usr/bin/env python3\n")
+        assert sorted(manifest["files"]) == [
+            "config/dev/nvim/init.vim",
+            "default/.vim/copy.vim",
+            "default/.vimrc",
+            "setup.py",
+        ]
+        # .vimrc and .vim/copy.vim share one object
+        assert len(objects) == 3
+
+    def test_bundle_is_reproducible(self, bundle_dir, mock_options):
+        """Test that rebuilding an unchanged tree yields identical bytes."""
+        first = self.build(mock_options).read_bytes()
+        assert self.build(mock_options).read_bytes() == first
+
+    def test_bundle_extracts_payload(self, bundle_dir, mock_options, tmp_path):
+        """Test that the bootstrap restores content, modes and mtimes."""
+        path = self.build(mock_options)
+        dest = tmp_path / "extracted"
+
+        subprocess.run(
+            [sys.executable, str(path), "--extract-only", "--extract-to", str(dest)],
+            check=True, capture_output=True,
+        )
+
+        source = bundle_dir / "default" / ".vim" / "copy.vim"
+        extracted = dest / "default" / ".vim" / "copy.vim"
+        assert extracted.read_text() == "syntax on\n"
+        assert extracted.stat().st_mtime_ns == source.stat().st_mtime_ns
+        assert (dest / "setup.py").stat().st_mode & 0o111
+        assert not (dest / "config" / "other").exists()
+
+
+def add_tar_member(archive, name, data):
+    """Add an in-memory file to an open tarfile."""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    archive.addfile(info, io.BytesIO(data))
+
+
+def write_wheel(directory, name, version):
+    """Write a minimal pure-Python wheel into directory."""
+    with zipfile.ZipFile(directory / f"{name}-{version}-py3-none-any.whl", "w") as wheel:
+        wheel.writestr(f"{name}/__init__.py", "")
+        wheel.writestr(f"{name}-{version}.dist-info/METADATA",
+                       f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n")
+        wheel.writestr(f"{name}-{version}.dist-info/WHEEL",
+                       "Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n")
+        wheel.writestr(f"{name}-{version}.dist-info/RECORD", "")
+
+
+GEMSPEC = """--- !ruby/object:Gem::Specification
+name: {name}
+version: !ruby/object:Gem::Version
+  version: 1.0.0
+dependencies:{deps}
+"""
+
+GEM_DEPENDENCY = """- !ruby/object:Gem::Dependency
+  name: {name}
+  requirement: !ruby/object:Gem::Requirement
+    requirements:
+    - - ">="
+      - !ruby/object:Gem::Version
+        version: '0'
+  type: :{type}
+"""
+
+
+class TestOfflineBundleBuilder:
+    """Test offline bundles built from a local mirror directory."""
+
+    @pytest.fixture
+    def mirror(self, tmp_path):
+        """Local mirror with a Packages index, a wheel, gems and a crate."""
+        mirror = tmp_path / "mirror"
+        pool = mirror / "debian" / "pool"
+        pool.mkdir(parents=True)
+        (mirror / "debian" / "Packages").write_text(
+            "Package: vim\nVersion: 2:9.0\nDepends: vim-runtime (= 2:9.0), libc6 (>= 2.34) | musl\n"
+            "Filename: pool/vim_9.0_amd64.deb\n\n"
+            "Package: vim-runtime\nVersion: 2:9.0\nFilename: pool/vim-runtime_9.0_all.deb\n\n"
+            "Package: libc6\nVersion: 2.35\nPre-Depends: libgcc-s1\n"
+            "Filename: pool/libc6_2.35_amd64.deb\n\n"
+            "Package: libgcc-s1-impl\nProvides: libgcc-s1\nFilename: pool/libgcc_12_amd64.deb\n\n"
+            "Package: emacs\nFilename: pool/emacs_28_amd64.deb\n"
+        )
+        for deb in ("vim_9.0_amd64", "vim-runtime_9.0_all", "libc6_2.35_amd64",
+                    "libgcc_12_amd64", "emacs_28_amd64"):
+            (pool / f"{deb}.deb").write_bytes(deb.encode())
+
+        (mirror / "python").mkdir()
+        write_wheel(mirror / "python", "demo", "1.0")
+
+        (mirror / "ruby").mkdir()
+        gems = {"app": [("lib", "runtime"), ("rspec", "development")], "lib": []}
+        for name, deps in gems.items():
+            spec = GEMSPEC.format(
+                name=name,
+                deps="\n" + "".join(GEM_DEPENDENCY.format(name=d, type=t) for d, t in deps)
+                if deps else " []",
+            )
+            with tarfile.open(mirror / "ruby" / f"{name}-1.0.0.gem", "w") as gem:
+                add_tar_member(gem, "metadata.gz", gzip.compress(spec.encode()))
+        (mirror / "ruby" / "app-plugin-2.0.0.gem").write_bytes(b"unrelated")
+
+        (mirror / "rust").mkdir()
+        with tarfile.open(mirror / "rust" / "demo-0.1.0.crate", "w:gz") as crate:
+            add_tar_member(crate, "demo-0.1.0/Cargo.toml", b'[package]\nname = "demo"\n')
+        return mirror
+
+    @pytest.fixture
+    def offline_bundle(self, mirror, tmp_path, mock_options, monkeypatch):
+        """Build and extract an offline bundle for a recipe using every fetcher."""
+        recipe = {
+            "name": "airgap",
+            "platform": "linux",
+            "os": "ubuntu",
+            "version": "22.04",
+            "release": "jammy",
+            "sections": [
+                {"name": "core", "type": "debian_packages", "install": ["vim"]},
+                {"name": "py", "type": "python_packages", "install": ["demo"]},
+                {"name": "gems", "type": "ruby_packages", "install": ["app"]},
+                {"name": "crates", "type": "rust_packages", "install": ["demo"]},
+            ],
+        }
+        recipe_path = tmp_path / "airgap.yml"
+        recipe_path.write_text(yaml.dump(recipe))
+        mock_options.mirror = str(mirror)
+        monkeypatch.setattr(OfflineBundleBuilder, "vendor_crate", lambda self, crate_dir: False)
+
+        builder = OfflineBundleBuilder(str(recipe_path), mock_options)
+        builder.setup = tmp_path / "setup"
+        builder.build()
+
+        with tarfile.open(builder.setup / builder.target) as archive:
+            archive.extractall(tmp_path / "extracted")
+        return tmp_path / "extracted" / "offline"
+
+    def test_parse_packages_index(self):
+        """Test parsing of Debian control stanzas with continuation lines."""
+        index = OfflineBundleBuilder.parse_packages_index(
+            "Package: a\nDepends: b,\n c\nFilename: pool/a.deb\n\nPackage: b\n"
+        )
+        assert sorted(index) == ["a", "b"]
+        assert index["a"]["Depends"] == "b,\nc"
+
+    def test_debian_closure(self, offline_bundle):
+        """Test that dependencies, alternatives and provides are followed."""
+        closure = (offline_bundle / "debian" / "vim.closure").read_text().split()
+        assert closure == [
+            "libc6_2.35_amd64.deb",
+            "libgcc_12_amd64.deb",
+            "vim_9.0_amd64.deb",
+            "vim-runtime_9.0_all.deb",
+        ]
+        assert not (offline_bundle / "debian" / "emacs_28_amd64.deb").exists()
+
+    def test_python_ruby_and_rust_fetched(self, offline_bundle):
+        """Test wheels, runtime gem dependencies and crate sources."""
+        index = json.loads((offline_bundle / "index.json").read_text())
+
+        assert (offline_bundle / "python" / "demo-1.0-py3-none-any.whl").exists()
+        assert index["ruby"] == {"app": "app-1.0.0.gem", "lib": "lib-1.0.0.gem"}
+        assert not (offline_bundle / "ruby" / "app-plugin-2.0.0.gem").exists()
+        assert (offline_bundle / "rust" / "demo" / "Cargo.toml").exists()
+        assert index["rust"]["demo"]["version"] == "0.1.0"
+
+    def test_vendor_crate_uses_mirror_registry(self, mirror, tmp_path, mock_options, monkeypatch):
+        """Test that crates vendor from the mirror's local registry, or fail without one."""
+        mock_options.mirror = str(mirror)
+        recipe_path = tmp_path / "crates.yml"
+        recipe_path.write_text(yaml.dump(
+            {"name": "crates", "platform": "linux", "os": "ubuntu", "version": "22.04", "sections": []}
+        ))
+        builder = OfflineBundleBuilder(str(recipe_path), mock_options)
+        commands = []
+        monkeypatch.setattr(builder, "fetch_cmd", lambda cmd, cwd=None: commands.append(cmd) or "")
+
+        with pytest.raises(ValueError, match="not a cargo local registry"):
+            builder.vendor_crate(tmp_path)
+        assert commands == []
+
+        (mirror / "rust" / "index").mkdir()
+        assert builder.vendor_crate(tmp_path)
+        registry = (mirror / "rust").resolve()
+        assert f"source.start-vm-mirror.local-registry='{registry}'" in commands[0]
+        assert "--offline" in commands[0]
+
+        def fail(cmd, cwd=None):
+            raise subprocess.CalledProcessError(101, cmd)
+
+        monkeypatch.setattr(builder, "fetch_cmd", fail)
+        with pytest.raises(ValueError, match="Could not vendor"):
+            builder.vendor_crate(tmp_path)
+
+    def test_generated_setup_installs_offline(self, offline_bundle, generated_setup):
+        """Test that the generated script builds install commands from the bundle."""
+        executor = generated_setup.Executor(
+            offline=generated_setup.OfflineBundle(offline_bundle)
+        )
+
+        apt = executor.install_cmd("debian_packages", ["vim=2:9.0"])
+        pip = executor.install_cmd("python_packages", ["demo"])
+        cargo = executor.install_cmd("rust_packages", "demo")
+
+        assert "--no-download" in apt
+        assert apt[-1] == str(offline_bundle / "debian" / "vim-runtime_9.0_all.deb")
+        assert pip[-4:] == ["--no-index", "--find-links", str(offline_bundle / "python"), "demo"]
+        assert cargo[:4] == ["cargo", "install", "--offline", "--path"]
+        assert "gem install --local" in executor.install_cmd("ruby_packages", "app")
+
+
+class TestWheelhouseBuilder:
+    """Test wheelhouse builds and wheelhouse installs in the generated setup.py."""
+
+    @pytest.fixture
+    def wheelhouse_builder(self, tmp_path, mock_options):
+        """Builder for a recipe with two python sections, resolved from a local mirror."""
+        mirror = tmp_path / "mirror"
+        (mirror / "python").mkdir(parents=True)
+        write_wheel(mirror / "python", "demo", "1.0")
+        write_wheel(mirror / "python", "extra", "2.0")
+        recipe = {
+            "name": "wheels",
+            "platform": "linux",
+            "os": "ubuntu",
+            "version": "22.04",
+            "sections": [
+                {"name": "py", "type": "python_packages", "install": ["demo"]},
+                {"name": "core", "type": "debian_packages", "install": ["vim"]},
+                {"name": "more", "type": "python_packages", "install": ["extra==2.0"]},
+            ],
+        }
+        recipe_path = tmp_path / "wheels.yml"
+        recipe_path.write_text(yaml.dump(recipe))
+        mock_options.mirror = str(mirror)
+        mock_options.wheelhouse = str(tmp_path / "wheelhouse")
+        return WheelhouseBuilder(str(recipe_path), mock_options)
+
+    def test_build_collects_wheels_for_all_sections(self, wheelhouse_builder, caplog):
+        """Test that every python section is built and a rebuild reuses the wheels."""
+        wheelhouse_builder.build()
+        wheels = sorted(p.name for p in wheelhouse_builder.wheelhouse.glob("*.whl"))
+        assert wheels == ["demo-1.0-py3-none-any.whl", "extra-2.0-py3-none-any.whl"]
+
+        with caplog.at_level(logging.INFO):
+            wheelhouse_builder.build()
+        assert "2 wheels (0 new)" in caplog.text
+
+    def test_generated_setup_falls_back_to_index(self, generated_setup, tmp_path, monkeypatch):
+        """Test that a wheelhouse install is tried first and the index used if it fails."""
+        executor = generated_setup.Executor(wheelhouse=tmp_path)
+        calls = []
+
+        def run_cmd(cmd, description, shell=False, check=True):
+            calls.append(cmd)
+            return 1 if "--no-index" in cmd else 0
+
+        monkeypatch.setattr(executor, "run_cmd", run_cmd)
+        executor.install_packages("python_packages", ["demo"], "Installing py packages")
+
+        assert calls[0][-4:] == ["--no-index", "--find-links", str(tmp_path), "demo"]
+        assert "--no-index" not in calls[1]
+        assert executor.wheelhouse_stats == {"installed": 0, "fallbacks": 1}
+
+
+class TestRustCache:
+    """Test the prebuilt rust binary cache in the generated setup.py."""
+
+    @pytest.fixture
+    def rust_env(self, generated_setup, tmp_path, monkeypatch):
+        """Executor with a rust cache, a fake toolchain and a temporary cargo bin dir."""
+        module = generated_setup
+        monkeypatch.setitem(module.PATHS, "cargo_bin", tmp_path / "cargo" / "bin")
+        monkeypatch.setitem(module.PATHS, "manifest", tmp_path / "manifest.json")
+        monkeypatch.setattr(module.RustCache, "toolchain",
+                            lambda self: ("x86_64-unknown-linux-gnu", "1.80.0"))
+        monkeypatch.setattr(module.RustCache, "latest_version", staticmethod(lambda crate: "14.1.0"))
+        monkeypatch.setattr(module.RustCache, "installed",
+                            staticmethod(lambda crate: ("14.1.0", ["rg"])))
+        builds = []
+
+        def run_cmd(cmd, description, shell=False, check=True):
+            builds.append(cmd)
+            module.PATHS["cargo_bin"].mkdir(parents=True, exist_ok=True)
+            (module.PATHS["cargo_bin"] / "rg").write_text("binary")
+            return 0
+
+        def make_executor():
+            executor = module.Executor(rust_cache=module.RustCache(tmp_path / "cache"))
+            monkeypatch.setattr(executor, "run_cmd", run_cmd)
+            monkeypatch.setattr(executor, "query_installed", lambda section_type: set())
+            return executor
+
+        return module, make_executor, builds, tmp_path
+
+    def test_build_populates_cache_and_second_install_restores(self, rust_env):
+        """Test that a built crate is cached by version, target and rustc, then reused."""
+        module, make_executor, builds, tmp_path = rust_env
+        executor = make_executor()
+        executor.install_packages("rust_packages", "ripgrep", "Installing ripgrep")
+
+        entry = tmp_path / "cache" / "ripgrep" / "14.1.0" / "x86_64-unknown-linux-gnu" / "rustc-1.80.0"
+        assert (entry / "bin" / "rg").read_text() == "binary"
+        assert json.loads((entry / "entry.json").read_text())["binaries"] == ["rg"]
+        assert executor.rust_cache.stats == {"restored": 0, "built": 1, "stored": 1}
+
+        (module.PATHS["cargo_bin"] / "rg").unlink()
+        executor = make_executor()
+        executor.install_packages("rust_packages", "ripgrep", "Installing ripgrep")
+
+        assert len(builds) == 1
+        assert (module.PATHS["cargo_bin"] / "rg").read_text() == "binary"
+        assert executor.rust_cache.stats["restored"] == 1
+
+    def test_uninstall_removes_restored_binaries(self, rust_env, monkeypatch):
+        """Test that binaries restored from the cache are removed without cargo."""
+        module, make_executor, builds, tmp_path = rust_env
+        make_executor().install_packages("rust_packages", "ripgrep@14.1.0", "Installing")
+        (module.PATHS["cargo_bin"] / "rg").unlink()
+        monkeypatch.setattr(module, "SECTIONS",
+                            [{"name": "tools", "type": "rust_packages", "install": ["ripgrep@14.1.0"]}])
+        monkeypatch.setattr(module, "FILE_SETS", {"defaults": [], "configs": []})
+
+        module.run_workflow("install", make_executor())
+        assert (module.PATHS["cargo_bin"] / "rg").exists()
+
+        module.run_workflow("uninstall", make_executor())
+        assert not (module.PATHS["cargo_bin"] / "rg").exists()
+        assert len(builds) == 1
+        assert not module.PATHS["manifest"].exists()
+
+    def test_latest_version_by_exact_name(self, generated_setup, monkeypatch):
+        """Test that unpinned crates are resolved through the crates.io API, not search ranking."""
+        urls = []
+
+        def urlopen(request, timeout=None):
+            urls.append(request.full_url)
+            if request.full_url.endswith("/missing"):
+                raise OSError("404")
+            return io.BytesIO(json.dumps({"crate": {"name": "bat", "max_stable_version": "0.24.0"}}).encode())
+
+        monkeypatch.setattr(generated_setup.urllib.request, "urlopen", urlopen)
+        assert generated_setup.RustCache.latest_version("bat") == "0.24.0"
+        assert urls == ["https://crates.io/api/v1/crates/bat"]
+        assert generated_setup.RustCache.latest_version("missing") is None
+
+    def test_installed_parses_cargo_list(self, generated_setup, monkeypatch):
+        """Test reading a crate's version and binaries from cargo install --list."""
+        listing = "bat v0.24.0:\n    bat\nfd-find v9.0.0 (/src/fd):\n    fd\n    fdfind\nzoxide v0.9.4:\n    zoxide\n"
+        monkeypatch.setattr(generated_setup.subprocess, "run",
+                            lambda *args, **kwargs: subprocess.CompletedProcess(args, 0, listing, ""))
+
+        assert generated_setup.RustCache.installed("fd-find") == ("9.0.0", ["fd", "fdfind"])
+        assert generated_setup.RustCache.installed("ripgrep") is None
+
+
+class TestCargoBuildEnv:
+    """Test the shared cargo target dir and job tuning in the generated setup.py."""
+
+    @pytest.fixture
+    def cargo_env(self, generated_setup, tmp_path, monkeypatch):
+        """CargoBuildEnv with a fake tmpfs, 8 cores and a clean CARGO_* environment."""
+        module = generated_setup
+        monkeypatch.delenv("CARGO_TARGET_DIR", raising=False)
+        monkeypatch.delenv("CARGO_BUILD_JOBS", raising=False)
+        monkeypatch.setattr(module.CargoBuildEnv, "TMPFS", tmp_path / "shm")
+        monkeypatch.setitem(module.PATHS, "cargo_target", tmp_path / "disk")
+        monkeypatch.setattr(module.os, "cpu_count", lambda: 8)
+        (tmp_path / "shm").mkdir()
+        return module, tmp_path
+
+    def test_jobs_capped_by_memory_and_target_on_tmpfs(self, cargo_env, monkeypatch):
+        """Test that ample memory puts the target dir on tmpfs and limits jobs."""
+        module, tmp_path = cargo_env
+        gib = 1 << 30
+        monkeypatch.setattr(module.CargoBuildEnv, "mem_available", staticmethod(lambda: 8 * gib))
+
+        env = module.CargoBuildEnv().plan()
+        assert env["CARGO_TARGET_DIR"].startswith(str(tmp_path / "shm"))
+        # 8 GiB minus 2 GiB reserved for tmpfs, 1.5 GiB per job
+        assert env["CARGO_BUILD_JOBS"] == "4"
+
+        monkeypatch.setattr(module.CargoBuildEnv, "mem_available", staticmethod(lambda: 2 * gib))
+        env = module.CargoBuildEnv().plan()
+        assert env["CARGO_TARGET_DIR"].startswith(str(tmp_path / "disk"))
+        assert env["CARGO_BUILD_JOBS"] == "1"
+        assert module.CargoBuildEnv(jobs=6).plan()["CARGO_BUILD_JOBS"] == "6"
+
+    def test_apply_and_cleanup(self, cargo_env, monkeypatch):
+        """Test that the temporary target dir is removed and the environment restored."""
+        module, tmp_path = cargo_env
+        monkeypatch.setenv("CARGO_BUILD_JOBS", "2")
+        monkeypatch.setattr(module.CargoBuildEnv, "mem_available", staticmethod(lambda: None))
+        cargo = module.CargoBuildEnv()
+
+        env = cargo.apply()
+        target = pathlib.Path(env["CARGO_TARGET_DIR"])
+        assert "CARGO_BUILD_JOBS" not in env
+        assert module.os.environ["CARGO_TARGET_DIR"] == str(target)
+        assert target.is_dir()
+
+        cargo.cleanup()
+        assert not target.exists()
+        assert "CARGO_TARGET_DIR" not in module.os.environ
+        assert module.os.environ["CARGO_BUILD_JOBS"] == "2"
+
+    def test_explicit_target_dir_is_kept(self, cargo_env):
+        """Test that a target dir given on the command line survives cleanup."""
+        module, tmp_path = cargo_env
+        cargo = module.CargoBuildEnv(tmp_path / "kept")
+        cargo.apply()
+        (tmp_path / "kept" / "release").mkdir()
+        cargo.cleanup()
+        assert (tmp_path / "kept" / "release").is_dir()
+
+
+class TestCompilerCache:
+    """Test routing build_cache shell sections through ccache in the generated setup.py."""
+
+    def test_env_uses_launchers_for_cmake_and_cc_otherwise(self, generated_setup, tmp_path, monkeypatch):
+        """Test that cmake scripts get compiler launchers and other builds get a CC wrapper."""
+        module = generated_setup
+        monkeypatch.delenv("MAKEFLAGS", raising=False)
+        monkeypatch.setenv("CC", "clang")
+        monkeypatch.setattr(module.os, "cpu_count", lambda: 4)
+        cache = module.CompilerCache(tmp_path / "ccache")
+
+        env = cache.env("mkdir build && cd build && cmake .. && make")
+        assert env["CMAKE_CXX_COMPILER_LAUNCHER"] == "ccache"
+        assert "CC" not in env
+        assert env["MAKEFLAGS"] == "-j4"
+        assert env["CCACHE_DIR"] == str(tmp_path / "ccache")
+
+        monkeypatch.setenv("MAKEFLAGS", "-j2")
+        env = cache.env("./configure && make")
+        assert env["CC"] == "ccache clang"
+        assert "CMAKE_C_COMPILER_LAUNCHER" not in env
+        assert "MAKEFLAGS" not in env
+
+    def test_run_shell_preserves_env_across_sudo_and_reports_delta(self, generated_setup, tmp_path,
+                                                                     monkeypatch):
+        """Test that a cached build sees the settings under sudo and hits are counted."""
+        module = generated_setup
+        monkeypatch.delenv("MAKEFLAGS", raising=False)
+        cache = module.CompilerCache(tmp_path / "ccache")
+        monkeypatch.setattr(module.CompilerCache, "ccache", "/usr/bin/ccache")
+        counters = iter([{"hits": 10, "misses": 4}, {"hits": 13, "misses": 5}])
+        monkeypatch.setattr(cache, "counters", lambda: next(counters))
+        calls = []
+        executor = module.Executor(compiler_cache=cache)
+        monkeypatch.setattr(executor, "run_cmd",
+                            lambda cmd, description, shell=False, check=True, env=None:
+                            calls.append((cmd, env)))
+
+        executor.run_shell({"name": "orca", "type": "shell", "build_cache": True,
+                            "install": "make && sudo make install"})
+        script, env = calls[0]
+        assert script.startswith("sudo() { command sudo --preserve-env=CCACHE_DIR,")
+        assert script.endswith("make && sudo make install")
+        assert env["CC"].startswith("ccache ")
+        assert cache.delta() == {"hits": 3, "misses": 1}
+
+
+def git(*args, cwd=None):
+    """Run git quietly for building fixture repositories."""
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_repo(path, content, submodule=None):
+    """Create a bare repo with one commit, optionally adding a submodule URL."""
+    work = path.with_suffix(".work")
+    git("init", "-q", str(work))
+    (work / "README").write_text(content)
+    if submodule:
+        git("submodule", "add", "-q", submodule, "lib", cwd=work)
+    git("add", "-A", cwd=work)
+    git("commit", "-qm", content, cwd=work)
+    git("clone", "-q", "--bare", str(work), str(path))
+    return work
+
+
+@pytest.fixture
+def git_env(monkeypatch):
+    """Git identity and file:// submodules for fixture repositories."""
+    for key, value in {"GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@example.com",
+                       "GIT_COMMITTER_NAME": "t", "GIT_COMMITTER_EMAIL": "t@example.com",
+                       "GIT_CONFIG_COUNT": "1", "GIT_CONFIG_KEY_0": "protocol.file.allow",
+                       "GIT_CONFIG_VALUE_0": "always"}.items():
+        monkeypatch.setenv(key, value)
+
+
+class TestGitMirror:
+    """Test the git mirror cache behind clones in shell sections of the generated setup.py."""
+
+    @pytest.fixture
+    def repos(self, generated_setup, tmp_path, git_env):
+        """A superproject with one submodule, both as local bare repos."""
+        lib_url = (tmp_path / "lib.git").as_uri()
+        make_repo(tmp_path / "lib.git", "lib")
+        top = make_repo(tmp_path / "top.git", "top", submodule=lib_url)
+        return generated_setup.GitMirror(tmp_path / "mirrors"), top, tmp_path
+
+    def test_path_layout(self, generated_setup, tmp_path):
+        """Test that https, scp-style and file URLs map to host/path.git mirrors."""
+        mirror = generated_setup.GitMirror(tmp_path)
+        expected = tmp_path / "github.com" / "jackaudio" / "jack2.git"
+        assert mirror.path("https://github.com/jackaudio/jack2.git") == expected
+        assert mirror.path("https://github.com/jackaudio/jack2") == expected
+        assert mirror.path("git@github.com:jackaudio/jack2.git") == expected
+        assert mirror.path("file:///srv/../git/x.git/") == tmp_path / "srv" / "git" / "x.git"
+        assert generated_setup.GitMirror.resolve("https://h/a/top.git", "../lib.git") == "https://h/a/lib.git"
+
+    def test_recursive_clone_through_mirrors(self, repos):
+        """Test that superproject and submodules come from mirrors and end up standalone."""
+        mirror, top, tmp_path = repos
+        url = (tmp_path / "top.git").as_uri()
+        assert mirror.clone(["--recurse-submodules", url, "checkout"], cwd=tmp_path) == 0
+
+        checkout = tmp_path / "checkout"
+        assert (checkout / "lib" / "README").read_text() == "lib"
+        assert (mirror.path(url) / "HEAD").exists()
+        assert (mirror.path((tmp_path / "lib.git").as_uri()) / "HEAD").exists()
+        assert not list(checkout.glob(".git/**/objects/info/alternates"))
+        origin = subprocess.run(["git", "-C", str(checkout), "remote", "get-url", "origin"],
+                                capture_output=True, text=True).stdout.strip()
+        assert origin == url
+
+    def test_shallow_clone_bypasses_mirror(self, repos):
+        """Test that --depth clones go straight to the remote, without mirroring."""
+        mirror, top, tmp_path = repos
+        url = (tmp_path / "top.git").as_uri()
+        assert mirror.clone(["--depth", "1", url, "shallow"], cwd=tmp_path) == 0
+        assert mirror.clone(["--filter=blob:none", url, "partial"], cwd=tmp_path) == 0
+        assert (tmp_path / "shallow" / "README").read_text() == "top"
+        assert not mirror.root.exists()
+
+    def test_shell_script_clones_through_mirrors(self, repos, shell_setup):
+        """Test a multi-line shell section of the generated bash script with --git-mirror."""
+        mirror, top, tmp_path = repos
+        url = (tmp_path / "top.git").as_uri()
+        install = (f"git clone --recurse-submodules {url} top && git -C top rev-parse HEAD > head\n"
+                   f"git clone --depth 1 {url} shallow\n")
+        result = shell_setup([{"name": "clone", "type": "shell", "install": install}],
+                             "install", "--no-backup", "--git-mirror", str(tmp_path / "mirrors"))
+        assert result.returncode == 0, result.stdout + result.stderr
+
+        checkout = tmp_path / "checkout"
+        assert (checkout / "top" / "lib" / "README").read_text() == "lib"
+        assert len((checkout / "head").read_text().strip()) == 40
+        assert (tmp_path / "mirrors" / mirror.path(url).relative_to(mirror.root) / "HEAD").exists()
+        lib_url = (tmp_path / "lib.git").as_uri()
+        assert (tmp_path / "mirrors" / mirror.path(lib_url).relative_to(mirror.root) / "HEAD").exists()
+        assert not list(checkout.glob("top/.git/**/objects/info/alternates"))
+        shallow = subprocess.run(["git", "-C", str(checkout / "shallow"), "rev-parse",
+                                  "--is-shallow-repository"], capture_output=True, text=True)
+        assert shallow.stdout.strip() == "true"
+
+    def test_existing_mirror_is_fetched(self, repos):
+        """Test that a second clone picks up new upstream commits via the mirror."""
+        mirror, top, tmp_path = repos
+        url = (tmp_path / "top.git").as_uri()
+        assert mirror.clone([url, "first"], cwd=tmp_path) == 0
+        (top / "README").write_text("top v2")
+        git("commit", "-qam", "v2", cwd=top)
+        git("push", "-q", str(tmp_path / "top.git"), "HEAD", cwd=top)
+
+        assert mirror.clone([url], cwd=tmp_path) == 0
+        assert (tmp_path / "top" / "README").read_text() == "top v2"
+        log = subprocess.run(["git", "--git-dir", str(mirror.path(url)), "log", "--oneline"],
+                             capture_output=True, text=True).stdout
+        assert len(log.splitlines()) == 2
+
+
+class TestArtifactCache:
+    """Test packaging build_artifact shell sections in the generated setup.py."""
+
+    SCRIPT = "git clone https://github.com/jackaudio/jack2 --depth 1\ncd jack2\nsudo ./waf install\n"
+
+    def test_key_tracks_script_and_source_commit(self, generated_setup, tmp_path, monkeypatch):
+        """Test that the key changes with the build script or the cloned commit."""
+        module = generated_setup
+        cache = module.ArtifactCache(tmp_path)
+        commits = {"https://github.com/jackaudio/jack2": "a" * 40}
+        monkeypatch.setattr(module.ArtifactCache, "remote_commit",
+                            staticmethod(lambda url, ref=None: commits.get(url)))
+
+        continued = "git clone \\\n    https://github.com/jackaudio/jack2 -b v1.9.22 && cd jack2\n"
+        assert module.GitMirror.clones(continued) == [("https://github.com/jackaudio/jack2", "v1.9.22")]
+        key = cache.key(self.SCRIPT)
+        assert key == cache.key(self.SCRIPT)
+        assert key != cache.key(self.SCRIPT.replace("--depth 1", "--depth 1 -b v1.9.22"))
+        assert key != cache.key(self.SCRIPT + "sudo ldconfig\n")
+        commits["https://github.com/jackaudio/jack2"] = "b" * 40
+        assert key != cache.key(self.SCRIPT)
+        commits.clear()
+        assert cache.key(self.SCRIPT) is None
+
+    def test_build_is_packaged_then_reused(self, generated_setup, tmp_path, monkeypatch):
+        """Test that a staged install is stored as a tarball and installed on the next run."""
+        module = generated_setup
+        monkeypatch.setattr(module.ArtifactCache, "format", "tar.gz")
+        monkeypatch.setattr(module.ArtifactCache, "remote_commit",
+                            staticmethod(lambda url, ref=None: "c" * 40))
+        monkeypatch.setattr(module.subprocess, "run", lambda cmd, **kwargs: None)
+        section = {"name": "jack", "type": "shell", "build_artifact": True, "install": self.SCRIPT}
+        calls = []
+
+        def run_cmd(cmd, description, shell=False, check=True, env=None):
+            calls.append(cmd)
+            if shell:
+                lib = pathlib.Path(env["DESTDIR"]) / "usr" / "local" / "lib"
+                lib.mkdir(parents=True)
+                (lib / "libjack.so.0").write_text("jack")
+            return 0
+
+        def make_executor():
+            executor = module.Executor(artifacts=module.ArtifactCache(tmp_path / "artifacts"))
+            monkeypatch.setattr(executor, "run_cmd", run_cmd)
+            return executor
+
+        executor = make_executor()
+        executor.run_shell(section)
+        artifact = next((tmp_path / "artifacts" / "jack").glob("*.tar.gz"))
+        with tarfile.open(artifact) as archive:
+            assert archive.getnames() == ["usr/local/lib/libjack.so.0"]
+            assert archive.getmember("usr/local/lib/libjack.so.0").uid == 0
+        assert ["sudo", "tar", "-xzf", str(artifact), "-C", "/"] in calls
+        assert executor.artifacts.stats == {"installed": 0, "built": 1}
+
+        calls.clear()
+        executor = make_executor()
+        executor.run_shell(section)
+        assert not any(isinstance(cmd, str) for cmd in calls)
+        assert calls[0] == ["sudo", "tar", "-xzf", str(artifact), "-C", "/"]
+        assert executor.artifacts.stats == {"installed": 1, "built": 0}
+
+    def test_shell_build_is_packaged_then_reused(self, shell_setup, tmp_path, git_env):
+        """Test a build_artifact section of the generated bash script: stored, reused, rebuilt."""
+        work = make_repo(tmp_path / "jack.git", "jack")
+        url = (tmp_path / "jack.git").as_uri()
+        make = tmp_path / "stubs" / "make"
+        make.write_text('#!/bin/sh\necho "make $*" >> "$HOME/make.log"\n'
+                        'mkdir -p "$DESTDIR/usr/local/lib" && echo jack > "$DESTDIR/usr/local/lib/libjack.so.0"\n')
+        make.chmod(0o755)
+        section = {"name": "jack", "type": "shell", "build_artifact": True,
+                   "install": f"git clone \\\n    {url} jack\ncd jack && sudo make install\ncd .. && rm -rf jack\n"}
+
+        def install():
+            result = shell_setup([section], "install", "--no-backup", "--artifacts", str(tmp_path / "artifacts"))
+            assert result.returncode == 0, result.stdout + result.stderr
+            return result
+
+        assert "Stored" in install().stdout
+        assert "Using prebuilt jack" in install().stdout
+        artifact, = (tmp_path / "artifacts" / "jack").iterdir()
+        assert artifact.suffix in (".deb", ".gz")
+        assert (tmp_path / "home" / "make.log").read_text() == "make install\n"
+        deploys = (tmp_path / "sudo.log").read_text().count(str(artifact))
+        assert deploys == 2
+
+        # A new upstream commit changes the key: the section is built again
+        (work / "README").write_text("jack v2")
+        git("commit", "-qam", "v2", cwd=work)
+        git("push", "-q", str(tmp_path / "jack.git"), "HEAD", cwd=work)
+        install()
+        assert len(list((tmp_path / "artifacts" / "jack").iterdir())) == 2
+        assert (tmp_path / "home" / "make.log").read_text() == "make install\n" * 2
+
+
+class TestStepTimer:
+    """Test section, hook and package timings in the generated setup.py."""
+
+    @pytest.fixture
+    def timed_env(self, dotfiles_env, monkeypatch):
+        """Two sections with hooks and packages, and a run_cmd that fails on 'boom'."""
+        module, _, _ = dotfiles_env
+        monkeypatch.setitem(module.FILE_SETS, "defaults", [])
+        monkeypatch.setattr(module, "SECTIONS", [
+            {"name": "gems", "type": "ruby_packages", "install": ["rake", "rubocop"],
+             "pre_install": "true", "post_install": "true"},
+            {"name": "build", "type": "shell", "install": "boom"},
+        ])
+        executor = module.Executor()
+
+        def run_cmd(cmd, description, **kwargs):
+            if cmd == "boom":
+                raise subprocess.CalledProcessError(1, cmd)
+            return 0
+
+        monkeypatch.setattr(executor, "run_cmd", run_cmd)
+        monkeypatch.setattr(executor, "query_installed", lambda section_type: set())
+        return module, executor
+
+    def test_steps_recorded_and_written(self, timed_env):
+        """Test that every step is timed and a failed run still writes its timings."""
+        module, executor = timed_env
+        with pytest.raises(subprocess.CalledProcessError):
+            module.run_workflow("install", executor)
+
+        steps = [(step["kind"], step["section"], step["name"], step["status"])
+                 for step in executor.timer.steps]
+        assert steps == [
+            ("hook", "gems", "pre_install", "ok"),
+            ("package", "gems", "rake", "ok"),
+            ("package", "gems", "rubocop", "ok"),
+            ("hook", "gems", "post_install", "ok"),
+            ("section", "gems", "gems", "ok"),
+            ("script", "build", "build", "failed"),
+            ("section", "build", "build", "failed"),
+        ]
+        data = json.loads(executor.timer.path.read_text())
+        assert executor.timer.path.parent == module.PATHS["timings"]
+        assert (data["recipe"], data["action"], data["status"]) == ("generated", "install", "failed")
+        assert len(data["steps"]) == 7
+        assert all(step["end"] >= step["start"] for step in data["steps"])
+
+    def test_slowest_steps_table(self, generated_setup):
+        """Test that the table lists the slowest steps first and marks failures."""
+        timer = generated_setup.StepTimer()
+        timer.steps = [
+            {"kind": "package", "section": "core", "name": "vim", "seconds": 2.0, "status": "ok"},
+            {"kind": "section", "section": "core", "name": "core", "seconds": 30.5, "status": "failed"},
+            {"kind": "hook", "section": "core", "name": "pre_install", "seconds": 0.1, "status": "ok"},
+        ]
+        rows = timer.slowest(2)
+        assert len(rows) == 2
+        assert rows[0].split() == ["30.5s", "section", "core", "core", "(failed)"]
+        assert rows[1].split() == ["2.0s", "package", "core", "vim"]
+
+
+class TestSectionScheduler:
+    """Test duration-aware parallel section order in the generated setup.py."""
+
+    SECTIONS = [
+        {"name": "core", "type": "debian_packages", "install": ["git"]},
+        {"name": "py", "type": "python_packages", "install": ["black"]},
+        {"name": "crates", "type": "rust_packages", "install": ["ripgrep"]},
+        {"name": "audio", "type": "debian_packages", "install": ["jackd2"]},
+        {"name": "jack", "type": "shell", "install": "make"},
+        {"name": "extra", "type": "python_packages", "install": ["rich"], "pre_install": "true"},
+    ]
+
+    def test_dependencies_and_schedule(self, generated_setup):
+        """Test barriers, per-manager order and longest-path-first placement."""
+        durations = {"core": 30, "py": 20, "crates": 120, "audio": 15, "jack": 200}
+        scheduler = generated_setup.SectionScheduler(self.SECTIONS, durations)
+
+        assert scheduler.deps == [[], [0], [0], [0], [0, 1, 2, 3], [0, 1, 2, 3, 4]]
+        assert scheduler.durations[-1] == 30  # median of the recorded ones
+        plan = {self.SECTIONS[item["index"]]["name"]: item for item in scheduler.schedule(2)}
+        assert (plan["crates"]["worker"], plan["crates"]["start"]) == (1, 30)
+        assert plan["jack"]["start"] == 150
+        lines = scheduler.describe(2)
+        assert lines[-1] == "Expected makespan: 380.0s (sequential: 415.0s)"
+        assert lines[-2].endswith("extra (estimated)")
+
+    def test_durations_from_timings(self, generated_setup, tmp_path):
+        """Test medians of successful section runs of this recipe only."""
+        for run, (recipe, seconds) in enumerate([("generated", 10), ("generated", 30),
+                                                 ("generated", 20), ("generated-dev", 99)]):
+            steps = [{"kind": "section", "name": "core", "seconds": seconds, "status": "ok"},
+                     {"kind": "section", "name": "py", "seconds": 99, "status": "failed"}]
+            (tmp_path / f"{recipe}-{run}.json").write_text(
+                json.dumps({"recipe": recipe, "steps": steps}))
+
+        scheduler = generated_setup.SectionScheduler.from_timings(self.SECTIONS, tmp_path)
+        assert scheduler.runs == 3
+        assert scheduler.durations[:2] == [20, 20]
+        assert scheduler.estimated[:2] == [False, True]
+
+    def test_run_respects_dependencies(self, generated_setup):
+        """Test concurrent installs wait for their dependencies, and a failure stops new ones."""
+        scheduler = generated_setup.SectionScheduler(self.SECTIONS, {})
+        events, lock = [], threading.Lock()
+
+        def install(section):
+            with lock:
+                events.append(("start", section["name"]))
+            time.sleep(0.05)
+            with lock:
+                events.append(("end", section["name"]))
+
+        scheduler.run(3, install)
+        order = [name for kind, name in events if kind == "start"]
+        assert order[0] == "core" and order[-2:] == ["jack", "extra"]
+        assert events.index(("start", "jack")) > max(
+            events.index(("end", name)) for name in ("core", "py", "crates", "audio"))
+
+        events.clear()
+
+        def failing(section):
+            install(section)
+            if section["name"] == "py":
+                raise RuntimeError("pip failed")
+
+        with pytest.raises(RuntimeError, match="pip failed"):
+            scheduler.run(3, failing)
+        assert ("start", "jack") not in events
+
+    def test_pip_and_python_debs_depend(self, generated_setup):
+        """Test that pip and apt sections installing Python packages do not run together."""
+        sections = [
+            {"name": "py_modules", "type": "python_packages", "install": ["cython"]},
+            {"name": "py_audio1", "type": "debian_packages", "install": ["sox", "python3-pyaudio"]},
+            {"name": "audio_extras", "type": "debian_packages", "install": ["csound"]},
+            {"name": "gems", "type": "ruby_packages", "install": ["rake"]},
+        ]
+        scheduler = generated_setup.SectionScheduler(sections, {})
+        assert scheduler.deps == [[], [0], [1], [1, 2]]
+
+    def test_workers_share_executor_state(self, dotfiles_env, monkeypatch, capsys):
+        """Test that concurrent sections record every step and package, without prefetching."""
+        module, _, _ = dotfiles_env
+        monkeypatch.setitem(module.FILE_SETS, "defaults", [])
+        monkeypatch.setattr(module, "SECTIONS", [
+            {"name": "core", "type": "debian_packages", "install": ["git"]},
+            {"name": "py", "type": "python_packages", "install": [f"py{n}" for n in range(20)]},
+            {"name": "gems", "type": "ruby_packages", "install": [f"gem{n}" for n in range(20)]},
+            {"name": "crates", "type": "rust_packages", "install": [f"crate{n}" for n in range(20)]},
+        ])
+        executor = module.Executor()
+        monkeypatch.setattr(executor, "run_cmd", lambda cmd, description, **kwargs: time.sleep(0.001))
+        monkeypatch.setattr(executor, "query_installed", lambda section_type: set())
+
+        module.run_workflow("install", executor, workers=3, prefetch=2)
+
+        assert "--prefetch is ignored with --workers > 1" in capsys.readouterr().out
+        assert executor.prefetcher is None
+        packages = json.loads(module.PATHS["manifest"].read_text())["packages"]
+        assert {kind: len(record["installed"]) for kind, record in packages.items()} == {
+            "debian_packages": 1, "python_packages": 20, "ruby_packages": 20, "rust_packages": 20}
+        steps = executor.timer.steps
+        assert len([step for step in steps if step["kind"] == "section"]) == 4
+        assert len([step for step in steps if step["kind"] == "package"]) == 1 + 1 + 20 + 20
+
+
+class TestResourceGovernor:
+    """Test the resources: governor for shell sections in the generated setup.py."""
+
+    @pytest.fixture
+    def governor(self, generated_setup, monkeypatch):
+        """Governor on a 16-core host with 64 GiB free and a clean environment."""
+        module = generated_setup
+        for key in ("MAKEFLAGS", "CMAKE_BUILD_PARALLEL_LEVEL", "JOBS"):
+            monkeypatch.delenv(key, raising=False)
+        monkeypatch.setattr(module.os, "cpu_count", lambda: 16)
+        monkeypatch.setattr(module.CargoBuildEnv, "mem_available", staticmethod(lambda: 64 << 30))
+        return module, module.ResourceGovernor(scope=True)
+
+    def test_jobs_from_cores_hints_and_memory(self, governor, monkeypatch):
+        """Test that jobs are capped by max_jobs, the memory budget and free memory."""
+        module, gov = governor
+        assert gov.jobs({}) == 16
+        assert gov.jobs({"max_jobs": 6}) == 6
+        assert gov.jobs({"memory": "3G"}) == 3
+        assert gov.env({"memory": "2.5GiB"}) == {
+            "MAKEFLAGS": "-j2", "CMAKE_BUILD_PARALLEL_LEVEL": "2", "JOBS": "2"}
+
+        monkeypatch.setattr(module.CargoBuildEnv, "mem_available",
+                            staticmethod(lambda: 1536 << 20))
+        assert gov.jobs({"memory": "8G"}) == 1
+        monkeypatch.setenv("MAKEFLAGS", "-j12")
+        assert "MAKEFLAGS" not in gov.env({})
+
+    def test_nice_from_cpu_weight(self, governor):
+        """Test mapping cpu_weight onto nice levels, never below 0."""
+        module, gov = governor
+        assert gov.nice({}) == 10
+        assert gov.nice({"cpu_weight": 100}) == 0
+        assert gov.nice({"cpu_weight": 50}) == 3
+        assert gov.nice({"cpu_weight": 1000}) == 0
+        assert module.ResourceGovernor.parse_size("512M") == 512 << 20
+
+    def test_prefix_with_systemd_scope(self, governor, monkeypatch):
+        """Test the systemd-run, nice and ionice prefix for an unprivileged user."""
+        module, gov = governor
+        monkeypatch.setattr(module.ResourceGovernor, "systemd", staticmethod(lambda: True))
+        monkeypatch.setattr(module.shutil, "which", lambda name: f"/usr/bin/{name}")
+        monkeypatch.setattr(module.os, "geteuid", lambda: 1000)
+
+        prefix = gov.prefix({"cpu_weight": 50, "memory": "2G"})
+        assert prefix == ["systemd-run", "--scope", "--quiet", "--user",
+                          "-p", "CPUWeight=50", "-p", f"MemoryMax={2 << 30}", "--",
+                          "nice", "-n", "3", "ionice", "-c2", "-n7"]
+        assert module.ResourceGovernor().prefix({})[:1] == ["nice"]
+
+
+class TestBenchmarks:
+    """Test the synthetic recipe trees and regression check of benchmarks/."""
+
+    def test_synthetic_tree(self, mock_options, tmp_path):
+        """Test depth, fan-out and diamonds of a generated tree."""
+        from benchmarks.synthetic import generate_tree
+
+        recipes = generate_tree(tmp_path, sections=2, packages=3, depth=2, fanout=2, diamonds=1)
+        assert [path.stem for path in recipes] == ["l2-0", "l2-1", "l2-2", "l2-3", "diamond-0"]
+        assert len(list((tmp_path / "recipes").glob("*.yml"))) == 1 + 2 + 4 + 1
+
+        leaf = ShellBuilder(str(recipes[0]), mock_options)
+        assert leaf.recipe["config"] == "synthetic"
+        assert len(leaf.recipe["sections"]) == 3 * 2
+        diamond = ShellBuilder(str(recipes[-1]), mock_options)
+        assert yaml.safe_load(recipes[-1].read_text())["inherits"] == ["l2-0", "l2-2"]
+        # Its own, both branches' and the shared base's sections
+        assert len(diamond.recipe["sections"]) == 2 + 2 * 2 * 2 + 2
+        python = [s for s in leaf.recipe["sections"] if s["type"] == "python_packages"][0]
+        assert python["install"][0].endswith("==1.0.0")
+
+    def test_compare(self):
+        """Test that only slowdowns beyond both tolerances regress."""
+        from benchmarks.bench import compare
+
+        baseline = {"small": {"load": 10.0, "validator": 100.0, "resolve": 1.0}}
+        results = {"small": {"load": 12.5, "validator": 131.0, "resolve": 2.0, "lockfile": 3.0}}
+        rows = {row["metric"]: row for row in compare(results, baseline, tolerance=30, min_ms=2)}
+
+        assert [name for name, row in rows.items() if row["regressed"]] == ["validator"]
+        assert rows["resolve"]["change"] == 100.0  # +1 ms is under min_ms
+        assert rows["lockfile"]["baseline"] is None and not rows["lockfile"]["regressed"]
+
+    def test_run_scenario(self):
+        """Test one run of a tiny scenario reports every metric."""
+        from benchmarks.bench import BUILDERS, run_scenario
+
+        cwd = os.getcwd()
+        metrics = run_scenario({"sections": 1, "packages": 1, "depth": 1, "fanout": 1}, repeat=1)
+        assert os.getcwd() == cwd
+        expected = {"load", "resolve", "validate", "lockfile", "validator"}
+        for cls in BUILDERS:
+            expected |= {f"build.{cls.__name__}", f"render.{cls.__name__}"}
+        assert set(metrics) == expected
+        assert all(ms > 0 for ms in metrics.values())
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])